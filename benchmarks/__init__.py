@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of creating structures, for airspeed velocity (asv)."""
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the hit and miss paths of the conformer and PubChem caches."""
+
+from pathlib import Path
+import tempfile
+
+from from_smiles_step.cache import close_caches
+from from_smiles_step.conversion import convert
+
+from .common import fill_pubchem_cache, molecules, settings
+
+
+class ConformerCacheLookup:
+    """Converting a SMILES when the conformer cache has it, or does not."""
+
+    params = ["hit", "miss"]
+    param_names = ["outcome"]
+    # The setup is run before each sample, so with one call per sample every
+    # miss is a real miss.
+    number = 1
+    repeat = 20
+
+    def setup(self, outcome):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings = settings(
+            resolvers="rdkit", conformer_cache=str(Path(self.tmpdir.name) / "c.db")
+        )
+        if outcome == "hit":
+            convert(molecules["aspirin"], "SMILES", "rdkit", settings=self.settings)
+
+    def teardown(self, outcome):
+        close_caches()
+        self.tmpdir.cleanup()
+
+    def time_convert(self, outcome):
+        convert(molecules["aspirin"], "SMILES", "rdkit", settings=self.settings)
+
+
+class PubChemCacheLookup:
+    """Converting a name from the PubChem cache, or failing when offline."""
+
+    params = ["hit", "miss"]
+    param_names = ["outcome"]
+
+    def setup_cache(self):
+        # asv runs this in a temporary directory that it removes afterwards
+        return fill_pubchem_cache(Path.cwd())
+
+    def setup(self, pubchem_cache, outcome):
+        self.name = "aspirin" if outcome == "hit" else "not a molecule"
+        self.settings = settings(resolvers="PubChem name", pubchem_cache=pubchem_cache)
+
+    def teardown(self, pubchem_cache, outcome):
+        close_caches()
+
+    def time_convert(self, pubchem_cache, outcome):
+        try:
+            convert(self.name, "name", "rdkit", settings=self.settings)
+        except RuntimeError:
+            pass
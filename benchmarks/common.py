@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers for the benchmarks: the molecules, a step, and a filled PubChem cache.
+
+The benchmarks must not depend on the network, so the PubChem resolvers are
+run offline against a PubChem cache filled with SDF records made locally by
+RDKit. This measures the work of the step, not the speed of PubChem. The
+benchmarks of the requests themselves use the stand-in server for PubChem in
+:mod:`from_smiles_step.pubchem_standin`.
+"""
+
+from pathlib import Path
+import tempfile
+
+import molsystem
+from rdkit import Chem
+from rdkit.Chem import AllChem
+import seamm
+
+from from_smiles_step import FromSMILES
+from from_smiles_step.cache import PubChemCache
+from from_smiles_step.resolvers import expand_chain
+
+# Molecules for the notations that need PubChem, by name
+molecules = {
+    "aspirin": "CC(=O)Oc1ccccc1C(=O)O",
+    "caffeine": "Cn1cnc2c1c(=O)n(C)c(=O)n2C",
+}
+
+
+def dictionary_smiles():
+    """The SMILES in the dictionary of common names in this package.
+
+    Returns
+    -------
+    [str]
+    """
+    path = Path(__file__).parent.parent / "from_smiles_step" / "data" / "names.tsv"
+    result = []
+    with open(path) as fd:
+        for line in fd:
+            if line[0] != "#" and line.strip() != "":
+                result.append(line.rstrip("\n").split("\t")[1].strip())
+    return result
+
+
+def alkane(n_atoms):
+    """The SMILES of the linear alkane with about the given number of atoms.
+
+    Parameters
+    ----------
+    n_atoms : int
+        The number of atoms, including hydrogens.
+
+    Returns
+    -------
+    str
+    """
+    return "C" * max(1, round((n_atoms - 2) / 3))
+
+
+def sdf(smiles):
+    """A 3-D SDF record of a molecule, as PubChem would return it.
+
+    Parameters
+    ----------
+    smiles : str
+        The SMILES of the molecule.
+
+    Returns
+    -------
+    str
+    """
+    mol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+    AllChem.EmbedMolecule(mol, randomSeed=42)
+    return Chem.MolToMolBlock(mol) + "$$$$\n"
+
+
+def fill_pubchem_cache(directory):
+    """Fill a PubChem cache with the molecules, for running offline.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        The directory for the cache.
+
+    Returns
+    -------
+    str
+        The path to the cache.
+    """
+    path = Path(directory) / "pubchem.db"
+    with PubChemCache(path, ttl=365.0) as cache:
+        for name, smiles in molecules.items():
+            record = sdf(smiles)
+            cache.put("name", name, record)
+            cache.put("smiles", smiles, record)
+            cache.put("inchikey:InChI", inchikey(name), inchi(name) + "\n")
+    return str(path)
+
+
+def inchi(name):
+    """The InChI of one of the molecules."""
+    return Chem.MolToInchi(Chem.MolFromSmiles(molecules[name]))
+
+
+def inchikey(name):
+    """The InChIKey of one of the molecules."""
+    return Chem.MolToInchiKey(Chem.MolFromSmiles(molecules[name]))
+
+
+def settings(resolvers="default", **kwargs):
+    """The settings for the conversion, without caches unless given.
+
+    Parameters
+    ----------
+    resolvers : str = "default"
+        The chain of resolvers.
+    kwargs : any
+        Settings to change, using underscores for spaces in the names.
+
+    Returns
+    -------
+    dict(str, any)
+    """
+    result = {
+        "resolvers": expand_chain(resolvers),
+        "dictionary": None,
+        "conformer cache": None,
+        "conformer cache size": 100000,
+        "pubchem cache": None,
+        "pubchem cache ttl": 365.0,
+        "offline": True,
+        "failure cache": None,
+        "failure cache ttl": 7.0,
+        "time limit": None,
+    }
+    for key, value in kwargs.items():
+        result[key.replace("_", " ")] = value
+    return result
+
+
+class Step(object):
+    """A FromSMILES step in a minimal flowchart, with an in-memory database.
+
+    Parameters
+    ----------
+    options : dict(str, str) = None
+        The command-line options of the step, e.g. "pubchem_cache".
+    """
+
+    def __init__(self, options=None):
+        if seamm.flowchart_variables is None:
+            seamm.flowchart_variables = seamm.Variables()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        flowchart = seamm.Flowchart(directory=self.tmpdir.name)
+        self.system_db = molsystem.SystemDB(
+            filename=f"file:benchmark_{id(self)}?mode=memory&cache=shared"
+        )
+        seamm.flowchart_variables.set_variable("_system_db", self.system_db)
+
+        self.node = FromSMILES(flowchart=flowchart)
+        flowchart.add_node(self.node)
+        flowchart.add_edge(flowchart.get_node("1"), self.node)
+        flowchart.set_ids()
+        if options is not None:
+            self.node.options.update(options)
+
+    @property
+    def parameters(self):
+        """The control parameters of the step."""
+        return self.node.parameters
+
+    def run(self):
+        """Run the step."""
+        self.node.run()
+
+    def close(self):
+        """Close the database and remove the directory."""
+        self.system_db.close()
+        self.tmpdir.cleanup()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of each path through the step, by notation and flavor."""
+
+from pathlib import Path
+
+from .common import fill_pubchem_cache, inchi, inchikey, molecules, Step
+
+
+class Notations:
+    """Creating a single structure with the step, for each notation."""
+
+    # The input, notation, flavor and resolvers for each case
+    cases = {
+        "SMILES rdkit": (molecules["aspirin"], "SMILES", "rdkit", "rdkit"),
+        "SMILES openbabel": (molecules["aspirin"], "SMILES", "openbabel", "openbabel"),
+        "InChI": (inchi("aspirin"), "InChI", "rdkit", "InChI"),
+        "InChIKey": (inchikey("aspirin"), "InChIKey", "rdkit", "PubChem InChIKey"),
+        "name, dictionary": ("acetone", "name", "rdkit", "dictionary"),
+        "name, PubChem": ("aspirin", "name", "rdkit", "PubChem name"),
+        "perceive SMILES": (molecules["aspirin"], "perceive", "rdkit", "default"),
+        "perceive name": ("caffeine", "perceive", "rdkit", "offline"),
+    }
+    params = list(cases)
+    param_names = ["path"]
+
+    def setup_cache(self):
+        # asv runs this in a temporary directory that it removes afterwards
+        return fill_pubchem_cache(Path.cwd())
+
+    def setup(self, pubchem_cache, path):
+        text, notation, flavor, resolvers = self.cases[path]
+        self.step = Step(options={"pubchem_cache": pubchem_cache, "offline": "yes"})
+        P = self.step.parameters
+        P["smiles string"].value = text
+        P["notation"].value = notation
+        P["smiles flavor"].value = flavor
+        P["resolvers"].value = resolvers
+
+    def teardown(self, pubchem_cache, path):
+        self.step.close()
+
+    def time_run(self, pubchem_cache, path):
+        self.step.run()
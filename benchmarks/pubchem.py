@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of resolving names through the local stand-in for PubChem."""
+
+from from_smiles_step.conversion import convert_many
+from from_smiles_step.pubchem_standin import read_compounds, StandInPubChem
+
+from .common import settings
+
+
+class PubChemNames:
+    """Resolving a batch of names with PubChem answering after a latency."""
+
+    params = ([0.0, 0.05], [1, 4])
+    param_names = ["latency", "workers"]
+    timeout = 300
+
+    def setup(self, latency, workers):
+        compounds = read_compounds()
+        self.names = [compound.names[0] for compound in compounds]
+        self.standin = StandInPubChem(compounds, latency=latency)
+        self.standin.start()
+        self.settings = settings(
+            resolvers="PubChem name", offline=False, pubchem_url=self.standin.url
+        )
+
+    def teardown(self, latency, workers):
+        self.standin.stop()
+
+    def time_convert_many(self, latency, workers):
+        # The batch is small, but waiting on PubChem is worth the workers
+        for result, error in convert_many(
+            self.names,
+            "name",
+            "rdkit",
+            n_workers=workers,
+            settings=self.settings,
+            min_batch=1,
+        ):
+            pass
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the time to build a structure against the size of the molecule."""
+
+from from_smiles_step.conversion import convert
+
+from .common import alkane, settings
+
+
+class MoleculeSize:
+    """Building linear alkanes from SMILES, from 11 to about 3000 atoms."""
+
+    params = (["rdkit", "openbabel"], [11, 32, 101, 302, 1001, 3002])
+    param_names = ["flavor", "atoms"]
+    timeout = 600
+
+    def setup(self, flavor, atoms):
+        if flavor == "rdkit" and atoms > 200:
+            # The default embedding in RDKit fails for long chains, after
+            # minutes for the largest.
+            raise NotImplementedError("RDKit can't embed chains this long")
+        self.smiles = alkane(atoms)
+        self.settings = settings(resolvers=flavor)
+
+    def time_convert(self, flavor, atoms):
+        convert(self.smiles, "SMILES", flavor, settings=self.settings)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the throughput of batches with different numbers of workers."""
+
+from from_smiles_step.conversion import convert_many
+from from_smiles_step.cost import CostModel
+
+from .common import dictionary_smiles, Step
+
+
+class Batch:
+    """Converting a batch of small molecules in worker processes."""
+
+    params = ([1, 2, 4], [False, True])
+    param_names = ["workers", "longest first"]
+    timeout = 600
+
+    def setup(self, workers, longest_first):
+        if longest_first and workers == 1:
+            raise NotImplementedError("Only used with several workers")
+        # The dictionary is small, so repeat it for a few hundred structures
+        self.smiles = dictionary_smiles() * 4
+        self.settings = {"resolvers": ["rdkit"]}
+
+    def time_convert_many(self, workers, longest_first):
+        for result, error in convert_many(
+            self.smiles,
+            "SMILES",
+            "rdkit",
+            n_workers=workers,
+            settings=self.settings,
+            cost=CostModel() if longest_first else None,
+        ):
+            pass
+
+
+class StepBatch:
+    """Creating a batch of structures with the step, including the database."""
+
+    params = [1, 4]
+    param_names = ["workers"]
+    timeout = 600
+
+    def setup(self, workers):
+        self.step = Step(options={"deduplicate": "no"})
+        P = self.step.parameters
+        P["input type"].value = "one structure per line"
+        P["smiles string"].value = "\n".join(dictionary_smiles() * 4)
+        P["resolvers"].value = "rdkit"
+        P["structure handling"].value = "Create a new system and configuration"
+        P["number of processes"].value = workers
+
+    def teardown(self, workers):
+        self.step.close()
+
+    def time_run(self, workers):
+        self.step.run()
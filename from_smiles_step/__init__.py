@@ -5,16 +5,36 @@ from_smiles_step
 A step for generating a structure from a SMILES string.
 """
 
-# Bring up the classes so that they appear to be directly in
-# the package.
+import importlib
+
+# Bring up the classes so that they appear to be directly in the package. They
+# are imported when first used (PEP 562), so that e.g. a job, which only needs
+# FromSMILES, does not import the graphical TkFromSMILES, and listing the
+# plugins imports none of them.
+_lazy = {
+    "FromSMILESStep": "from_smiles_step.from_smiles_step",
+    "FromSMILES": "from_smiles_step.from_smiles",
+    "FromSMILESParameters": "from_smiles_step.from_smiles_parameters",
+    "TkFromSMILES": "from_smiles_step.tk_from_smiles",
+}
+
+__all__ = list(_lazy)
+
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
 
-from from_smiles_step.from_smiles_step import FromSMILESStep  # noqa: F401
-from from_smiles_step.from_smiles import FromSMILES  # noqa: F401
-from from_smiles_step.from_smiles_parameters import FromSMILESParameters  # noqa: F401
-from from_smiles_step.tk_from_smiles import TkFromSMILES  # noqa: F401
 
 # Handle versioneer
-from ._version import get_versions
+from ._version import get_versions  # noqa: E402
 
 __author__ = """Paul Saxe"""
 __email__ = "psaxe@molssi.org"
@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent caches of structures, in SQLite databases.
+
+The databases use write-ahead logging so that several SEAMM jobs on a node can
+read and write a cache at the same time, and a busy timeout so that writers
+wait for each other rather than failing.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import zlib
+
+from from_smiles_step.metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+# The open caches for each process and thread, keyed by the process id, thread
+# id, class, and path, so that a forked worker does not use the database
+# connection of its parent, nor a background thread that of the main thread.
+_caches = {}
+
+
+def get_cache(cls, path, **kwargs):
+    """The cache of the given type for this process and thread, opening it if needed.
+
+    Parameters
+    ----------
+    cls : class
+        The class of cache, e.g. ConformerCache.
+    path : str
+        The path to the cache.
+    kwargs : any
+        Further arguments for the class when opening the cache.
+
+    Returns
+    -------
+    SQLiteCache
+    """
+    key = (os.getpid(), threading.get_ident(), cls, str(path))
+    if key not in _caches:
+        _caches[key] = cls(path, **kwargs)
+    return _caches[key]
+
+
+def close_caches():
+    """Close the caches opened by this process and thread."""
+    owner = (os.getpid(), threading.get_ident())
+    for key in [key for key in _caches if key[0:2] == owner]:
+        _caches.pop(key).close()
+
+
+class SQLiteCache(object):
+    """Base class for the caches, handling the connection and statistics.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the database file, which is created if needed.
+    timeout : float = 30.0
+        How long to wait in seconds for another process to release the database.
+    """
+
+    schema = ""
+    tables = ()
+
+    def __init__(self, path, timeout=30.0):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def statistics(self):
+        """The hits and misses since this object was created.
+
+        Returns
+        -------
+        dict(str, int)
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        """Close the connection to the database."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        for table in self.tables:
+            self.db.execute(f"DELETE FROM {table}")
+
+
+class ConformerCache(SQLiteCache):
+    """A cache of 3-D structures keyed on the canonical form of the input.
+
+    Each entry holds the record of the structure (see
+    :mod:`from_smiles_step.records`) along with the notation and flavor that
+    were actually used to create it. Entries not used recently are evicted
+    when the cache exceeds its maximum number of entries. The time an entry
+    was last used is only updated if it is older than the ``touch_interval``,
+    so that most hits do not write to the database.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the database file, which is created if needed.
+    max_entries : int = 100000
+        The maximum number of structures to keep.
+    timeout : float = 30.0
+        How long to wait in seconds for another process to release the database.
+    touch_interval : float = 3600.0
+        The age in seconds of the time last used that is updated on a hit.
+    """
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS conformers (
+        key TEXT PRIMARY KEY,
+        canonical TEXT NOT NULL,
+        notation TEXT NOT NULL,
+        flavor TEXT NOT NULL,
+        record BLOB NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS conformers_last_used ON conformers (last_used);
+    """
+    tables = ("conformers",)
+
+    def __init__(self, path, max_entries=100000, timeout=30.0, touch_interval=3600.0):
+        super().__init__(path, timeout=timeout)
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._n_puts = 0
+
+    @staticmethod
+    def key(canonical, flavor, settings, versions):
+        """The key for a structure.
+
+        Parameters
+        ----------
+        canonical : str
+            The canonical form of the input, e.g. the canonical SMILES.
+        flavor : str
+            The flavor of SMILES requested.
+        settings : str
+            The settings used for the embedding.
+        versions : str
+            The versions of the toolkits used.
+
+        Returns
+        -------
+        str
+        """
+        text = json.dumps([canonical, flavor, settings, versions])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key):
+        """Get a structure from the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key from :meth:`key`
+
+        Returns
+        -------
+        (dict, str, str) or None
+            The record of the structure, and the notation and flavor used to
+            create it, or None if it is not in the cache.
+        """
+        row = self.db.execute(
+            "SELECT record, notation, flavor, last_used FROM conformers WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        now = time.time()
+        if now - row[3] >= self.touch_interval:
+            self.db.execute(
+                "UPDATE conformers SET last_used = ? WHERE key = ?", (now, key)
+            )
+        record = json.loads(zlib.decompress(row[0]))
+        return record, row[1], row[2]
+
+    def put(self, key, canonical, record, notation, flavor):
+        """Put a structure in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key from :meth:`key`
+        canonical : str
+            The canonical form of the input, for reference.
+        record : dict(str, any)
+            The record of the structure.
+        notation : str
+            The notation used to create the structure.
+        flavor : str
+            The flavor used to create the structure.
+        """
+        data = zlib.compress(json.dumps(record).encode())
+        self.db.execute(
+            "INSERT OR REPLACE INTO conformers"
+            " (key, canonical, notation, flavor, record, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, canonical, notation, flavor, data, time.time()),
+        )
+
+        # Checking the size is not free, so only do it occasionally
+        self._n_puts += 1
+        if self._n_puts % 100 == 1:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond the maximum number.
+
+        Returns
+        -------
+        int
+            The number of entries removed.
+        """
+        n = self.db.execute("SELECT COUNT(*) FROM conformers").fetchone()[0]
+        n_extra = n - self.max_entries
+        if n_extra <= 0:
+            return 0
+        self.db.execute(
+            "DELETE FROM conformers WHERE key IN"
+            " (SELECT key FROM conformers ORDER BY last_used LIMIT ?)",
+            (n_extra,),
+        )
+        logger.debug(f"Evicted {n_extra} structures from the conformer cache.")
+        return n_extra
+
+    def close(self):
+        """Trim the cache to size and close the connection to the database."""
+        if self.db is not None:
+            self.evict()
+        super().close()
+
+
+class PubChemCache(SQLiteCache):
+    """A cache of the responses from PubChem, keyed on the namespace and identifier.
+
+    The responses, e.g. the text of SDF files, are stored compressed. Entries
+    older than the time-to-live are treated as missing and replaced when next
+    fetched.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the database file, which is created if needed.
+    ttl : float = 30.0
+        The time-to-live of entries, in days.
+    timeout : float = 30.0
+        How long to wait in seconds for another process to release the database.
+    """
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS responses (
+        namespace TEXT NOT NULL,
+        identifier TEXT NOT NULL,
+        response BLOB NOT NULL,
+        created REAL NOT NULL,
+        PRIMARY KEY (namespace, identifier)
+    );
+    """
+    tables = ("responses",)
+
+    def __init__(self, path, ttl=30.0, timeout=30.0):
+        super().__init__(path, timeout=timeout)
+        self.ttl = ttl
+
+    def get(self, namespace, identifier):
+        """Get a response from the cache.
+
+        Parameters
+        ----------
+        namespace : str
+            The PubChem namespace, e.g. "name" or "smiles".
+        identifier : str
+            The identifier in the namespace.
+
+        Returns
+        -------
+        str or None
+            The response, or None if it is not in the cache or has expired.
+        """
+        row = self.db.execute(
+            "SELECT response, created FROM responses"
+            " WHERE namespace = ? AND identifier = ?",
+            (namespace, identifier),
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl * 86400:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return zlib.decompress(row[0]).decode()
+
+    def put(self, namespace, identifier, response):
+        """Put a response in the cache.
+
+        Parameters
+        ----------
+        namespace : str
+            The PubChem namespace, e.g. "name" or "smiles".
+        identifier : str
+            The identifier in the namespace.
+        response : str
+            The response from PubChem.
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses"
+            " (namespace, identifier, response, created) VALUES (?, ?, ?, ?)",
+            (namespace, identifier, zlib.compress(response.encode()), time.time()),
+        )
+
+    def purge(self):
+        """Remove the expired entries.
+
+        Returns
+        -------
+        int
+            The number of entries removed.
+        """
+        cursor = self.db.execute(
+            "DELETE FROM responses WHERE created < ?",
+            (time.time() - self.ttl * 86400,),
+        )
+        return cursor.rowcount
+
+
+class FailureCache(SQLiteCache):
+    """A cache of the ways that input strings failed to give a structure.
+
+    Each entry records that a resolver, e.g. "rdkit SMILES" or "PubChem name",
+    could not create a structure from a string. These are skipped the next
+    time, so a known bad input fails immediately, and one that only some
+    resolvers can handle goes straight to those. Entries expire after the
+    time-to-live, so e.g. new entries in PubChem are found, and are purged when
+    the cache is opened.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the database file, which is created if needed.
+    ttl : float = 7.0
+        The time-to-live of entries, in days.
+    timeout : float = 30.0
+        How long to wait in seconds for another process to release the database.
+    """
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS failures (
+        text TEXT NOT NULL,
+        resolver TEXT NOT NULL,
+        error TEXT NOT NULL,
+        created REAL NOT NULL,
+        PRIMARY KEY (text, resolver)
+    );
+    """
+    tables = ("failures",)
+
+    def __init__(self, path, ttl=7.0, timeout=30.0):
+        super().__init__(path, timeout=timeout)
+        self.ttl = ttl
+        self.purge()
+
+    def failed(self, text):
+        """The resolvers known to fail for the string.
+
+        Parameters
+        ----------
+        text : str
+            The input string.
+
+        Returns
+        -------
+        {str: str}
+            The error message for each resolver that failed.
+        """
+        rows = self.db.execute(
+            "SELECT resolver, error FROM failures WHERE text = ? AND created >= ?",
+            (text, time.time() - self.ttl * 86400),
+        ).fetchall()
+        if len(rows) == 0:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return dict(rows)
+
+    def add(self, text, resolver, error):
+        """Record that a resolver failed for the string.
+
+        Parameters
+        ----------
+        text : str
+            The input string.
+        resolver : str
+            The resolver that failed.
+        error : str
+            The error message.
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO failures (text, resolver, error, created)"
+            " VALUES (?, ?, ?, ?)",
+            (text, resolver, error, time.time()),
+        )
+
+    def purge(self):
+        """Remove the expired entries.
+
+        Returns
+        -------
+        int
+            The number of entries removed.
+        """
+        cursor = self.db.execute(
+            "DELETE FROM failures WHERE created < ?",
+            (time.time() - self.ttl * 86400,),
+        )
+        return cursor.rowcount
+
+
+class TimingHistory(SQLiteCache):
+    """A history of the time taken to create structures, for the cost model.
+
+    Each entry holds the features of an input string for the cost model (see
+    :mod:`from_smiles_step.cost`) and the measured time. Only the most recent
+    entries are kept.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the database file, which is created if needed.
+    max_entries : int = 20000
+        The maximum number of entries to keep.
+    timeout : float = 30.0
+        How long to wait in seconds for another process to release the database.
+    """
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS timings (
+        id INTEGER PRIMARY KEY,
+        features TEXT NOT NULL,
+        seconds REAL NOT NULL,
+        created REAL NOT NULL
+    );
+    """
+    tables = ("timings",)
+
+    def __init__(self, path, max_entries=20000, timeout=30.0):
+        super().__init__(path, timeout=timeout)
+        self.max_entries = max_entries
+
+    def add(self, samples):
+        """Add measured times to the history.
+
+        Parameters
+        ----------
+        samples : [([float], float)]
+            The features and measured time, in seconds, of each sample.
+        """
+        now = time.time()
+        self.db.execute("BEGIN")
+        self.db.executemany(
+            "INSERT INTO timings (features, seconds, created) VALUES (?, ?, ?)",
+            [(json.dumps(values), seconds, now) for values, seconds in samples],
+        )
+        self.db.execute(
+            "DELETE FROM timings WHERE id <= (SELECT MAX(id) FROM timings) - ?",
+            (self.max_entries,),
+        )
+        self.db.execute("COMMIT")
+
+    def samples(self):
+        """The samples in the history.
+
+        Returns
+        -------
+        [([float], float)]
+            The features and measured time, in seconds, of each sample.
+        """
+        return [
+            (json.loads(features), seconds)
+            for features, seconds in self.db.execute(
+                "SELECT features, seconds FROM timings"
+            )
+        ]
+
+
+class MetricsStore(SQLiteCache):
+    """The cumulative counts of the paths taken when creating structures.
+
+    The counts of each run (see :mod:`from_smiles_step.metrics`) are added to
+    the totals, which are shared by all the jobs using the same file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the database file, which is created if needed.
+    timeout : float = 30.0
+        How long to wait in seconds for another process to release the database.
+    """
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (name, labels)
+    );
+    """
+    tables = ("counters",)
+
+    def add(self, counters):
+        """Add counts to the totals.
+
+        Parameters
+        ----------
+        counters : from_smiles_step.metrics.Counters
+            The counts to add.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany(
+            "INSERT INTO counters (name, labels, value) VALUES (?, ?, ?)"
+            " ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+            [
+                (name, json.dumps(labels), value)
+                for (name, labels), value in counters.state().items()
+            ],
+        )
+        self.db.execute("COMMIT")
+
+    def totals(self):
+        """The cumulative counts.
+
+        Returns
+        -------
+        from_smiles_step.metrics.Counters
+        """
+        result = Counters()
+        result.merge(
+            {
+                (name, tuple(tuple(label) for label in json.loads(labels))): value
+                for name, labels, value in self.db.execute(
+                    "SELECT name, labels, value FROM counters"
+                )
+            }
+        )
+        return result
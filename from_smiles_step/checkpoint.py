@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""Checkpoints of the progress through an input file.
+
+When many structures are created from a file, the checkpoint records the last
+line whose structure, and all before it, are committed to the system database.
+A rerun of the same file into the same database can then skip straight to the
+next line. The checkpoint is only used if the input file has not changed, as
+judged by its size and modification time.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint(object):
+    """The checkpoint for an input file and database.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        The directory for checkpoint files.
+    input_path : str or pathlib.Path
+        The input file.
+    database : str
+        The filename of the system database.
+    """
+
+    def __init__(self, directory, input_path, database):
+        self.input_path = Path(input_path).expanduser().resolve()
+        self.database = str(database)
+
+        key = json.dumps([str(self.input_path), self.database])
+        name = hashlib.sha256(key.encode()).hexdigest()[0:32] + ".json"
+        self.path = Path(directory).expanduser() / name
+
+    def _stamp(self):
+        """The size and modification time of the input file."""
+        stat = self.input_path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    @property
+    def line(self):
+        """The last line of the input that is done, or 0 if none.
+
+        Returns
+        -------
+        int
+        """
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return 0
+        if (
+            data.get("input") != str(self.input_path)
+            or data.get("database") != self.database
+            or [data.get("size"), data.get("mtime")] != list(self._stamp())
+        ):
+            logger.info(f"Ignoring the checkpoint {self.path}, which is out of date.")
+            return 0
+        return data["line"]
+
+    def save(self, line):
+        """Record that the input up to and including a line is done.
+
+        Parameters
+        ----------
+        line : int
+            The line number.
+        """
+        size, mtime = self._stamp()
+        data = {
+            "input": str(self.input_path),
+            "database": self.database,
+            "size": size,
+            "mtime": mtime,
+            "line": line,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        """Remove the checkpoint, e.g. when the input is finished."""
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,952 @@
+# -*- coding: utf-8 -*-
+
+"""Converting line notations to 3-D structures, serially or in worker processes.
+
+The 3-D embedding is the expensive part of creating a structure, so for
+batches the conversion is done in a pool of processes, each converting into a
+scratch configuration in its own in-memory database. Only the plain record of
+the structure (see :mod:`from_smiles_step.records`) is sent back to be written
+into the system database.
+
+Before converting, the conformer cache (see
+:class:`from_smiles_step.cache.ConformerCache`) is checked for the structure,
+keyed on the canonical form of the input, the SMILES flavor, the embedding
+settings, and the versions of the toolkits.
+"""
+
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+
+import molsystem
+import molsystem.pubchem
+from openbabel import openbabel
+import rdkit
+from rdkit import Chem
+from rdkit.rdBase import BlockLogs
+import requests
+
+from from_smiles_step.cache import ConformerCache, FailureCache, get_cache
+from from_smiles_step.metrics import counters
+from from_smiles_step import pubchem
+from from_smiles_step.perception import cid_re, classify, looks_like_word
+from from_smiles_step.resolvers import expand_chain, resolver_chain
+from from_smiles_step.records import record_to_configuration, structure_record
+from from_smiles_step.retry import CircuitOpenError
+from from_smiles_step.timing import timers
+
+logger = logging.getLogger(__name__)
+
+# The scratch configuration for each process, keyed by the process id, so that
+# a forked worker does not use the database connection of its parent.
+_scratch = {}
+
+# The settings for the 3-D embedding, which are part of the key in the cache.
+EMBEDDING_SETTINGS = "reorient"
+
+_versions = None
+
+# The confidence needed to treat perceived SMILES or names as only that.
+CONFIDENCE = 0.9
+
+
+# The descriptions of the notations, for messages
+descriptions = {
+    "SMILES": "a SMILES",
+    "InChI": "an InChI",
+    "InChIKey": "an InChIKey",
+    "name": "a chemical name",
+    "CID": "a PubChem CID",
+    "SMILES or name": "a SMILES or name",
+}
+
+
+class KnownFailureError(RuntimeError):
+    """The input is known from the failure cache to fail with all the resolvers."""
+
+
+class StructureTimeoutError(RuntimeError):
+    """A resolver took longer than the time limit to create the structure."""
+
+
+class StructureProcessError(RuntimeError):
+    """The process running a resolver under a time limit died."""
+
+
+def is_transient(exception):
+    """Whether an error may go away if tried again, e.g. a network problem.
+
+    Timeouts are transient too, since they depend on the time limit and the
+    load on the computer, so they are not kept in the failure cache.
+
+    Parameters
+    ----------
+    exception : Exception
+        The error.
+
+    Returns
+    -------
+    bool
+    """
+    return isinstance(
+        exception,
+        (
+            molsystem.pubchem.PubChemUnavailableError,
+            pubchem.OfflineError,
+            requests.RequestException,
+            CircuitOpenError,
+            StructureTimeoutError,
+            StructureProcessError,
+        ),
+    )
+
+
+def _failure_cache(settings):
+    """The failure cache for the settings, or None."""
+    if settings is None or settings.get("failure cache") is None:
+        return None
+    return get_cache(
+        FailureCache, settings["failure cache"], ttl=settings["failure cache ttl"]
+    )
+
+
+def perceive(text):
+    """Perceive the line notation of a string.
+
+    Strings that are clearly SMILES or chemical names are given that
+    notation, so they are only tried with the matching resolvers. Ambiguous
+    ones are tried as both. CAS registry numbers are handled as names.
+
+    Parameters
+    ----------
+    text : str
+        The input string.
+
+    Returns
+    -------
+    str
+        "InChIKey", "InChI", "CID", "SMILES", "name", or "SMILES or name"
+    """
+    notation, confidence = classify(text)
+    if notation == "CAS":
+        return "name"
+    if notation in ("SMILES", "name") and confidence < CONFIDENCE:
+        return "SMILES or name"
+    return notation
+
+
+def canonical_form(text, notation):
+    """The canonical form of an input string, for use as a key.
+
+    This is cheap, with no 3-D embedding. Chemical names have no canonical
+    form here, since it requires a lookup in PubChem.
+
+    Parameters
+    ----------
+    text : str
+        The input string.
+    notation : str
+        The line notation of the string, which must already be perceived.
+
+    Returns
+    -------
+    str or None
+        The canonical form, prefixed by its notation, or None if there is none.
+    """
+    if notation == "InChIKey":
+        return "InChIKey:" + text.upper()
+    elif notation == "CID":
+        match = cid_re.match(text.strip())
+        return None if match is None else "CID:" + match.group(1)
+    elif notation == "InChI":
+        return text
+    elif notation in ("SMILES", "SMILES or name"):
+        block = BlockLogs()  # noqa: F841
+        mol = Chem.MolFromSmiles(text)
+        if mol is None:
+            return None
+        return "SMILES:" + Chem.MolToSmiles(mol)
+    return None
+
+
+def structure_keys(configuration):
+    """The keys of an existing structure, matching :func:`duplicate_key`.
+
+    The stereochemistry of the structure is perceived from its coordinates, so
+    it is fully specified, while an input string may leave it unspecified. Both
+    the canonical SMILES with stereochemistry and without it are given, so that
+    e.g. both "C/C=C/C" and "CC=CC" match the trans isomer.
+
+    Parameters
+    ----------
+    configuration : molsystem._Configuration
+        The configuration with the structure.
+
+    Returns
+    -------
+    set(str)
+        The canonical SMILES with and without stereochemistry, prefixed by
+        "SMILES:", or an empty set if the structure can't be handled by RDKit.
+    """
+    block = BlockLogs()  # noqa: F841
+    try:
+        mol = configuration.to_RDKMol()
+        Chem.AssignStereochemistryFrom3D(mol)
+        mol = Chem.RemoveHs(mol)
+        return {
+            "SMILES:" + Chem.MolToSmiles(mol),
+            "SMILES:" + Chem.MolToSmiles(mol, isomericSmiles=False),
+        }
+    except Exception:
+        return set()
+
+
+def toolkit_versions():
+    """The versions of the toolkits used to create structures.
+
+    Returns
+    -------
+    str
+    """
+    global _versions
+
+    if _versions is None:
+        _versions = (
+            f"molsystem {molsystem.__version__}; "
+            f"rdkit {rdkit.__version__}; "
+            f"openbabel {openbabel.OBReleaseVersion()}"
+        )
+    return _versions
+
+
+def create_structure(configuration, text, notation, flavor, settings=None):
+    """Create the structure for one input string in a configuration.
+
+    The resolvers in the chain given in the settings that handle the notation
+    are tried in turn, skipping any known from the failure cache to fail for
+    this string. If there is a time limit, each resolver is run in a child
+    process that is killed if it takes too long, and the next resolver tried.
+
+    Parameters
+    ----------
+    configuration : molsystem._Configuration
+        The configuration to put the structure in.
+    text : str
+        The input string: SMILES, InChI, InChIKey, CID, or name.
+    notation : str
+        The line notation, or "perceive" to determine it from the text.
+    flavor : str
+        The flavor of SMILES to use.
+    settings : dict(str, any) = None
+        The settings for the resolvers and caches, as described in
+        :func:`convert`.
+
+    Returns
+    -------
+    (str, str, bool)
+        The notation and flavor actually used, and whether the notation
+        was perceived.
+    """
+    if settings is None:
+        settings = {}
+
+    # Perceive the notation if requested
+    perceived = False
+    if notation == "perceive":
+        perceived = True
+        with timers("perception"):
+            notation = perceive(text)
+
+    if notation not in descriptions:
+        raise RuntimeError(f"Can not handle line notation '{notation}'")
+    if notation == "SMILES or name":
+        notations = ("SMILES", "name")
+    else:
+        notations = (notation,)
+
+    chain = resolver_chain(
+        tuple(settings.get("resolvers", expand_chain("default"))),
+        flavor,
+        settings.get("dictionary"),
+    )
+    resolvers = [r for r in chain if any(n in r.notations for n in notations)]
+    if notation == "SMILES or name" and looks_like_word(text):
+        # Try e.g. "Co" as a name before as SMILES
+        resolvers.sort(key=lambda r: "name" not in r.notations)
+    if len(resolvers) == 0:
+        raise RuntimeError(f"There are no resolvers in the chain for {notation}.")
+
+    # The resolvers already known to fail for this text
+    failures = _failure_cache(settings)
+    time_limit = settings.get("time limit")
+    known = {} if failures is None else failures.failed(text)
+
+    errors = []
+    n_known = 0
+    for resolver in resolvers:
+        if resolver.name in known:
+            errors.append(f"{resolver.name}: {known[resolver.name]} (cached)")
+            n_known += 1
+            counters.add(
+                "from_smiles_resolver_attempts_total",
+                resolver=resolver.name,
+                outcome="known failure",
+            )
+            continue
+        try:
+            with timers(resolver.name):
+                if time_limit is None:
+                    notation, flavor = resolver.resolve(
+                        configuration, text, settings=settings
+                    )
+                else:
+                    notation, flavor = resolve_with_time_limit(
+                        resolver, configuration, text, settings, time_limit
+                    )
+        except Exception as e:
+            logger.debug(f"{resolver.name} failed for '{text}': {e}")
+            errors.append(f"{resolver.name}: {e}")
+            if failures is not None and not is_transient(e):
+                failures.add(text, resolver.name, str(e))
+            error = e
+            counters.add(
+                "from_smiles_resolver_attempts_total",
+                resolver=resolver.name,
+                outcome=(
+                    "timeout" if isinstance(e, StructureTimeoutError) else "failure"
+                ),
+            )
+        else:
+            counters.add(
+                "from_smiles_resolver_attempts_total",
+                resolver=resolver.name,
+                outcome="success",
+            )
+            counters.add(
+                "from_smiles_failed_attempts_before_success_total",
+                failed=len(errors),
+            )
+            return notation, flavor, perceived
+
+    message = (
+        f"Can not create a structure from the string '{text}' as "
+        f"{descriptions[notation]}:\n    " + "\n    ".join(errors)
+    )
+    if len(errors) > n_known:
+        raise RuntimeError(message) from error
+    raise KnownFailureError(message)
+
+
+def _resolve_child(sender, resolver, text, settings):
+    """Create a structure in a child process, sending back the result.
+
+    The times and counts in the child are sent back with the result or error,
+    to be merged into those of the parent.
+
+    Parameters
+    ----------
+    sender : multiprocessing.connection.Connection
+        The connection for the result.
+    resolver : Resolver
+        The resolver.
+    text : str
+        The input string.
+    settings : dict(str, any)
+        The settings, as described in :func:`convert`.
+    """
+    # The child starts with a copy of the parent's times and counts
+    timers.clear()
+    counters.clear()
+    try:
+        configuration = scratch_configuration()
+        notation, flavor = resolver.resolve(configuration, text, settings=settings)
+        ok, payload = True, (structure_record(configuration), notation, flavor)
+    except Exception as e:
+        ok, payload = False, e
+    try:
+        try:
+            sender.send((ok, payload, timers.state(), counters.state()))
+        except Exception:
+            # The exception can't be pickled
+            sender.send(
+                (False, RuntimeError(str(payload)), timers.state(), counters.state())
+            )
+    finally:
+        sender.close()
+
+
+def resolve_with_time_limit(resolver, configuration, text, settings, time_limit):
+    """Run a resolver in a child process, killing it if it takes too long.
+
+    The toolkits can spend minutes or forever embedding some molecules, e.g.
+    large macrocycles, and can't be interrupted, so the work is done in a
+    forked process that can be killed.
+
+    Parameters
+    ----------
+    resolver : Resolver
+        The resolver.
+    configuration : molsystem._Configuration
+        The configuration to put the structure in.
+    text : str
+        The input string.
+    settings : dict(str, any)
+        The settings, as described in :func:`convert`.
+    time_limit : float
+        The time limit in seconds.
+
+    Returns
+    -------
+    (str, str)
+        The notation and flavor used to create the structure.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_resolve_child, args=(sender, resolver, text, settings), daemon=True
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(time_limit):
+            process.kill()
+            raise StructureTimeoutError(
+                f"Took longer than the time limit of {time_limit:g} s."
+            )
+        try:
+            ok, payload, times, counts = receiver.recv()
+        except EOFError:
+            raise StructureProcessError(
+                f"The process creating the structure died (exit code "
+                f"{process.exitcode})."
+            )
+    finally:
+        receiver.close()
+        process.join()
+
+    timers.merge(times)
+    counters.merge(counts)
+    if not ok:
+        raise payload
+    record, notation, flavor = payload
+    record_to_configuration(record, configuration)
+    return notation, flavor
+
+
+def scratch_configuration():
+    """An empty configuration in an in-memory database private to this process.
+
+    Returns
+    -------
+    molsystem._Configuration
+    """
+    pid = os.getpid()
+    if pid not in _scratch:
+        system_db = molsystem.SystemDB(
+            filename=f"file:from_smiles_scratch_{pid}?mode=memory&cache=shared"
+        )
+        system = system_db.create_system()
+        _scratch[pid] = system.create_configuration()
+    configuration = _scratch[pid]
+    configuration.clear()
+    return configuration
+
+
+def convert(text, notation, flavor, settings=None):
+    """Convert one input string to a record of the structure.
+
+    Parameters
+    ----------
+    text : str
+        The input string: SMILES, InChI, InChIKey, CID, or name.
+    notation : str
+        The line notation, or "perceive" to determine it from the text.
+    flavor : str
+        The flavor of SMILES to use.
+    settings : dict(str, any) = None
+        The settings for the resolvers and caches:
+
+            * "resolvers": the names of the resolvers to try, in order
+            * "pubchem 3d": whether the resolvers start with PubChem's 3-D
+              structures, so names are cached in the conformer cache too
+            * "dictionary": the path to the local dictionary of names, or None
+            * "conformer cache": the path to the conformer cache, or None
+            * "conformer cache size": the maximum number of structures in it
+            * "pubchem cache": the path to the PubChem cache, or None
+            * "pubchem cache ttl": the time-to-live of its entries, in days
+            * "offline": whether to only use the PubChem cache, not PubChem
+            * "pubchem url": the base URL of PubChem, or None for the default
+            * "pubchem rate": the most requests to PubChem per second
+            * "pubchem rate file": the path to the limit on the rate shared by
+              the jobs on this host, or None
+            * "pubchem timeout": the timeout of each request, in seconds
+            * "pubchem retries": the number of times to retry a failed request
+            * "pubchem backoff": the largest delay before the first retry, in
+              seconds, doubling for each further retry
+            * "pubchem failure threshold": the number of failures in a row
+              after which PubChem is not used for a while, or 0 for no limit
+            * "pubchem cooldown": how long PubChem is not used, in seconds
+            * "failure cache": the path to the failure cache, or None
+            * "failure cache ttl": the time-to-live of its entries, in days
+            * "time limit": the time limit in seconds for each resolver, or None
+
+    Returns
+    -------
+    dict(str, any)
+        The "record" of the structure, the "notation" and "flavor" actually
+        used, whether the notation was "perceived", and the "cache" result:
+        "hit", "miss", or None if the structure could not be cached. When
+        deduplicating in :func:`convert_many`, the cache result is "duplicate"
+        for the duplicates.
+    """
+    perceived = notation == "perceive"
+
+    if settings is None:
+        settings = {}
+
+    key = None
+    if settings.get("conformer cache") is not None:
+        if perceived:
+            with timers("perception"):
+                form = perceive(text)
+        else:
+            form = notation
+        canonical = canonical_form(text, form)
+        # Names have no canonical form, but with PubChem first the structure
+        # of a name is PubChem's
+        if canonical is None and form == "name" and settings.get("pubchem 3d"):
+            canonical = "name:" + text.strip().lower()
+        if canonical is not None:
+            conformers = get_cache(
+                ConformerCache,
+                settings["conformer cache"],
+                max_entries=settings["conformer cache size"],
+            )
+            # PubChem's 3-D structures are only used for names, InChIKeys and
+            # CIDs, so SMILES and InChI keep the flavor that builds them
+            if settings.get("pubchem 3d") and form in ("name", "InChIKey", "CID"):
+                source = "PubChem 3D"
+            else:
+                source = flavor
+            key = conformers.key(
+                canonical, source, EMBEDDING_SETTINGS, toolkit_versions()
+            )
+            with timers("conformer cache"):
+                hit = conformers.get(key)
+            if hit is not None:
+                record, notation, flavor = hit
+                return {
+                    "record": record,
+                    "notation": notation,
+                    "flavor": flavor,
+                    "perceived": perceived,
+                    "cache": "hit",
+                }
+
+    configuration = scratch_configuration()
+    notation, flavor, perceived = create_structure(
+        configuration, text, notation, flavor, settings=settings
+    )
+    with timers("structure record"):
+        record = structure_record(configuration)
+
+    if key is not None:
+        with timers("conformer cache"):
+            conformers.put(key, canonical, record, notation, flavor)
+
+    return {
+        "record": record,
+        "notation": notation,
+        "flavor": flavor,
+        "perceived": perceived,
+        "cache": None if key is None else "miss",
+    }
+
+
+def _convert_task(task):
+    """Convert in a worker, returning any error rather than raising it.
+
+    Parameters
+    ----------
+    task : (str, str, str, dict)
+        The text, notation, flavor, and settings.
+
+    Returns
+    -------
+    (dict or None, str or None)
+        The result of :func:`convert`, with the "time" taken in seconds, or
+        None and the error message.
+    """
+    start = time.perf_counter()
+    try:
+        result = convert(*task)
+    except Exception as e:
+        return None, str(e)
+    result["time"] = time.perf_counter() - start
+    return result, None
+
+
+def _convert_chunk(tasks):
+    """Convert a chunk of tasks in a worker.
+
+    Parameters
+    ----------
+    tasks : [(str, str, str, dict)]
+        The text, notation, flavor, and settings for each task.
+
+    Returns
+    -------
+    ([(dict or None, str or None)], dict, dict)
+        The result of :func:`_convert_task` for each task, and the state of the
+        stage timers (see :mod:`from_smiles_step.timing`) and counters (see
+        :mod:`from_smiles_step.metrics`) for the chunk.
+    """
+    timers.clear()
+    counters.clear()
+    results = [_convert_task(task) for task in tasks]
+    return results, timers.state(), counters.state()
+
+
+def _chunk_results(future):
+    """The results of a chunk, adding its times and counts to those of this process.
+
+    Parameters
+    ----------
+    future : concurrent.futures.Future
+        The future for :func:`_convert_chunk`.
+
+    Returns
+    -------
+    [(dict or None, str or None)]
+        The result of :func:`_convert_task` for each task.
+    """
+    results, times, counts = future.result()
+    timers.merge(times)
+    counters.merge(counts)
+    return results
+
+
+def duplicate_key(text, notation):
+    """The key identifying duplicates of an input string.
+
+    This is the canonical form of the string if it has one, otherwise the
+    string itself, ignoring case for chemical names.
+
+    Parameters
+    ----------
+    text : str
+        The input string.
+    notation : str
+        The line notation, or "perceive" to determine it from the text.
+
+    Returns
+    -------
+    str
+    """
+    if notation == "perceive":
+        notation = perceive(text)
+    canonical = canonical_form(text, notation)
+    if canonical is not None:
+        return canonical
+    if notation == "name":
+        return "name:" + " ".join(text.lower().split())
+    return f"{notation}:{text.strip()}"
+
+
+def _deduplicate(texts, notation, convert, max_unique):
+    """Convert only the first of each set of duplicate input strings.
+
+    Parameters
+    ----------
+    texts : iterable of str
+        The input strings.
+    notation : str
+        The line notation, or "perceive" to determine it from each text.
+    convert : function
+        Converts an iterable of strings, returning the results in order.
+    max_unique : int
+        The number of the most recent unique strings whose results are kept
+        for their duplicates. A duplicate of an older one is converted again.
+
+    Returns
+    -------
+    iterator of (dict or None, str or None)
+        The result of :func:`convert` or None and the error message, for each
+        input string.
+    """
+    pending = object()
+    known = collections.OrderedDict()  # The key and result of unique strings
+    slots = collections.deque()  # (text, key, is duplicate) for each input string
+
+    def unique():
+        for text in texts:
+            with timers("deduplication"):
+                key = duplicate_key(text, notation)
+            if key in known:
+                known.move_to_end(key)
+                slots.append((text, key, True))
+            else:
+                known[key] = pending
+                if len(known) > max_unique:
+                    known.popitem(last=False)
+                slots.append((text, key, False))
+                yield text
+
+    results = convert(unique())
+    ready = collections.deque()
+    exhausted = False
+    while True:
+        if len(slots) == 0 or (not slots[0][2] and len(ready) == 0):
+            # Reading more input, which converts the next unique string
+            if exhausted:
+                break
+            try:
+                ready.append(next(results))
+            except StopIteration:
+                exhausted = True
+            continue
+
+        text, key, duplicate = slots.popleft()
+        if duplicate:
+            entry = known.get(key, pending)
+            if entry is pending:
+                # The result is no longer kept, so convert again
+                yield next(iter(convert([text])))
+            else:
+                result, error = entry
+                if result is not None:
+                    result = {**result, "cache": "duplicate"}
+                yield result, error
+        else:
+            result = ready.popleft()
+            if key in known:
+                known[key] = result
+            yield result
+
+
+def _convert_longest_first(tasks, executor, cost, window, max_chunk):
+    """Convert in workers, starting the most expensive tasks first.
+
+    The tasks are read a window at a time, and the tasks in each window sorted
+    by their predicted cost, most expensive first. The cheaper tasks are
+    grouped into chunks of similar total cost, so the workers take the next
+    chunk as they finish, balancing the load. The next window is submitted
+    before the results of the current one are returned, so the workers are
+    not left idle.
+
+    Parameters
+    ----------
+    tasks : iterator of (str, str, str, dict)
+        The text, notation, flavor, and settings for each task.
+    executor : concurrent.futures.Executor
+        The pool of workers.
+    cost : function
+        The predicted cost in seconds of converting a text.
+    window : int
+        The number of tasks to sort at a time.
+    max_chunk : int
+        The maximum number of tasks in a chunk.
+
+    Returns
+    -------
+    iterator of (dict or None, str or None)
+        The result of :func:`convert`, with the "predicted" time in seconds,
+        or None and the error message, for each task in order.
+    """
+    windows = collections.deque()
+
+    def submit_window():
+        batch = list(itertools.islice(tasks, window))
+        if len(batch) == 0:
+            return
+        predicted = [cost(task[0]) for task in batch]
+        order = sorted(range(len(batch)), key=lambda i: predicted[i], reverse=True)
+
+        # Chunks of at least the cost of the most expensive task, to balance
+        target = predicted[order[0]]
+        futures = [None] * len(batch)
+        chunk = []
+        total = 0.0
+        for i in order + [None]:
+            if i is not None:
+                chunk.append(i)
+                total += predicted[i]
+            if len(chunk) > 0 and (
+                i is None or total >= target or len(chunk) >= max_chunk
+            ):
+                future = executor.submit(_convert_chunk, [batch[j] for j in chunk])
+                for offset, j in enumerate(chunk):
+                    futures[j] = (future, offset)
+                chunk = []
+                total = 0.0
+        windows.append((futures, predicted))
+
+    submit_window()
+    submit_window()
+    while len(windows) > 0:
+        futures, predicted = windows.popleft()
+        done = {}
+        for (future, offset), seconds in zip(futures, predicted):
+            if future not in done:
+                done[future] = _chunk_results(future)
+            result, error = done[future][offset]
+            if result is not None:
+                result["predicted"] = seconds
+            yield result, error
+        submit_window()
+
+
+def convert_many(
+    texts,
+    notation,
+    flavor,
+    n_workers=1,
+    settings=None,
+    chunksize=None,
+    in_flight=4,
+    deduplicate=False,
+    max_unique=100000,
+    cost=None,
+    stats=None,
+    min_batch=32,
+    min_cost=1.0,
+):
+    """Convert many input strings, in parallel if requested.
+
+    The input strings are read as they are needed, and at most ``in_flight``
+    chunks per worker are waiting or being converted, so that memory is bounded
+    however many strings there are. The results are returned in the order of
+    the input.
+
+    The first window of ``in_flight`` chunks per worker is read before the
+    workers are started, so that no more workers are started than there are
+    chunks. Short inputs, with fewer than ``min_batch`` strings or a predicted
+    cost under ``min_cost``, are converted in this process, since starting the
+    workers would cost more than it saves.
+
+    Parameters
+    ----------
+    texts : iterable of str
+        The input strings.
+    notation : str
+        The line notation, or "perceive" to determine it from each text.
+    flavor : str
+        The flavor of SMILES to use.
+    n_workers : int = 1
+        The most worker processes to use. If 1, the conversion is done in this
+        process.
+    settings : dict(str, any) = None
+        The settings for the caches, as described in :func:`convert`.
+    chunksize : int = None
+        The number of strings sent to a worker at a time. By default, chosen
+        from the number of strings, if known, or 16.
+    in_flight : int = 4
+        The number of chunks per worker waiting or being converted.
+    deduplicate : bool = False
+        Whether to convert only the first of the input strings with the same
+        canonical form (see :func:`duplicate_key`), giving its result for the
+        others, with "duplicate" as the cache result.
+    max_unique : int = 100000
+        When deduplicating, the number of recent unique strings whose results
+        are kept for duplicates.
+    cost : function = None
+        The predicted cost in seconds of converting a string, e.g. a
+        :class:`from_smiles_step.cost.CostModel`. If given, the workers start
+        the most expensive strings first, reading ahead ``in_flight`` times
+        the chunk size per worker, and the results have the "predicted" cost.
+    stats : dict(str, int) = None
+        If given, "workers" is set to the number of worker processes used, or
+        1 if the conversion was done in this process.
+    min_batch : int = 32
+        The fewest strings worth converting in worker processes.
+    min_cost : float = 1.0
+        The least predicted cost, in seconds, worth converting in worker
+        processes. Only used if the ``cost`` is given.
+
+    Returns
+    -------
+    iterator of (dict or None, str or None)
+        The result of :func:`convert` or None and the error message, for each
+        input string.
+    """
+    if deduplicate:
+        yield from _deduplicate(
+            texts,
+            notation,
+            functools.partial(
+                convert_many,
+                notation=notation,
+                flavor=flavor,
+                n_workers=n_workers,
+                settings=settings,
+                chunksize=chunksize,
+                in_flight=in_flight,
+                cost=cost,
+                stats=stats,
+                min_batch=min_batch,
+                min_cost=min_cost,
+            ),
+            max_unique,
+        )
+        return
+
+    tasks = ((text, notation, flavor, settings) for text in texts)
+
+    # Read the first window, to know whether the input is short
+    window = in_flight * max(1, n_workers) * (16 if chunksize is None else chunksize)
+    if hasattr(texts, "__len__"):
+        n_texts = len(texts)
+        head = texts if n_texts < window else None
+    else:
+        head = list(itertools.islice(tasks, window))
+        n_texts = len(head) if len(head) < window else None
+        tasks = itertools.chain(head, tasks)
+        head = [task[0] for task in head]
+    if n_texts is not None:
+        if chunksize is None:
+            chunksize = max(1, min(100, n_texts // (4 * max(1, n_workers))))
+        n_workers = min(n_workers, -(-n_texts // chunksize))
+        if n_texts < min_batch:
+            n_workers = 1
+        elif cost is not None and head is not None:
+            if sum(cost(text) for text in head) < min_cost:
+                n_workers = 1
+    if chunksize is None:
+        chunksize = 16
+
+    if stats is not None:
+        stats["workers"] = max(stats.get("workers", 1), n_workers, 1)
+
+    if n_workers <= 1:
+        for task in tasks:
+            yield _convert_task(task)
+        return
+
+    # Fork where possible: spawning would rerun the flowchart script in each
+    # worker.
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = None
+    chunks = iter(lambda: list(itertools.islice(tasks, chunksize)), [])
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+        if cost is not None:
+            yield from _convert_longest_first(
+                tasks, executor, cost, in_flight * n_workers * chunksize, chunksize
+            )
+            return
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_convert_chunk, chunk))
+            if len(pending) >= in_flight * n_workers:
+                yield from _chunk_results(pending.popleft())
+        while len(pending) > 0:
+            yield from _chunk_results(pending.popleft())
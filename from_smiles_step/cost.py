@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+"""A model of the time to create a structure, for scheduling batches.
+
+The time to embed a molecule in 3-D varies by orders of magnitude, from a few
+milliseconds for small molecules to seconds for large, flexible ones. When
+building in parallel, starting the expensive molecules first avoids a few of
+them running alone at the end while the other workers are idle.
+
+The model is linear in cheap features of the SMILES: the number of heavy
+atoms and its square, ring closures, branches and stereocenters, counted
+from the text, and the rotatable bonds and ring systems, which drive the
+search for a conformer, from the molecule parsed by RDKit without embedding
+it. Other notations, e.g. names that need PubChem, get the cost of the
+constant term alone. The coefficients can be refit from the measured times
+of local embeddings in a history of previous runs (see
+:class:`from_smiles_step.cache.TimingHistory`).
+"""
+
+import logging
+import math
+
+import numpy
+from rdkit import Chem
+from rdkit.Chem import rdMolDescriptors
+from rdkit.rdBase import BlockLogs
+
+from from_smiles_step.perception import (
+    bracket_atom_re,
+    smiles_chars_re,
+    smiles_token_re,
+)
+
+logger = logging.getLogger(__name__)
+
+features = (
+    "constant",
+    "heavy atoms",
+    "heavy atoms squared",
+    "rings",
+    "branches",
+    "stereo",
+    "rotatable bonds",
+    "ring systems",
+)
+
+# Rough values, in seconds, for RDKit embedding
+default_coefficients = (0.005, 0.001, 0.0001, 0.002, 0.001, 0.003, 0.002, 0.002)
+
+
+def cost_features(text):
+    """The features of an input string for the cost model.
+
+    Parameters
+    ----------
+    text : str
+        The input string.
+
+    Returns
+    -------
+    [float]
+        The value of each feature, or just the constant if the string does not
+        look like a SMILES.
+    """
+    text = text.strip()
+    if smiles_chars_re.fullmatch(text) is None:
+        return [1.0] + [0.0] * (len(features) - 1)
+
+    atoms = rings = branches = 0
+    for match in smiles_token_re.finditer(text):
+        bracket, atom, ring, bond, open_, close, dot = match.groups()
+        if bracket is not None:
+            element = bracket_atom_re.match(bracket)
+            if element is None or element.group(2) != "H":
+                atoms += 1
+        elif atom is not None:
+            atoms += 1
+        elif ring is not None:
+            rings += 1
+        elif open_ is not None:
+            branches += 1
+    chiral = text.count("@") - text.count("@@")
+    stereo = chiral + (text.count("/") + text.count("\\")) // 2
+    return [1.0, atoms, atoms * atoms, rings / 2, branches, stereo] + list(
+        _flexibility(text)
+    )
+
+
+def _flexibility(text):
+    """The numbers of rotatable bonds and ring systems of a SMILES.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES.
+
+    Returns
+    -------
+    (int, int)
+        The counts, or zeros if RDKit can't parse the SMILES.
+    """
+    block = BlockLogs()  # noqa: F841
+    mol = Chem.MolFromSmiles(text)
+    if mol is None:
+        return 0, 0
+
+    # Rings sharing atoms are fused into one ring system
+    systems = []
+    for ring in mol.GetRingInfo().AtomRings():
+        system = set(ring)
+        for other in [s for s in systems if not s.isdisjoint(system)]:
+            system |= other
+            systems.remove(other)
+        systems.append(system)
+    return rdMolDescriptors.CalcNumRotatableBonds(mol), len(systems)
+
+
+class CostModel(object):
+    """A linear model of the time to create a structure.
+
+    Parameters
+    ----------
+    coefficients : [float] = None
+        The coefficients of the features, defaulting to rough values for RDKit.
+    """
+
+    def __init__(self, coefficients=None):
+        if coefficients is None:
+            coefficients = default_coefficients
+        self.coefficients = list(coefficients)
+
+    def __call__(self, text):
+        """The predicted time, in seconds, to create the structure for a string."""
+        return self.predict(cost_features(text))
+
+    def predict(self, values):
+        """The predicted time, in seconds, from the values of the features.
+
+        Parameters
+        ----------
+        values : [float]
+            The features, from :func:`cost_features`.
+
+        Returns
+        -------
+        float
+        """
+        result = sum(c * x for c, x in zip(self.coefficients, values))
+        return max(result, 0.0001)
+
+    @classmethod
+    def fit(cls, samples, regularization=1.0e-6, min_samples=50):
+        """Fit the model to measured times by least squares.
+
+        Parameters
+        ----------
+        samples : [([float], float)]
+            The features and measured time, in seconds, of each sample. Those
+            with other features, from an older version, are ignored.
+        regularization : float = 1.0e-6
+            The ridge regularization, which keeps the fit stable when some
+            features are always zero.
+        min_samples : int = 50
+            The number of samples needed to fit, and at least the number of
+            features. With fewer the default coefficients are used.
+
+        Returns
+        -------
+        CostModel
+        """
+        samples = [sample for sample in samples if len(sample[0]) == len(features)]
+        if len(samples) < max(min_samples, len(features)):
+            return cls()
+
+        # Ridge regression as an ordinary least-squares problem, with the rows
+        # sqrt(r n) I appended to X and zeros to y, solved by the SVD so that
+        # features that are always zero or collinear can't break the fit.
+        x = numpy.array([values for values, _ in samples], dtype=float)
+        y = numpy.array([seconds for _, seconds in samples], dtype=float)
+        if regularization > 0.0:
+            ridge = math.sqrt(regularization * len(samples))
+            x = numpy.vstack((x, ridge * numpy.eye(len(features))))
+            y = numpy.concatenate((y, numpy.zeros(len(features))))
+        try:
+            coefficients = numpy.linalg.lstsq(x, y, rcond=None)[0]
+        except numpy.linalg.LinAlgError as e:
+            logger.warning(f"Could not fit the cost model, so using the default: {e}")
+            return cls()
+        if not numpy.all(numpy.isfinite(coefficients)):
+            logger.warning("Could not fit the cost model, so using the default.")
+            return cls()
+        return cls(coefficients.tolist())
+
+
+class TimingLog(object):
+    """Record the predicted and actual time to create each structure.
+
+    The times are written to a file as they are added, and to the timing
+    history in batches, so memory does not grow with the number of structures.
+
+    Parameters
+    ----------
+    model : CostModel
+        The model for the predicted times.
+    path : str or pathlib.Path = None
+        The file for the times, if any.
+    history : from_smiles_step.cache.TimingHistory = None
+        The history of times for refitting the model, if any. Only the times of
+        structures embedded locally are added to it.
+    batch : int = 1000
+        The number of samples to add to the history at a time.
+    """
+
+    def __init__(self, model, path=None, history=None, batch=1000):
+        self.model = model
+        self.history = history
+        self.batch = batch
+        self._samples = []
+
+        self.n = 0
+        self.predicted = 0.0
+        self.actual = 0.0
+        self._sums = [0.0] * 3  # of p^2, a^2 and p * a
+
+        self._fd = None
+        if path is not None:
+            self._fd = open(path, "w")
+            self._fd.write("# line\tinput\tpredicted (s)\tactual (s)\n")
+
+    def add(self, lineno, text, seconds, local=True):
+        """Add the time for a structure.
+
+        Parameters
+        ----------
+        lineno : int
+            The line number of the input.
+        text : str
+            The input string.
+        seconds : float
+            The time taken.
+        local : bool = True
+            Whether the structure was embedded locally from SMILES. The times
+            of others, e.g. from PubChem, are not added to the history, since
+            they depend on the network rather than the features.
+        """
+        values = cost_features(text)
+        predicted = self.model.predict(values)
+
+        self.n += 1
+        self.predicted += predicted
+        self.actual += seconds
+        self._sums[0] += predicted * predicted
+        self._sums[1] += seconds * seconds
+        self._sums[2] += predicted * seconds
+
+        if self._fd is not None:
+            self._fd.write(f"{lineno}\t{text}\t{predicted:.4f}\t{seconds:.4f}\n")
+        if self.history is not None and local:
+            self._samples.append((values, seconds))
+            if len(self._samples) >= self.batch:
+                self.history.add(self._samples)
+                self._samples = []
+
+    @property
+    def correlation(self):
+        """The correlation between the predicted and actual times, or None."""
+        if self.n < 2:
+            return None
+        n = self.n
+        var_p = self._sums[0] - self.predicted**2 / n
+        var_a = self._sums[1] - self.actual**2 / n
+        cov = self._sums[2] - self.predicted * self.actual / n
+        if var_p <= 0 or var_a <= 0:
+            return None
+        return cov / (var_p * var_a) ** 0.5
+
+    def close(self):
+        """Finish writing the times."""
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+        if self.history is not None and len(self._samples) > 0:
+            self.history.add(self._samples)
+            self._samples = []
+
+    def summary(self):
+        """A summary of the predicted and actual times.
+
+        Returns
+        -------
+        str
+        """
+        text = (
+            f"The predicted time to create the {self.n} structures was "
+            f"{self.predicted:.1f} s, and the actual time {self.actual:.1f} s"
+        )
+        if self.correlation is not None:
+            text += f", with a correlation of {self.correlation:.2f}"
+        return text + "."
@@ -2,9 +2,35 @@
 
 """a node to create a structure from a SMILES string"""
 
+import itertools
 import logging
+import os
+from pathlib import Path
+import re
 
 import from_smiles_step
+from from_smiles_step.cache import (
+    FailureCache,
+    get_cache,
+    MetricsStore,
+    TimingHistory,
+)
+from from_smiles_step.checkpoint import Checkpoint
+from from_smiles_step.conversion import (
+    convert,
+    convert_many,
+    duplicate_key,
+    structure_keys,
+)
+from from_smiles_step.cost import CostModel, TimingLog
+from from_smiles_step.metrics import counters, write_json, write_prometheus
+from from_smiles_step.perception import classify_many, notations
+from from_smiles_step.pubchem_batch import BackgroundBatch, PubChemBatch
+from from_smiles_step.ratelimit import default_path as default_rate_file
+from from_smiles_step.reading import read_entries
+from from_smiles_step.records import record_to_configuration
+from from_smiles_step.resolvers import expand_chain
+from from_smiles_step.timing import timers
 import molsystem
 import seamm
 import seamm_util.printing as printing
@@ -14,6 +40,13 @@ logger = logging.getLogger(__name__)
 job = printing.getPrinter()
 printer = printing.getPrinter("from_smiles")
 
+# The column named in the expression for the input string in a loop over a
+# table, e.g. $_row['name']
+row_column_re = re.compile(r"""_row\s*\[\s*(['"])(?P<column>.+?)\1\s*\]""")
+
+# The property holding the canonical form of the input for each structure
+KEY_PROPERTY = "from_smiles input key"
+
 
 class FromSMILES(seamm.Node):
     def __init__(self, flowchart=None, extension=None):
@@ -30,6 +63,10 @@ class FromSMILES(seamm.Node):
 
         self.parameters = from_smiles_step.FromSMILESParameters()
 
+        # Resolving the inputs of later iterations of a loop in the background
+        self._background = None
+        self._prefetched_tables = set()
+
     @property
     def version(self):
         """The semantic version of this module."""
@@ -55,29 +92,78 @@ class FromSMILES(seamm.Node):
         if not P:
             P = self.parameters.values_to_dict()
 
-        if P["notation"] == "perceive":
-            if P["smiles string"][0] == "$":
+        input_type = P["input type"]
+        if input_type == "file":
+            if P["notation"] == "perceive":
                 text = (
-                    "Perceive the line notation (SMILES, InChI,...) and create the "
-                    "structure from the string in the variable '{smiles string}', "
+                    "Perceive the line notation (SMILES, InChI,...) of each structure "
+                    "in the file '{input file}' and create the structures. "
                 )
             else:
                 text = (
-                    "Perceive the line notation (SMILES, InChI,...) and create the "
-                    "structure from the string '{smiles string}', "
+                    "Create the structures from the {notation} in the file "
+                    "'{input file}'. "
                 )
-        else:
-            if P["smiles string"][0] == "$":
+            handling = (
+                seamm.standard_parameters.multiple_structure_handling_description(P)
+            )
+        elif input_type == "one structure per line":
+            if P["notation"] == "perceive":
+                text = (
+                    "Perceive the line notation (SMILES, InChI,...) of each line in "
+                    "'{smiles string}' and create the structures. "
+                )
+            else:
                 text = (
-                    "Create the structure from the {notation} in the variable"
-                    " '{smiles string}', "
+                    "Create the structures from each line of {notation} in "
+                    "'{smiles string}'. "
                 )
+            handling = (
+                seamm.standard_parameters.multiple_structure_handling_description(P)
+            )
+        else:
+            if P["notation"] == "perceive":
+                if P["smiles string"][0] == "$":
+                    text = (
+                        "Perceive the line notation (SMILES, InChI,...) and create the "
+                        "structure from the string in the variable '{smiles string}', "
+                    )
+                else:
+                    text = (
+                        "Perceive the line notation (SMILES, InChI,...) and create the "
+                        "structure from the string '{smiles string}', "
+                    )
             else:
-                text = "Create the structure from the {notation} '{smiles string}', "
+                if P["smiles string"][0] == "$":
+                    text = (
+                        "Create the structure from the {notation} in the variable"
+                        " '{smiles string}', "
+                    )
+                else:
+                    text = (
+                        "Create the structure from the {notation} '{smiles string}', "
+                    )
 
-        text += seamm.standard_parameters.structure_handling_description(P)
+            handling = seamm.standard_parameters.structure_handling_description(P)
 
-        return self.header + "\n" + __(text, **P, indent=4 * " ").__str__()
+        if input_type != "single structure" and P["existing structures"] == "skip":
+            text += "Inputs whose structures are already in the database are skipped. "
+
+        # The names in the structure handling may contain e.g. {title}, which
+        # must not be formatted here.
+        text += "{handling}"
+        if P["3-D coordinates"] == "from PubChem if available":
+            text += (
+                " The 3-D structures from PubChem are used for names, InChIKeys "
+                "and CIDs where it has them, otherwise PubChem's SMILES is "
+                "embedded locally."
+            )
+
+        return (
+            self.header
+            + "\n"
+            + __(text, **P, handling=handling, indent=4 * " ").__str__()
+        )
 
     def run(self):
         """Create 3-D structure from a SMILES string"""
@@ -89,114 +175,159 @@ class FromSMILES(seamm.Node):
             context=seamm.flowchart_variables._data
         )
 
+        # A list in a variable is always a batch of structures
+        if isinstance(P["smiles string"], (list, tuple)):
+            P["input type"] = "one structure per line"
+
         # Print what we are doing
         printer.important(self.description_text(P))
 
-        if P["smiles string"] is None or P["smiles string"] == "":
-            return None
+        timers.clear()
+        counters.clear()
 
-        notation = P["notation"]
-        flavor = P["smiles flavor"]
+        settings = self.conversion_settings(P)
+        if (
+            settings["failure cache"] is not None
+            and self.options.get("clear_failure_cache", "no") == "yes"
+        ):
+            get_cache(
+                FailureCache,
+                settings["failure cache"],
+                ttl=settings["failure cache ttl"],
+            ).clear()
 
-        # Get the system
-        system, configuration = self.get_system_configuration(P, same_as=None)
+        if P["input type"] == "single structure":
+            if P["smiles string"] is None or P["smiles string"] == "":
+                return None
+            self.prefetch_loop(P, settings)
+            if settings["time limit"] is not None:
+                self.wait_for_background()
+            self.create_one_structure(P)
+        else:
+            self.wait_for_background()
+            self.create_structures(P)
 
-        # Create the structure in the given configuration
-        text = P["smiles string"]
+        self.report_timings()
+        self.report_metrics()
 
-        # Perceive the notation if requested
-        perceived = False
-        if notation == "perceive":
-            perceived = True
-            tmp = text.split("-")
-            if (
-                len(text) == 27
-                and len(tmp) == 3
-                and len(tmp[0]) == 14
-                and len(tmp[1]) == 10
-            ):
-                notation = "InChIKey"
-            elif text[0:7] == "InChI=":
-                notation = "InChI"
-            else:
-                notation = "SMILES or name"
+        return next_node
 
-        if notation == "SMILES":
-            try:
-                configuration.from_smiles(text, flavor=flavor)
-            except Exception:
-                try:
-                    configuration.PC_from_identifier(
-                        text, namespace="smiles", properties=None
-                    )
-                    flavor = "PUBCHEM"
-                except Exception:
-                    # If using rdkit, try openbabel since it is more robust
-                    if flavor == "rdkit":
-                        try:
-                            configuration.from_smiles(text, flavor="openbabel")
-                            flavor = "openbabel"
-                        except Exception:
-                            raise RuntimeError(
-                                f"Can not create a structure from the string '{text}'"
-                                " as a SMILES."
-                            )
-        elif notation == "InChI":
-            try:
-                configuration.from_inchi(text)
-                flavor = "openbabel"
-            except Exception:
-                raise RuntimeError(
-                    f"Can not create a structure from the string '{text}'"
-                    " as an InChI."
-                )
-        elif notation == "InChIKey":
-            try:
-                configuration.from_inchikey(text)
-                flavor = "openbabel"
-            except Exception:
-                raise RuntimeError(
-                    f"Can not create a structure from the string '{text}'"
-                    " as an InChIKey."
-                )
-        elif notation == "name":
-            try:
-                configuration.PC_from_identifier(text, namespace="name")
-                flavor = "PubChem"
-            except Exception:
-                raise RuntimeError(
-                    f"Can not create a structure from the string '{text}'"
-                    " as a chemical name."
+    def count_result(self, result):
+        """Count the notation, flavor and cache outcome of a result.
+
+        Parameters
+        ----------
+        result : dict(str, any) or None
+            The result of the conversion, or None if it failed.
+        """
+        if result is None:
+            counters.add("from_smiles_failures_total")
+            return
+        counters.add(
+            "from_smiles_structures_total",
+            notation=result["notation"],
+            perceived="yes" if result["perceived"] else "no",
+            flavor=result["flavor"],
+        )
+        if result["cache"] is not None:
+            counters.add("from_smiles_conformer_cache_total", outcome=result["cache"])
+
+    def report_metrics(self):
+        """Write the counts to metrics.json, and add them to the cumulative counts.
+
+        The cumulative counts are kept in the database given by the
+        --metrics-database option, and exported to the Prometheus textfile
+        given by --prometheus-textfile, if any.
+        """
+        if len(counters) == 0:
+            return
+
+        cumulative = None
+        path = self.options.get("metrics_database", "none")
+        if path is not None and path.lower() != "none":
+            store = get_cache(MetricsStore, path)
+            store.add(counters)
+            cumulative = store.totals()
+
+            textfile = self.options.get("prometheus_textfile", "none")
+            if textfile is not None and textfile.lower() != "none":
+                write_prometheus(textfile, cumulative)
+
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        write_json(directory / "metrics.json", counters, cumulative)
+
+    def report_timings(self):
+        """Print the times of the stages, and write them to stage_times.json."""
+        if len(timers) == 0:
+            return
+        printer.normal(
+            __(
+                "\nThe time taken by each stage, where the times of the resolvers "
+                "include those of any PubChem requests and caches they use:\n\n"
+                + timers.table(),
+                indent=4 * " ",
+                wrap=False,
+                dedent=False,
+            )
+        )
+        printer.normal("")
+
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        timers.write(directory / "stage_times.json")
+
+    def create_one_structure(self, P):
+        """Create a single structure from the input string.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+        """
+        # Create the structure, or get it from the cache
+        try:
+            result = convert(
+                P["smiles string"],
+                P["notation"],
+                P["smiles flavor"],
+                settings=self.conversion_settings(P),
+            )
+        except Exception as e:
+            self.count_result(None)
+            if P["errors"] == "stop":
+                raise
+            self.record_failures([(1, P["smiles string"], str(e))])
+            printer.important(
+                __(
+                    "\n    The structure could not be created, so was skipped:\n"
+                    f"    {e}",
+                    indent=4 * " ",
                 )
-        elif notation == "SMILES or name":
-            try:
-                configuration.from_smiles(text, flavor=flavor)
-            except Exception:
-                try:
-                    configuration.PC_from_identifier(text, namespace="name")
-                    flavor = "PubChem"
-                    notation = "name"
-                except Exception:
-                    try:
-                        configuration.PC_from_identifier(text, namespace="smiles")
-                        flavor = "PubChem"
-                        notation = "SMILES"
-                    except Exception:
-                        # If using rdkit, try openbabel since it is more robust
-                        if flavor == "rdkit":
-                            flavor = "openbabel"
-                            try:
-                                configuration.from_smiles(text, flavor="openbabel")
-                            except Exception:
-                                raise RuntimeError(
-                                    "Can not create a structure from the string "
-                                    f"'{text}' as a SMILES."
-                                )
-        else:
-            raise RuntimeError(f"Can not handle line notation '{text}'")
+            )
+            printer.important("")
+            return
+        self.count_result(result)
+        notation = result["notation"]
+        flavor = result["flavor"]
+        perceived = result["perceived"]
+
+        # Get the system and put the structure in the configuration
+        system, configuration = self.get_system_configuration(P, same_as=None)
+        if configuration is None:
+            printer.important(__("\n    The structure was discarded.", indent=4 * " "))
+            printer.important("")
+            return
+        with timers("database write"):
+            record_to_configuration(result["record"], configuration)
+            self.add_key_property(self.get_variable("_system_db"))
+            configuration.properties.put(
+                KEY_PROPERTY, duplicate_key(P["smiles string"], P["notation"])
+            )
 
         # Now set the names of the system and configuration, as appropriate.
-        seamm.standard_parameters.set_names(system, configuration, P, _first=True)
+        with timers("set names"):
+            seamm.standard_parameters.set_names(system, configuration, P, _first=True)
 
         # Finish the output
         if perceived:
@@ -244,9 +375,1037 @@ class FromSMILES(seamm.Node):
                 indent=4 * " ",
             )
         )
+        if result["cache"] == "hit":
+            printer.important(
+                __(
+                    "\n    The structure was found in the conformer cache.",
+                    indent=4 * " ",
+                )
+            )
+        printer.important("")
+
+        with timers("citations"):
+            self.cite({flavor})
+
+    def create_structures(self, P):
+        """Create a structure for each entry of a batch of input.
+
+        The input parameters and citations are handled once for the whole
+        batch, and each structure is put in its own system or configuration
+        following the structure handling options. The input is streamed
+        through the conversion, so the structures are created as the input is
+        read, using memory independent of the size of the input.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+        """
+        entries = self.input_entries(P)
+        n_workers = self.n_workers(P)
+        system_db = self.get_variable("_system_db")
+
+        # Skip the entries already done, remembering the keys of the others
+        skipped = {"checkpoint": 0, "existing": 0}
+        keys = {}
+        checkpoint = None
+        if P["existing structures"] == "skip":
+            if P["input type"] == "file":
+                checkpoint = self.checkpoint(P, system_db)
+            entries = self.skip_existing(
+                entries, P["notation"], system_db, checkpoint, keys, skipped
+            )
+        # Store the key of each structure created, so that later runs can skip it
+        self.add_key_property(system_db)
+
+        screening = {"n": 0, "counts": {}, "bad": []}
+        if P["notation"] in ("perceive", "SMILES"):
+            entries = self.prescreen(entries, screening)
+
+        # Resolve the identifiers that need PubChem in batches, ahead of building
+        settings = self.conversion_settings(P)
+        prefetched = {"resolved": 0, "cached": 0, "failed": 0}
+        if self.use_pubchem_batch(settings):
+            entries = self.prefetch_pubchem(entries, P, settings, prefetched)
+
+        # The model of the cost of each structure, to start the most expensive
+        # first, refit from the timings of previous runs if available.
+        history = None
+        path = self.options.get("timing_history", "none")
+        if path is not None and path.lower() != "none":
+            history = get_cache(TimingHistory, path)
+            model = CostModel.fit(history.samples())
+        else:
+            model = CostModel()
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        timings = TimingLog(model, path=directory / "timings.tsv", history=history)
+
+        # The entries are needed both for the conversion and writing the results
+        entries, tmp = itertools.tee(entries)
+        stats = {}
+        results = convert_many(
+            (text for _, text, _ in tmp),
+            P["notation"],
+            P["smiles flavor"],
+            n_workers=n_workers,
+            settings=settings,
+            deduplicate=self.options.get("deduplicate", "yes") == "yes",
+            cost=model if n_workers > 1 else None,
+            stats=stats,
+        )
+
+        # Write the structures in transactions of many structures, rather than
+        # committing each one.
+        transaction_size = max(1, int(self.options.get("transaction_size", 1000)))
+        deferred = system_db.deferred_commit
+        system_db.deferred_commit = True
+
+        cache_results = {"hit": 0, "miss": 0, "duplicate": 0, None: 0}
+        notations = {}
+        flavors = set()
+        n_structures = 0
+        n_uncommitted = 0
+        failures = []
+        last_lineno = None
+        first = True
+        try:
+            for (lineno, text, title), (result, error) in zip(entries, results):
+                key = keys.pop(lineno, None)
+                self.count_result(result)
+                if result is None and P["errors"] == "stop":
+                    # Keep the structures already created
+                    system_db.commit_transaction()
+                    if checkpoint is not None and last_lineno is not None:
+                        checkpoint.save(last_lineno)
+                    raise RuntimeError(f"Entry {lineno}: {error}")
+                last_lineno = lineno
+                if result is None:
+                    failures.append((lineno, text, error))
+                    continue
+                notation = result["notation"]
+                flavor = result["flavor"]
+                cache_results[result["cache"]] += 1
+                if result["cache"] not in ("hit", "duplicate"):
+                    timings.add(
+                        lineno,
+                        text,
+                        result["time"],
+                        local=notation == "SMILES" and flavor != "PubChem",
+                    )
+
+                with timers("database write"):
+                    system, configuration = self.get_system_configuration(
+                        P, same_as=None, first=first
+                    )
+                    if configuration is not None:
+                        record_to_configuration(result["record"], configuration)
+                        if key is None:
+                            key = duplicate_key(text, P["notation"])
+                        configuration.properties.put(KEY_PROPERTY, key)
+                if configuration is None:
+                    # The structure is being discarded
+                    first = False
+                    continue
+
+                with timers("set names"):
+                    seamm.standard_parameters.set_names(
+                        system, configuration, P, _first=first, title=title
+                    )
+                first = False
+
+                n_structures += 1
+                notations[notation] = notations.get(notation, 0) + 1
+                flavors.add(flavor)
+
+                n_uncommitted += 1
+                if n_uncommitted >= transaction_size:
+                    with timers("commit"):
+                        system_db.commit_transaction()
+                    if checkpoint is not None:
+                        checkpoint.save(lineno)
+                    n_uncommitted = 0
+            with timers("commit"):
+                system_db.commit_transaction()
+            if checkpoint is not None:
+                checkpoint.remove()
+        except Exception:
+            # Don't leave a partly written structure
+            system_db.rollback_transaction()
+            raise
+        finally:
+            system_db.deferred_commit = deferred
+            timings.close()
+
+        if screening["n"] > 0:
+            printer.important(
+                __("\n" + self.prescreen_summary(screening), indent=4 * " ")
+            )
+
+        if len(failures) > 0:
+            self.record_failures(failures)
+
+        if sum(prefetched.values()) > 0:
+            printer.important(
+                __(
+                    f"\nResolved {prefetched['resolved']} identifiers with PubChem in "
+                    f"batches; {prefetched['cached']} were already in the PubChem "
+                    f"cache and {prefetched['failed']} could not be resolved.",
+                    indent=4 * " ",
+                )
+            )
+
+        if skipped["checkpoint"] + skipped["existing"] > 0:
+            printer.important(
+                __(
+                    f"\nSkipped {skipped['checkpoint']} entries done in a previous "
+                    f"run, according to the checkpoint, and {skipped['existing']} "
+                    "entries already in the database.",
+                    indent=4 * " ",
+                )
+            )
+
+        text = f"Created {n_structures} molecular structures"
+        if len(notations) > 0:
+            tmp = ", ".join(f"{n} from {key}" for key, n in notations.items())
+            text += f" ({tmp})"
+        text += "."
+        if stats.get("workers", 1) > 1:
+            text += f" The structures were built using {stats['workers']} processes."
+        if len(failures) > 0:
+            text += (
+                f" {len(failures)} entries could not be created and were skipped. "
+                "They are listed in failures.tsv."
+            )
+        if cache_results["duplicate"] > 0:
+            text += (
+                f" {cache_results['duplicate']} entries were duplicates of earlier "
+                "ones, and reused their structures."
+            )
+        if cache_results["hit"] + cache_results["miss"] > 0:
+            text += (
+                f" The conformer cache had {cache_results['hit']} hits and "
+                f"{cache_results['miss']} misses."
+            )
+        if timings.n > 0:
+            text += " " + timings.summary()
+        printer.important(__("\n" + text, indent=4 * " "))
         printer.important("")
 
-        if flavor == "openbabel":
+        with timers("citations"):
+            self.cite(flavors)
+
+    def record_failures(self, failures):
+        """Write the entries that failed to the file failures.tsv.
+
+        Parameters
+        ----------
+        failures : [(int, str, str)]
+            The line number, input string and error message for each failure.
+        """
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / "failures.tsv", "w") as fd:
+            fd.write("# line\tinput\terror\n")
+            for lineno, text, error in failures:
+                error = " ".join(str(error).split())
+                fd.write(f"{lineno}\t{text}\t{error}\n")
+
+    def add_key_property(self, system_db):
+        """Add the property for the key of the input of each structure.
+
+        Parameters
+        ----------
+        system_db : molsystem.SystemDB
+            The system database.
+        """
+        system_db.properties.add(
+            KEY_PROPERTY,
+            "str",
+            description="The canonical form of the input to FromSMILES.",
+            noerror=True,
+        )
+
+    def checkpoint(self, P, system_db):
+        """The checkpoint for the input file, or None if not checkpointing.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+        system_db : molsystem.SystemDB
+            The system database.
+
+        Returns
+        -------
+        Checkpoint or None
+        """
+        directory = self.options.get("checkpoint_directory", "none")
+        if directory is None or directory == "none":
+            return None
+        return Checkpoint(directory, P["input file"], system_db.filename)
+
+    def existing_index(self, system_db):
+        """The keys of the structures already in the database.
+
+        The keys are those from :func:`from_smiles_step.conversion.duplicate_key`,
+        which are stored with the structures created by this step. For other
+        structures the canonical SMILES with and without stereochemistry are
+        used (see :func:`from_smiles_step.conversion.structure_keys`).
+
+        Parameters
+        ----------
+        system_db : molsystem.SystemDB
+            The system database.
+
+        Returns
+        -------
+        set(str)
+        """
+        stored = {}
+        if system_db.properties.exists(KEY_PROPERTY):
+            pid = system_db.properties.id(KEY_PROPERTY)
+            stored = dict(
+                system_db.db.execute(
+                    "SELECT configuration, value FROM str_data WHERE property = ?",
+                    (pid,),
+                )
+            )
+
+        result = set(stored.values())
+        for system in system_db.systems:
+            for configuration in system.configurations:
+                if configuration.id not in stored:
+                    result.update(structure_keys(configuration))
+        return result
+
+    def skip_existing(self, entries, notation, system_db, checkpoint, keys, skipped):
+        """Skip the entries that are done or already in the database.
+
+        Parameters
+        ----------
+        entries : iterator of (int, str, str)
+            The line number, input string, and title of each entry.
+        notation : str
+            The line notation, or "perceive" to determine it from each entry.
+        system_db : molsystem.SystemDB
+            The system database.
+        checkpoint : Checkpoint or None
+            The checkpoint of the entries done in a previous run.
+        keys : dict(int, str)
+            The key of each entry not skipped, by line number, updated as the
+            entries are read.
+        skipped : dict(str, int)
+            The number of entries skipped due to the "checkpoint" or because
+            they are "existing" in the database, updated as the entries are read.
+
+        Returns
+        -------
+        iterator of (int, str, str)
+            The entries that are not skipped.
+        """
+        done = 0 if checkpoint is None else checkpoint.line
+        with timers("index of existing structures"):
+            index = self.existing_index(system_db)
+        for lineno, text, title in entries:
+            if lineno <= done:
+                skipped["checkpoint"] += 1
+                continue
+            with timers("skip existing"):
+                key = duplicate_key(text, notation)
+            if key in index:
+                skipped["existing"] += 1
+                continue
+            keys[lineno] = key
+            yield lineno, text, title
+
+    def prescreen(self, entries, screening, chunksize=10000):
+        """Check the notation and syntax of the input strings, a chunk at a time.
+
+        Parameters
+        ----------
+        entries : iterator of (int, str, str)
+            The line number, input string, and title of each entry.
+        screening : dict(str, any)
+            The number of entries "n", the "counts" of each notation code, and
+            the line numbers of "bad" entries with syntax errors, updated as the
+            entries are screened.
+        chunksize : int = 10000
+            The number of entries to screen at a time.
+
+        Returns
+        -------
+        iterator of (int, str, str)
+            The entries.
+        """
+        counts = screening["counts"]
+        while True:
+            chunk = list(itertools.islice(entries, chunksize))
+            if len(chunk) == 0:
+                break
+            with timers("prescreen"):
+                codes, errors = classify_many([text for _, text, _ in chunk])
+            for code in codes:
+                counts[code] = counts.get(code, 0) + 1
+            screening["n"] += len(chunk)
+            screening["bad"].extend(
+                lineno for (lineno, _, _), error in zip(chunk, errors) if error
+            )
+            yield from chunk
+
+    def prefetch_pubchem(self, entries, P, settings, counts, chunksize=1000):
+        """Resolve the identifiers that need PubChem in batches, a chunk at a time.
+
+        The names, CIDs and InChIKeys whose first resolver in the chain uses
+        PubChem are resolved together for each chunk of entries, filling the
+        PubChem cache, before the entries are passed on to be built.
+
+        Parameters
+        ----------
+        entries : iterator of (int, str, str)
+            The line number, input string, and title of each entry.
+        P : dict(str, any)
+            The current values of the control parameters.
+        settings : dict(str, any)
+            The settings for the resolvers and caches.
+        counts : dict(str, int)
+            The numbers of identifiers "resolved", "cached" and "failed",
+            updated as the entries are read.
+        chunksize : int = 1000
+            The number of entries to resolve at a time.
+
+        Returns
+        -------
+        iterator of (int, str, str)
+            The entries.
+        """
+        batch = PubChemBatch(settings, **self.pubchem_batch_options(settings))
+        if len(batch.notations(P["smiles flavor"])) == 0:
+            yield from entries
+            return
+
+        try:
+            while True:
+                chunk = list(itertools.islice(entries, chunksize))
+                if len(chunk) == 0:
+                    break
+                result = batch.resolve_inputs(
+                    [text for _, text, _ in chunk], P["notation"], P["smiles flavor"]
+                )
+                for key, value in result.items():
+                    counts[key] += value
+                yield from chunk
+        finally:
+            batch.close()
+
+    def use_pubchem_batch(self, settings):
+        """Whether to resolve the identifiers with PubChem in batches.
+
+        Parameters
+        ----------
+        settings : dict(str, any)
+            The settings for the resolvers and caches.
+
+        Returns
+        -------
+        bool
+        """
+        return (
+            self.options.get("pubchem_batch", "yes") == "yes"
+            and settings["pubchem cache"] is not None
+            and not settings["offline"]
+        )
+
+    def pubchem_batch_options(self, settings):
+        """The arguments for resolving identifiers with PubChem in batches.
+
+        Parameters
+        ----------
+        settings : dict(str, any)
+            The settings for the resolvers and caches.
+
+        Returns
+        -------
+        dict(str, any)
+            The "concurrency", "rate" and "batch_size".
+        """
+        return {
+            "concurrency": int(self.options.get("pubchem_concurrency", 4)),
+            "rate": settings["pubchem rate"],
+            "batch_size": int(self.options.get("pubchem_batch_size", 100)),
+        }
+
+    def loop_table(self, P):
+        """The table and column that the input string comes from in a loop.
+
+        In a loop over the rows of a table, the input string is typically a
+        variable or expression such as "$_row['name']". The table is found
+        among the variables as the one whose value in the current row is the
+        input string.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+
+        Returns
+        -------
+        (seamm.Table, str) or None
+            The table and the column, or None if the input string is not from
+            a table.
+        """
+        raw = self.parameters["smiles string"].value
+        text = P["smiles string"]
+        if not isinstance(raw, str) or raw[0:1] not in ("$", "="):
+            return None
+        if not isinstance(text, str) or text.strip() == "":
+            return None
+
+        # The column may be named in the expression, e.g. $_row['name']
+        match = row_column_re.search(raw)
+        column = None if match is None else match.group("column")
+
+        for value in list(seamm.flowchart_variables._data.values()):
+            if not isinstance(value, seamm.Table) or value.current_row is None:
+                continue
+            columns = value.columns if column is None else [column]
+            for name in columns:
+                try:
+                    cell = value.get_cell(name)
+                except Exception:
+                    continue
+                if str(cell).strip() == text.strip():
+                    return value, name
+        return None
+
+    def prefetch_loop(self, P, settings):
+        """Resolve the input strings of later iterations of a loop in the background.
+
+        The first time the step runs in a loop over a table, the inputs in the
+        rest of the table are handed to a background thread that resolves
+        those needing PubChem, filling the PubChem cache ahead of the loop.
+        With a time limit the structures are built in forked processes, so the
+        step waits for the thread to finish first (see
+        :meth:`wait_for_background`).
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+        settings : dict(str, any)
+            The settings for the resolvers and caches.
+        """
+        if not self.use_pubchem_batch(settings):
+            return
+        found = self.loop_table(P)
+        if found is None:
+            return
+        table, column = found
+        if (table.name, column) in self._prefetched_tables:
+            return
+        self._prefetched_tables.add((table.name, column))
+
+        upcoming = []
+        current = table.current_row
+        after = False
+        for row, values in table.rows():
+            if after:
+                text = values[column]
+                if isinstance(text, str) and text.strip() != "":
+                    upcoming.append(text.strip())
+            elif row == current:
+                after = True
+        if len(upcoming) == 0:
+            return
+
+        if self._background is None:
+            self._background = BackgroundBatch(
+                settings,
+                notation=P["notation"],
+                flavor=P["smiles flavor"],
+                **self.pubchem_batch_options(settings),
+            )
+        self._background.submit(upcoming)
+        printer.normal(
+            __(
+                f"\nResolving the {len(upcoming)} inputs in the rest of the table "
+                f"'{table.name}' with PubChem in the background.",
+                indent=4 * " ",
+            )
+        )
+
+    def wait_for_background(self):
+        """Wait for the inputs being resolved in the background, if any.
+
+        This is needed before forking processes, i.e. for a time limit or
+        several workers, since a child forked while the background thread
+        holds a lock or is using SQLite may hang.
+        """
+        if self._background is not None and self._background.busy:
+            with timers("wait for background"):
+                self._background.wait()
+
+    def prescreen_summary(self, screening):
+        """The summary of the screening of the input strings.
+
+        Parameters
+        ----------
+        screening : dict(str, any)
+            The results from :meth:`prescreen`.
+
+        Returns
+        -------
+        str
+        """
+        tmp = ", ".join(
+            f"{n} {notations[code]}" for code, n in sorted(screening["counts"].items())
+        )
+        text = f"Pre-screened the {screening['n']} entries: {tmp}."
+
+        bad = screening["bad"]
+        if len(bad) > 0:
+            text += (
+                f" {len(bad)} entries appear to have syntax errors, e.g. line(s) "
+                + ", ".join(str(lineno) for lineno in bad[:5])
+                + "."
+            )
+        return text
+
+    def conversion_settings(self, P):
+        """The settings for the resolvers and caches.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+
+        Returns
+        -------
+        dict(str, any)
+            The settings as described in :func:`from_smiles_step.conversion.convert`
+        """
+        # The options are only set when run by SEAMM, so default to no caches.
+        options = self.options
+        result = {}
+
+        result["resolvers"] = expand_chain(P["resolvers"])
+        result["pubchem 3d"] = P["3-D coordinates"] == "from PubChem if available"
+        if result["pubchem 3d"]:
+            # PubChem 3D makes the same requests as these, and more
+            result["resolvers"] = ["PubChem 3D"] + [
+                name
+                for name in result["resolvers"]
+                if name.lower() not in ("pubchem name", "pubchem cid")
+            ]
+        path = options.get("dictionary", "default")
+        if path is None or path == "default":
+            result["dictionary"] = None
+        else:
+            result["dictionary"] = str(Path(path).expanduser())
+
+        path = options.get("conformer_cache", "none")
+        if path is None or path.lower() == "none":
+            result["conformer cache"] = None
+        else:
+            result["conformer cache"] = str(Path(path).expanduser())
+        result["conformer cache size"] = int(
+            options.get("conformer_cache_size", 100000)
+        )
+
+        path = options.get("pubchem_cache", "none")
+        if path is None or path.lower() == "none":
+            result["pubchem cache"] = None
+        else:
+            result["pubchem cache"] = str(Path(path).expanduser())
+        result["pubchem cache ttl"] = float(options.get("pubchem_cache_ttl", 30.0))
+        result["offline"] = (
+            options.get("offline", "no") == "yes" or P["resolvers"] == "offline"
+        )
+        url = options.get("pubchem_url", "default")
+        result["pubchem url"] = None if url is None or url == "default" else url
+        result["pubchem rate"] = float(options.get("pubchem_rate", 5.0))
+        result["pubchem timeout"] = float(options.get("pubchem_timeout", 30.0))
+        result["pubchem retries"] = int(options.get("pubchem_retries", 3))
+        result["pubchem backoff"] = float(options.get("pubchem_backoff", 1.0))
+        result["pubchem failure threshold"] = int(
+            options.get("pubchem_failure_threshold", 5)
+        )
+        result["pubchem cooldown"] = float(options.get("pubchem_cooldown", 60.0))
+        path = options.get("pubchem_rate_file", "none")
+        if path is None or path.lower() == "none":
+            result["pubchem rate file"] = None
+        elif path == "default":
+            result["pubchem rate file"] = str(default_rate_file())
+        else:
+            result["pubchem rate file"] = str(Path(path).expanduser())
+
+        path = options.get("failure_cache", "none")
+        if path is None or path.lower() == "none":
+            result["failure cache"] = None
+        else:
+            result["failure cache"] = str(Path(path).expanduser())
+        result["failure cache ttl"] = float(options.get("failure_cache_ttl", 7.0))
+
+        time_limit = P["time limit"]
+        if isinstance(time_limit, str):
+            result["time limit"] = None
+        else:
+            result["time limit"] = time_limit.m_as("s")
+
+        return result
+
+    def create_parser(self):
+        """Setup the command-line / config file parser"""
+        parser_name = self.step_type
+        parser = self.flowchart.parser
+
+        # Remember if the parser exists ... this type of step may have been
+        # found before
+        parser_exists = parser.exists(parser_name)
+
+        # Create the standard options, e.g. log-level
+        result = super().create_parser(name=parser_name)
+
+        if parser_exists:
+            return result
+
+        parser.add_argument(
+            parser_name,
+            "--dictionary",
+            default="default",
+            help=(
+                "A file of chemical names and their SMILES, separated by a tab, for "
+                "the 'dictionary' resolver."
+            ),
+        )
+
+        parser.add_argument(
+            parser_name,
+            "--transaction-size",
+            default=1000,
+            type=int,
+            help=(
+                "The number of structures written to the database in each "
+                "transaction when creating many structures."
+            ),
+        )
+
+        parser.add_argument(
+            parser_name,
+            "--deduplicate",
+            default="yes",
+            choices=["yes", "no"],
+            help=(
+                "Whether to create the structure of each molecule only once when "
+                "creating many structures, reusing it for inputs that are the same "
+                "molecule, e.g. SMILES with a different order of atoms."
+            ),
+        )
+
+        parser.add_argument(
+            parser_name,
+            "--checkpoint-directory",
+            default="~/.seamm.d/cache/from_smiles/checkpoints",
+            help=(
+                "The directory for the checkpoints of the progress through input "
+                "files, used when skipping existing structures, or 'none'."
+            ),
+        )
+
+        # Options for the caches
+        parser.add_argument_group(
+            parser_name,
+            "cache options",
+            "Options for the caches of structures and PubChem responses",
+        )
+        parser.add_argument(
+            parser_name,
+            "--conformer-cache",
+            group="cache options",
+            default="~/.seamm.d/cache/from_smiles/conformers.db",
+            help=(
+                "The cache of 3-D structures, which is shared by all jobs on the "
+                "machine, or 'none' to not use a cache."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--conformer-cache-size",
+            group="cache options",
+            default=100000,
+            type=int,
+            help="The maximum number of structures in the conformer cache.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-cache",
+            group="cache options",
+            default="~/.seamm.d/cache/from_smiles/pubchem.db",
+            help=(
+                "The cache of responses from PubChem, which is shared by all jobs on "
+                "the machine, or 'none' to not use a cache."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-cache-ttl",
+            group="cache options",
+            default=30.0,
+            type=float,
+            help="How long in days to keep responses from PubChem in the cache.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--offline",
+            group="cache options",
+            default="no",
+            choices=["yes", "no"],
+            help="Only use the PubChem cache, never PubChem itself.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-url",
+            group="cache options",
+            default="default",
+            help=(
+                "The base URL of PubChem PUG REST, e.g. of a local stand-in, or "
+                "'default' for PubChem itself."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--failure-cache",
+            group="cache options",
+            default="~/.seamm.d/cache/from_smiles/failures.db",
+            help=(
+                "The cache of inputs that could not be converted, and how, or 'none' "
+                "to not use a cache."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--failure-cache-ttl",
+            group="cache options",
+            default=7.0,
+            type=float,
+            help="How long in days to remember inputs that could not be converted.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--clear-failure-cache",
+            group="cache options",
+            default="no",
+            choices=["yes", "no"],
+            help="Forget all the inputs that could not be converted.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--timing-history",
+            group="cache options",
+            default="~/.seamm.d/cache/from_smiles/timings.db",
+            help=(
+                "The history of the time taken to create structures, used to fit "
+                "the model for scheduling the most expensive first, or 'none'."
+            ),
+        )
+
+        # Options for the requests to PubChem
+        parser.add_argument_group(
+            parser_name,
+            "PubChem options",
+            "Options for the requests to PubChem when creating many structures",
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-batch",
+            group="PubChem options",
+            default="yes",
+            choices=["yes", "no"],
+            help=(
+                "Whether to resolve the names, CIDs and InChIKeys in a batch with "
+                "PubChem together, before building the structures."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-concurrency",
+            group="PubChem options",
+            default=4,
+            type=int,
+            help="The most requests to PubChem at a time.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-rate",
+            group="PubChem options",
+            default=5.0,
+            type=float,
+            help=(
+                "The most requests to PubChem per second, shared by all the jobs "
+                "using the same --pubchem-rate-file."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-rate-file",
+            group="PubChem options",
+            default="default",
+            help=(
+                "The file holding the limit on the rate of requests to PubChem "
+                "shared by the jobs on this computer, 'default' for one in the "
+                "temporary directory, or 'none' to limit each job on its own. The "
+                "circuit breaker for PubChem is shared in a file next to it."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-timeout",
+            group="PubChem options",
+            default=30.0,
+            type=float,
+            help="The timeout of each request to PubChem, in seconds.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-retries",
+            group="PubChem options",
+            default=3,
+            type=int,
+            help=(
+                "The number of times to retry a request to PubChem that timed out "
+                "or found PubChem busy."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-backoff",
+            group="PubChem options",
+            default=1.0,
+            type=float,
+            help=(
+                "The largest random delay before the first retry, in seconds, "
+                "doubling for each further retry."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-failure-threshold",
+            group="PubChem options",
+            default=5,
+            type=int,
+            help=(
+                "The number of failed requests in a row after which PubChem is not "
+                "used for a while, using only the local resolvers, or 0 to always "
+                "use it."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-cooldown",
+            group="PubChem options",
+            default=60.0,
+            type=float,
+            help="How long PubChem is not used after repeated failures, in seconds.",
+        )
+        parser.add_argument(
+            parser_name,
+            "--pubchem-batch-size",
+            group="PubChem options",
+            default=100,
+            type=int,
+            help="The most CIDs or InChIKeys in one request to PubChem.",
+        )
+
+        # Options for the metrics
+        parser.add_argument_group(
+            parser_name,
+            "metrics options",
+            "Options for the counts of the paths taken creating structures",
+        )
+        parser.add_argument(
+            parser_name,
+            "--metrics-database",
+            group="metrics options",
+            default="~/.seamm.d/cache/from_smiles/metrics.db",
+            help=(
+                "The database of the cumulative counts of the notations, resolvers "
+                "and cache outcomes, or 'none'."
+            ),
+        )
+        parser.add_argument(
+            parser_name,
+            "--prometheus-textfile",
+            group="metrics options",
+            default="none",
+            help=(
+                "The file for the cumulative counts in the Prometheus text format, "
+                "e.g. in the directory of the textfile collector, or 'none'."
+            ),
+        )
+
+        return result
+
+    def n_workers(self, P):
+        """The number of processes to use for building structures.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+
+        Returns
+        -------
+        int
+        """
+        n = P["number of processes"]
+        if n == "available":
+            if self.global_options.get("parallelism", "any") == "none":
+                return 1
+            if hasattr(os, "sched_getaffinity"):
+                n = len(os.sched_getaffinity(0))
+            else:
+                n = os.cpu_count()
+            ncores = self.global_options.get("ncores", "available")
+            if ncores != "available":
+                n = min(n, int(ncores))
+        return max(1, int(n))
+
+    def input_entries(self, P):
+        """The entries for a batch of structures.
+
+        Files are read as a stream, so the entries are only read as needed.
+        See :mod:`from_smiles_step.reading` for the formats of files.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the control parameters.
+
+        Returns
+        -------
+        iterator of (int, str, str)
+            The line number, input string, and title of each entry.
+        """
+        if P["input type"] == "file":
+            yield from read_entries(P["input file"])
+        else:
+            lines = P["smiles string"]
+            if isinstance(lines, str):
+                lines = lines.splitlines()
+            for lineno, line in enumerate(lines, start=1):
+                line = str(line).strip()
+                if line != "":
+                    yield lineno, line, ""
+
+    def cite(self, flavors):
+        """Add the citations for the toolkits used.
+
+        Parameters
+        ----------
+        flavors : set(str)
+            The flavors used to create the structures.
+        """
+        if "openbabel" in flavors:
             citations = molsystem.openbabel_citations()
             for i, citation in enumerate(citations, start=1):
                 self.references.cite(
@@ -256,7 +1415,7 @@ class FromSMILES(seamm.Node):
                     level=1,
                     note=f"The principle citation #{i} for OpenBabel.",
                 )
-        elif flavor == "rdkit":
+        if "rdkit" in flavors:
             citations = molsystem.rdkit_citations()
             for i, citation in enumerate(citations, start=1):
                 self.references.cite(
@@ -266,5 +1425,3 @@ class FromSMILES(seamm.Node):
                     level=1,
                     note=f"The principle citation #{i} for RDKit.",
                 )
-
-        return next_node
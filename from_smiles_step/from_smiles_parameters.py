@@ -11,14 +11,34 @@ class FromSMILESParameters(seamm.Parameters):
     """The control parameters for creating a structure from SMILES"""
 
     parameters = {
+        "input type": {
+            "default": "single structure",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": (
+                "single structure",
+                "one structure per line",
+                "file",
+            ),
+            "format_string": "s",
+            "description": "Input type:",
+            "help_text": (
+                "Whether the input is a single structure, several structures one per "
+                "line, or a file of structures. A variable containing a list is "
+                "always treated as several structures."
+            ),
+        },
         "notation": {
             "default": "perceive",
             "kind": "enum",
             "default_units": "",
-            "enumeration": ("perceive", "SMILES", "InChI", "InChIKey", "name"),
+            "enumeration": ("perceive", "SMILES", "InChI", "InChIKey", "CID", "name"),
             "format_string": "s",
             "description": "Input notation:",
-            "help_text": "The line notation used.",
+            "help_text": (
+                "The line notation used. CIDs are PubChem compound ids, e.g. "
+                "'CID:2244' or '2244'."
+            ),
         },
         "smiles string": {
             "default": "",
@@ -29,6 +49,21 @@ class FromSMILESParameters(seamm.Parameters):
             "description": "Input:",
             "help_text": "The input string for the structure.",
         },
+        "input file": {
+            "default": "",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "s",
+            "description": "File:",
+            "help_text": (
+                "The file of structures, one per line. For SMILES files (.smi) "
+                "the first field is the structure and the rest of the line its title. "
+                "CSV (.csv) and TSV (.tsv) files may have a header naming the "
+                "columns, e.g. 'smiles' and 'title'. Files may be compressed with "
+                "gzip (.gz), bzip2 (.bz2), LZMA (.xz) or Zstandard (.zst)."
+            ),
+        },
         "smiles flavor": {
             "default": "rdkit",
             "kind": "string",
@@ -38,6 +73,88 @@ class FromSMILESParameters(seamm.Parameters):
             "description": "SMILES flavor:",
             "help_text": "The flavor of SMILES to use.",
         },
+        "resolvers": {
+            "default": "default",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": ("default", "local-first", "offline"),
+            "format_string": "s",
+            "description": "Resolvers:",
+            "help_text": (
+                "The resolvers to try, in order, to create the structure. Either "
+                "a preset or a comma-separated list of rdkit, openbabel, openeye, "
+                "SMILES (the SMILES flavor), InChI, dictionary, PubChem name, "
+                "PubChem smiles, PubChem InChIKey, and PubChem cid. 'default' "
+                "tries the SMILES flavor then PubChem before Open Babel; "
+                "'local-first' tries the local resolvers first; and 'offline' "
+                "uses only local resolvers and cached PubChem results."
+            ),
+        },
+        "3-D coordinates": {
+            "default": "embed locally",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("embed locally", "from PubChem if available"),
+            "format_string": "s",
+            "description": "3-D coordinates:",
+            "help_text": (
+                "Whether to embed the structures in 3-D with the resolvers, or use "
+                "the 3-D structures that PubChem has for names, InChIKeys and "
+                "CIDs, embedding locally only if PubChem has none."
+            ),
+        },
+        "number of processes": {
+            "default": "available",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("available",),
+            "format_string": "d",
+            "description": "Number of processes:",
+            "help_text": (
+                "The number of processes to use to build the structures when "
+                "there is more than one. 'available' uses the cores allotted to "
+                "the job."
+            ),
+        },
+        "time limit": {
+            "default": "none",
+            "kind": "float",
+            "default_units": "s",
+            "enumeration": ("none",),
+            "format_string": ".1f",
+            "description": "Time limit per structure:",
+            "help_text": (
+                "The time allowed for each way of creating a structure, e.g. RDKit "
+                "or PubChem. If it takes longer, it is stopped and the next way "
+                "tried. 'none' has no limit, and avoids the small cost of running "
+                "each in a separate process."
+            ),
+        },
+        "errors": {
+            "default": "stop",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("stop", "skip the structure"),
+            "format_string": "s",
+            "description": "On errors:",
+            "help_text": (
+                "Whether to stop if a structure can't be created, or skip it and "
+                "continue, listing it in the file failures.tsv."
+            ),
+        },
+        "existing structures": {
+            "default": "create again",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("create again", "skip"),
+            "format_string": "s",
+            "description": "Structures already in the database:",
+            "help_text": (
+                "Whether to create the structures for inputs that are already in "
+                "the database, or skip them, e.g. when rerunning a batch that "
+                "did not finish."
+            ),
+        },
     }
 
     def __init__(self, defaults={}, data=None):
@@ -3,9 +3,11 @@
 """Helper class needed for the stevedore integration. Needs to provide
 a description() method that returns a dict containing a description of
 this node, and a factory() method for creating the graphical and non-graphical
-nodes."""
+nodes.
 
-import from_smiles_step
+SEAMM loads this class for every installed step when it lists the plugins, so
+this module imports nothing heavy: the description is static, and the nodes,
+with seamm, molsystem, the toolkits and Tk, are only imported when created."""
 
 
 class FromSMILESStep(object):
@@ -28,8 +30,12 @@ class FromSMILESStep(object):
 
     def create_node(self, flowchart=None, **kwargs):
         """Return a new node object"""
-        return from_smiles_step.FromSMILES(flowchart=flowchart, **kwargs)
+        from from_smiles_step.from_smiles import FromSMILES
+
+        return FromSMILES(flowchart=flowchart, **kwargs)
 
     def create_tk_node(self, canvas=None, **kwargs):
         """Return the graphical Tk node object"""
-        return from_smiles_step.TkFromSMILES(canvas=canvas, **kwargs)
+        from from_smiles_step.tk_from_smiles import TkFromSMILES
+
+        return TkFromSMILES(canvas=canvas, **kwargs)
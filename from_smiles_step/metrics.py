@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""Counters of the paths taken when creating structures.
+
+Falling back from one resolver to the next, e.g. from RDKit to PubChem, costs
+time, so the counters record how often each path is taken: the notation of
+the input, the resolver that succeeded, the attempts that failed before it,
+and the outcomes of the caches. Each count has a name and labels, in the
+style of Prometheus::
+
+    counters.add("from_smiles_resolver_attempts_total", resolver="rdkit SMILES",
+                 outcome="success")
+
+The counts for a run are written to metrics.json in the step directory, and
+added to the cumulative counts in a database (see
+:class:`from_smiles_step.cache.MetricsStore`), which can be exported as a
+Prometheus textfile for the textfile collector of the node exporter.
+
+The module-level :data:`counters` are those of this process. They are
+guarded by a lock, since a background thread may be counting as well.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The help text of each counter, for Prometheus
+descriptions = {
+    "from_smiles_structures_total": (
+        "Structures created, by notation, whether it was perceived, and flavor."
+    ),
+    "from_smiles_failures_total": "Entries for which no structure could be created.",
+    "from_smiles_resolver_attempts_total": (
+        "Attempts to create a structure, by resolver and outcome."
+    ),
+    "from_smiles_failed_attempts_before_success_total": (
+        "Structures created, by the number of resolvers that failed first."
+    ),
+    "from_smiles_conformer_cache_total": (
+        "Lookups in the conformer cache, and duplicates in the input, by outcome."
+    ),
+    "from_smiles_pubchem_cache_total": "Lookups in the PubChem cache, by outcome.",
+    "from_smiles_pubchem_requests_total": "Requests to PubChem, by HTTP status.",
+    "from_smiles_pubchem_queued_total": (
+        "Requests to PubChem that waited for the limit on the rate."
+    ),
+    "from_smiles_pubchem_retries_total": "Requests to PubChem that were retried.",
+    "from_smiles_pubchem_circuit_open_total": (
+        "Requests not made because PubChem had been failing."
+    ),
+}
+
+
+class Counters(object):
+    """Counts, each with a name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, name, value=1, **labels):
+        """Add to a count.
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter.
+        value : int = 1
+            The amount to add.
+        labels : str
+            The labels of the count.
+        """
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + value
+
+    def get(self, name, **labels):
+        """The value of a count, or 0 if it has not been added to."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            return self._counts.get(key, 0)
+
+    def clear(self):
+        """Remove all the counts."""
+        with self._lock:
+            self._counts = {}
+
+    def state(self):
+        """The counts, as plain data for sending between processes.
+
+        Returns
+        -------
+        dict((str, tuple), int)
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def merge(self, state):
+        """Add the counts from other counters.
+
+        Parameters
+        ----------
+        state : dict((str, tuple), int)
+            The state of the other counters, from :meth:`state`.
+        """
+        with self._lock:
+            for key, value in state.items():
+                self._counts[key] = self._counts.get(key, 0) + value
+
+    def as_dict(self):
+        """The counts, grouped by name.
+
+        Returns
+        -------
+        dict(str, [dict(str, any)])
+            The "labels" and "value" of each count with the name.
+        """
+        result = {}
+        for (name, labels), value in sorted(self.state().items()):
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def prometheus(self):
+        """The counts in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+        """
+        lines = []
+        for name, counts in self.as_dict().items():
+            if name in descriptions:
+                lines.append(f"# HELP {name} {descriptions[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for count in counts:
+                labels = ",".join(
+                    f'{k}="{_escape(v)}"' for k, v in count["labels"].items()
+                )
+                if labels != "":
+                    labels = "{" + labels + "}"
+                lines.append(f"{name}{labels} {count['value']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    """Escape the value of a label for Prometheus."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_json(path, run, cumulative=None):
+    """Write the counts to a JSON file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The file.
+    run : Counters
+        The counts for this run.
+    cumulative : Counters = None
+        The cumulative counts, if any.
+    """
+    data = {"run": run.as_dict()}
+    if cumulative is not None:
+        data["cumulative"] = cumulative.as_dict()
+    with open(path, "w") as fd:
+        json.dump(data, fd, indent=4)
+
+
+def write_prometheus(path, counters):
+    """Write a Prometheus textfile, replacing any existing one atomically.
+
+    The textfile collector may read the file at any time, so it is written
+    to a temporary file and renamed.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The file, which should end in ".prom".
+    counters : Counters
+        The counts, which should be cumulative.
+    """
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(counters.prometheus())
+    os.replace(tmp, path)
+
+
+# The counters for this process
+counters = Counters()
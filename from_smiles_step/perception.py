@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+"""Perceiving the line notation of strings, without using a toolkit.
+
+The classifier recognizes InChIKeys, InChI, PubChem CIDs and CAS registry
+numbers by their form, and uses a lexer for the SMILES grammar to tell SMILES
+from chemical names. It returns a confidence with the notation, so that
+ambiguous strings can be tried both ways, while clear names go straight to
+name resolution and clear SMILES are never looked up as names.
+
+For large inputs, :func:`classify_many` pre-screens a whole column of strings
+with a single pass of a compiled regular expression over the joined strings,
+returning arrays of notation codes and syntax-error flags.
+"""
+
+from array import array
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+inchikey_re = re.compile(r"^[A-Z]{14}-[A-Z]{10}-[A-Z]$")
+inchi_re = re.compile(r"^InChI=1S?/")
+cid_re = re.compile(r"^(?:CID\s*[:=]?\s*)?(\d{1,10})$", re.IGNORECASE)
+cas_re = re.compile(r"^(\d{2,7})-(\d{2})-(\d)$")
+
+# The tokens of SMILES. Bracket atoms are checked more carefully below.
+smiles_token_re = re.compile(
+    r"(\[[^\[\]]+\])"  # bracket atom
+    r"|(Br|Cl|B|C|N|O|P|S|F|I|b|c|n|o|p|s|\*)"  # organic subset atom
+    r"|(%\d\d|\d)"  # ring closure
+    r"|([-=#$:/\\])"  # bond
+    r"|(\()|(\))"  # branches
+    r"|(\.)"  # disconnected parts
+)
+bracket_atom_re = re.compile(
+    r"^\[(\d+)?"  # isotope
+    r"([A-Z][a-z]?|[bcnops]|se|as|te|\*)"  # element
+    r"(@(?:@|TH[12]|AL[12]|SP[1-3]|TB\d{1,2}|OH\d{1,2})?)?"  # chirality
+    r"(H\d?)?"  # hydrogens
+    r"([+-]+\d*)?"  # charge
+    r"(:\d+)?\]$"  # atom class
+)
+
+# Characters that only appear in SMILES, not in names
+smiles_only = set("=#[]@\\/%")
+
+# The notations for the codes returned by classify_many
+notations = ("name", "SMILES", "InChI", "InChIKey", "CID", "CAS")
+codes = {notation: code for code, notation in enumerate(notations)}
+
+# The characters of SMILES, but not their order. Each alternative starts with
+# a different character, so a string that is not SMILES fails without the
+# exponential backtracking of nested repeats, and without the possessive
+# quantifiers that need Python 3.11.
+_smiles_chars = (
+    r"(?=[BCNOPSFIbcnops*\[])"
+    r"(?:[BCNOPSFIbcnops*%\d=#$:/\\().-]|\[[^\[\]\n]+\]|(?<=C)l|(?<=B)r)+"
+)
+smiles_chars_re = re.compile(_smiles_chars)
+
+# One match per line of the joined strings, with the notation as the group name
+line_re = re.compile(
+    r"^[ \t]*(?:"
+    r"(?P<InChIKey>[A-Z]{14}-[A-Z]{10}-[A-Z])"
+    r"|(?P<InChI>InChI=1S?/[^\n]*?)"
+    r"|(?P<CID>(?:[Cc][Ii][Dd][ \t]*[:=]?[ \t]*)?\d{1,10})"
+    r"|(?P<CAS>\d{2,7}-\d{2}-\d)"
+    rf"|(?P<SMILES>{_smiles_chars})"
+    r"|(?P<broken>[^\n]*?[=#\[\]@\\/%][^\n]*?)"
+    r"|(?P<name>[^\n]*?)"
+    r")[ \t]*$",
+    re.MULTILINE,
+)
+bracket_atom_sub_re = re.compile(r"\[[^\[\]\n]*\]")
+# Ring closures, but not the digits in bracket atoms
+ring_re = re.compile(r"%\d\d|\d(?![^\[]*\])")
+# Deletes everything but the digits and newlines from bytes
+_not_digits = bytes(c for c in range(256) if not (48 <= c <= 57 or c == 10))
+
+
+def looks_like_word(text):
+    """Whether a string looks like a short word, e.g. "Co", rather than SMILES.
+
+    Such words, e.g. "Co", "No" or "Cl", are valid SMILES of the organic
+    subset, but are more likely names or element symbols.
+
+    Parameters
+    ----------
+    text : str
+        The string.
+
+    Returns
+    -------
+    bool
+    """
+    text = text.strip()
+    return len(text) <= 3 and text.isalpha() and text.istitle()
+
+
+def classify(text):
+    """Classify the line notation of a string.
+
+    Parameters
+    ----------
+    text : str
+        The string.
+
+    Returns
+    -------
+    (str, float)
+        The notation -- "InChIKey", "InChI", "CID", "CAS", "SMILES" or
+        "name" -- and the confidence, from 0 to 1.
+    """
+    text = text.strip()
+    if text == "":
+        return "name", 0.0
+
+    if inchikey_re.match(text):
+        return "InChIKey", 1.0
+    if inchi_re.match(text):
+        return "InChI", 1.0
+
+    match = cid_re.match(text)
+    if match:
+        # A bare number is not a valid SMILES, but might be a name
+        return "CID", 1.0 if text[0].upper() == "C" else 0.9
+
+    match = cas_re.match(text)
+    if match:
+        if cas_check_digit_ok(*match.groups()):
+            return "CAS", 1.0
+        return "name", 0.9
+
+    n_atoms, error = lex_smiles(text)
+    if error is None:
+        # Valid SMILES. Plain words made of the organic subset, e.g. "CON", are
+        # the only ambiguity.
+        if any(c in smiles_only for c in text) or any(c.isdigit() for c in text):
+            return "SMILES", 1.0
+        if looks_like_word(text):
+            return "SMILES", 0.6
+        if "(" in text or n_atoms <= 2:
+            return "SMILES", 0.95
+        if text.isupper() or text.islower():
+            return "SMILES", 0.9
+        return "SMILES", 0.7
+
+    # Not valid SMILES, so a name if it looks like one. A string of SMILES
+    # characters, or with characters only used in SMILES, is more likely a
+    # broken SMILES.
+    if smiles_chars_re.fullmatch(text) or any(c in smiles_only for c in text):
+        return "SMILES", 0.5
+    if " " in text or any(c.isalpha() for c in text):
+        return "name", 0.95
+    return "name", 0.5
+
+
+def classify_many(texts):
+    """Classify the line notation of many strings at once.
+
+    This is a pre-screen for large inputs. The strings are joined and matched
+    in one pass of a regular expression, which checks the characters of SMILES
+    but not their order. SMILES then get cheap checks that the branches
+    balance and the ring closures pair, the latter using the digits of all the
+    strings, extracted at once. The full grammar of SMILES is only checked by
+    :func:`classify`, so a few strings that pass here may still be invalid.
+
+    Parameters
+    ----------
+    texts : [str]
+        The strings, which must not contain newlines.
+
+    Returns
+    -------
+    (array.array, array.array)
+        The code of the notation of each string, indexing ``notations``, and a
+        flag that is 1 if the string has a syntax error.
+    """
+    buffer = "\n".join(texts)
+    if buffer.count("\n") != max(0, len(texts) - 1):
+        raise ValueError("The strings for classify_many can not contain newlines.")
+
+    # The digits outside bracket atoms in each string, for the ring closures
+    digits = (
+        bracket_atom_sub_re.sub("", buffer)
+        .encode("ascii", "replace")
+        .translate(None, _not_digits)
+        .split(b"\n")
+    )
+
+    n = len(texts)
+    result = array("b", bytes(n))
+    errors = array("b", bytes(n))
+    smiles = codes["SMILES"]
+    cas = codes["CAS"]
+    name = codes["name"]
+    for i, match in enumerate(line_re.finditer(buffer)):
+        group = match.lastgroup
+        if group == "SMILES":
+            result[i] = smiles
+            text = match.group(group)
+            if text.count("(") != text.count(")") or text[-1] in "-=#$:/\\(.":
+                errors[i] = 1
+            elif "%" in text:
+                rings = ring_re.findall(text)
+                if any(rings.count(ring) % 2 for ring in set(rings)):
+                    errors[i] = 1
+            elif digits[i]:
+                # Each digit must appear an even number of times
+                ring = bytes(sorted(digits[i]))
+                if ring[::2] != ring[1::2]:
+                    errors[i] = 1
+        elif group == "name":
+            if match.end() == match.start():
+                errors[i] = 1
+        elif group == "broken":
+            result[i] = smiles
+            errors[i] = 1
+        elif group == "CAS":
+            if cas_check_digit_ok(*match.group(group).split("-")):
+                result[i] = cas
+            else:
+                result[i] = name
+                errors[i] = 1
+        else:
+            result[i] = codes[group]
+    return result, errors
+
+
+def cas_check_digit_ok(first, second, check):
+    """Whether the check digit of a CAS registry number is correct.
+
+    Parameters
+    ----------
+    first, second, check : str
+        The three parts of the number.
+
+    Returns
+    -------
+    bool
+    """
+    digits = (first + second)[::-1]
+    total = sum((i + 1) * int(d) for i, d in enumerate(digits))
+    return total % 10 == int(check)
+
+
+def lex_smiles(text):
+    """Check that a string follows the grammar of SMILES.
+
+    This checks the tokens, branches and ring closures, but not chemistry such
+    as valences or aromaticity.
+
+    Parameters
+    ----------
+    text : str
+        The string.
+
+    Returns
+    -------
+    (int, str or None)
+        The number of atoms, and an error message or None if the string is
+        valid.
+    """
+    n_atoms = 0
+    depth = 0
+    rings = set()
+    previous = None  # The kind of the previous token
+    position = 0
+    for match in smiles_token_re.finditer(text):
+        if match.start() != position:
+            return n_atoms, f"Invalid character at {position}"
+        position = match.end()
+
+        bracket, atom, ring, bond, open_, close, dot = match.groups()
+        if bracket is not None:
+            if bracket_atom_re.match(bracket) is None:
+                return n_atoms, f"Invalid bracket atom {bracket}"
+            n_atoms += 1
+            kind = "atom"
+        elif atom is not None:
+            n_atoms += 1
+            kind = "atom"
+        elif ring is not None:
+            if previous not in ("atom", "ring", "bond"):
+                return n_atoms, f"Ring closure {ring} not after an atom"
+            rings ^= {ring}
+            kind = "ring"
+        elif bond is not None:
+            if previous not in ("atom", "ring", "close", "open"):
+                return n_atoms, f"Bond {bond} not after an atom"
+            kind = "bond"
+        elif open_ is not None:
+            if previous not in ("atom", "ring", "close"):
+                return n_atoms, "Branch not after an atom"
+            depth += 1
+            kind = "open"
+        elif close is not None:
+            if previous not in ("atom", "ring", "close") or depth == 0:
+                return n_atoms, "Unbalanced or empty branch"
+            depth -= 1
+            kind = "close"
+        else:
+            if previous not in ("atom", "ring", "close") or depth != 0:
+                return n_atoms, "Misplaced '.'"
+            kind = "dot"
+        previous = kind
+
+    if position != len(text):
+        return n_atoms, f"Invalid character at {position}"
+    if previous not in ("atom", "ring", "close"):
+        return n_atoms, "Incomplete SMILES"
+    if depth != 0:
+        return n_atoms, "Unbalanced branches"
+    if len(rings) != 0:
+        return n_atoms, "Unclosed rings " + ", ".join(sorted(rings))
+    return n_atoms, None
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+"""Cached access to the PubChem PUG REST service.
+
+These functions replace the PubChem methods of the configuration,
+e.g. ``PC_from_identifier()``, with versions that first look in a persistent
+cache of the responses (see :class:`from_smiles_step.cache.PubChemCache`). In
+offline mode only the cache is used, and anything not in it is an error.
+The requests that are made wait their turn in the limit on the rate shared
+by the jobs on this host (see :mod:`from_smiles_step.ratelimit`), are retried
+with backoff if they time out or PubChem is busy, and stop for a while if
+PubChem fails repeatedly (see :mod:`from_smiles_step.retry`).
+
+The settings are a dictionary as described in
+:func:`from_smiles_step.conversion.convert`.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import time
+from urllib.parse import quote as url_quote
+
+import molsystem.pubchem
+import requests
+
+from from_smiles_step.cache import get_cache, PubChemCache
+from from_smiles_step.metrics import counters
+from from_smiles_step.ratelimit import SharedTokenBucket
+from from_smiles_step.retry import (
+    backoff_delay,
+    CircuitBreaker,
+    CircuitOpenError,
+    SharedCircuitBreaker,
+)
+from from_smiles_step.timing import timers
+
+logger = logging.getLogger(__name__)
+
+# The circuit breakers of this process, by process and URL of PubChem
+_breakers = {}
+
+
+class OfflineError(RuntimeError):
+    """The request is not in the cache, and PubChem may not be used."""
+
+
+class NotFoundError(RuntimeError):
+    """PubChem does not have the identifier, or the record asked for."""
+
+
+def _cache(settings):
+    """The PubChem cache for the settings, or None."""
+    if settings is None or settings.get("pubchem cache") is None:
+        return None
+    return get_cache(
+        PubChemCache, settings["pubchem cache"], ttl=settings["pubchem cache ttl"]
+    )
+
+
+def _bucket(settings):
+    """The limit on the rate of requests shared by the jobs on this host, or None."""
+    if settings is None or settings.get("pubchem rate file") is None:
+        return None
+    return get_cache(
+        SharedTokenBucket,
+        settings["pubchem rate file"],
+        rate=settings.get("pubchem rate", 5.0),
+    )
+
+
+def _breaker(settings):
+    """The circuit breaker for PubChem in this process, or None.
+
+    If there is a file for the shared limit on the rate, the state of the
+    breaker is kept in a file next to it, so that it is shared with the forked
+    processes and the other jobs on this host.
+    """
+    if settings is None or not settings.get("pubchem failure threshold"):
+        return None
+    url = pug_url(settings)
+    key = (os.getpid(), url)
+    if key not in _breakers:
+        threshold = settings["pubchem failure threshold"]
+        cooldown = settings.get("pubchem cooldown", 60.0)
+        if settings.get("pubchem rate file") is None:
+            _breakers[key] = CircuitBreaker(
+                "PubChem", threshold=threshold, cooldown=cooldown
+            )
+        else:
+            # One file for each URL, since e.g. a stand-in is not PubChem
+            digest = hashlib.sha1(url.encode()).hexdigest()[0:12]
+            path = Path(settings["pubchem rate file"]).expanduser()
+            _breakers[key] = SharedCircuitBreaker(
+                path.with_name(f"{path.stem}.{digest}.breaker"),
+                "PubChem",
+                threshold=threshold,
+                cooldown=cooldown,
+            )
+    return _breakers[key]
+
+
+def pug_url(settings=None):
+    """The base URL of PUG REST, from the settings or molsystem's default.
+
+    Parameters
+    ----------
+    settings : dict(str, any) = None
+        The settings, possibly with the "pubchem url", e.g. of a stand-in (see
+        :mod:`from_smiles_step.pubchem_standin`).
+
+    Returns
+    -------
+    str
+    """
+    if settings is not None and settings.get("pubchem url") is not None:
+        return settings["pubchem url"]
+    return molsystem.pubchem.pug_url
+
+
+def _normalize(namespace, identifier):
+    """Chemical names are not case-sensitive, so use a standard form for the key."""
+    identifier = str(identifier).strip()
+    if namespace.split(":")[0] == "name":
+        identifier = identifier.lower()
+    return identifier
+
+
+def get(url, namespace, identifier, settings=None):
+    """Get a response from PubChem, using the cache if possible.
+
+    Parameters
+    ----------
+    url : str
+        The URL for the request.
+    namespace : str
+        The namespace for the cache, e.g. "name" or "smiles".
+    identifier : str
+        The identifier in the namespace.
+    settings : dict(str, any) = None
+        The settings for the cache and offline mode.
+
+    Returns
+    -------
+    str or None
+        The text of the response, or None if PubChem does not have the
+        identifier.
+    """
+    cache = _cache(settings)
+    key = _normalize(namespace, identifier)
+    if cache is not None:
+        with timers("PubChem cache"):
+            response = cache.get(namespace, key)
+        if response is not None:
+            counters.add("from_smiles_pubchem_cache_total", outcome="hit")
+            return response
+        counters.add("from_smiles_pubchem_cache_total", outcome="miss")
+
+    if settings is not None and settings.get("offline", False):
+        raise OfflineError(
+            f"The {namespace} '{identifier}' is not in the PubChem cache, and "
+            "PubChem can't be used offline."
+        )
+
+    breaker = _breaker(settings)
+    if breaker is not None:
+        try:
+            breaker.check()
+        except CircuitOpenError:
+            counters.add("from_smiles_pubchem_circuit_open_total")
+            raise
+
+    retries = 0 if settings is None else settings.get("pubchem retries", 0)
+    attempt = 0
+    while True:
+        try:
+            response = _request(url, namespace, identifier, settings)
+        except (
+            molsystem.pubchem.PubChemUnavailableError,
+            requests.RequestException,
+        ) as e:
+            # Only timeouts, lost connections and a busy PubChem may pass
+            transient = isinstance(
+                e, (requests.ConnectionError, requests.Timeout)
+            ) or getattr(e, "status", None) in (429, 500, 502, 503, 504)
+            if attempt >= retries or not transient:
+                if breaker is not None:
+                    breaker.failure()
+                raise
+            delay = getattr(e, "retry_after", None)
+            if delay is None:
+                delay = backoff_delay(
+                    attempt, base=settings.get("pubchem backoff", 1.0)
+                )
+            logger.info(f"Retrying PubChem in {delay:.1f} s: {e}")
+            counters.add("from_smiles_pubchem_retries_total")
+            with timers("PubChem backoff"):
+                time.sleep(delay)
+            attempt += 1
+        else:
+            break
+    if breaker is not None:
+        breaker.success()
+    if response.status_code != 200:
+        return None
+
+    if cache is not None:
+        cache.put(namespace, key, response.text)
+    return response.text
+
+
+def _request(url, namespace, identifier, settings=None):
+    """Make one request to PubChem, within the limit on the rate.
+
+    Parameters
+    ----------
+    url : str
+        The URL for the request.
+    namespace : str
+        The namespace, for messages.
+    identifier : str
+        The identifier, for messages.
+    settings : dict(str, any) = None
+        The settings for the limit on the rate and the timeout.
+
+    Returns
+    -------
+    requests.Response
+        The response, which is either successful or a client error such as
+        404 if PubChem does not have the identifier.
+
+    Raises
+    ------
+    molsystem.pubchem.PubChemUnavailableError
+        If PubChem is throttling or blocking the requests or is unavailable,
+        with the HTTP "status" and any "retry_after" delay in seconds.
+    requests.RequestException
+        If there is a timeout or the connection fails.
+    """
+    bucket = _bucket(settings)
+    if bucket is not None:
+        with timers("PubChem queue"):
+            if bucket.acquire() > 0.0:
+                counters.add("from_smiles_pubchem_queued_total")
+
+    timeout = 30.0 if settings is None else settings.get("pubchem timeout", 30.0)
+    with timers("PubChem request"):
+        try:
+            response = requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            counters.add(
+                "from_smiles_pubchem_requests_total",
+                status="timeout" if isinstance(e, requests.Timeout) else "error",
+            )
+            raise
+    code = response.status_code
+    counters.add("from_smiles_pubchem_requests_total", status=code)
+    if code in (403, 429) or code >= 500:
+        error = molsystem.pubchem.PubChemUnavailableError(
+            f"PubChem returned HTTP {code} for {namespace} '{identifier}'; the "
+            "service is throttled, blocked or unavailable."
+        )
+        error.status = code
+        try:
+            error.retry_after = min(60.0, float(response.headers["Retry-After"]))
+        except (KeyError, ValueError):
+            error.retry_after = None
+        raise error
+    return response
+
+
+def from_identifier(
+    configuration, identifier, namespace, properties="all", settings=None
+):
+    """Create the configuration from the PubChem 3-D structure.
+
+    Parameters
+    ----------
+    configuration : molsystem._Configuration
+        The configuration to put the structure in.
+    identifier : str
+        The identifier, e.g. chemical name.
+    namespace : str
+        The PubChem namespace: cid, name, smiles, inchi, inchikey
+    properties : str = "all"
+        Whether to include all properties or none
+    settings : dict(str, any) = None
+        The settings for the cache and offline mode.
+    """
+    url = (
+        f"{pug_url(settings)}/compound/{namespace}/"
+        f"{url_quote(str(identifier))}/SDF?record_type=3d"
+    )
+    sdf = get(url, namespace, identifier, settings=settings)
+    if sdf is None:
+        raise NotFoundError(f"No 3-D structure available for {identifier}")
+    configuration.from_sdf_text(sdf, properties=properties)
+
+
+def isomeric_smiles(identifier, namespace, settings=None):
+    """The isomeric SMILES of a compound in PubChem.
+
+    Parameters
+    ----------
+    identifier : str
+        The identifier, e.g. chemical name.
+    namespace : str
+        The PubChem namespace: cid, name, smiles, inchi, inchikey
+    settings : dict(str, any) = None
+        The settings for the cache and offline mode.
+
+    Returns
+    -------
+    str
+    """
+    url = (
+        f"{pug_url(settings)}/compound/{namespace}/"
+        f"{url_quote(str(identifier))}/property/IsomericSMILES/TXT"
+    )
+    response = get(url, f"{namespace}:IsomericSMILES", identifier, settings=settings)
+    if response is None:
+        raise NotFoundError(f"PubChem does not have the {namespace} '{identifier}'")
+    smiles = [line.strip() for line in response.splitlines() if line.strip() != ""]
+    if len(smiles) == 0:
+        raise NotFoundError(f"PubChem has no SMILES for the {namespace} '{identifier}'")
+    # A name may match several compounds, the first being the best match
+    return smiles[0]
+
+
+def from_inchikey(configuration, inchikey, settings=None):
+    """Create the configuration from an InChIKey, using the InChI from PubChem.
+
+    Parameters
+    ----------
+    configuration : molsystem._Configuration
+        The configuration to put the structure in.
+    inchikey : str
+        The InChIKey.
+    settings : dict(str, any) = None
+        The settings for the cache and offline mode.
+    """
+    url = f"{pug_url(settings)}/compound/inchikey/{inchikey}/property/InChI/TXT"
+    response = get(url, "inchikey:InChI", inchikey, settings=settings)
+    if response is None:
+        raise RuntimeError(f"InChIKey '{inchikey}' not found in PubChem.")
+
+    inchis = {line.strip() for line in response.splitlines() if line.strip() != ""}
+    if len(inchis) != 1:
+        raise RuntimeError(f"InChIKey '{inchikey}' is not unique in PubChem.")
+    configuration.from_inchi(inchis.pop())
@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+
+"""Resolving many identifiers with PubChem at once, filling the PubChem cache.
+
+Resolving the names in a batch one by one means a blocking request, on a new
+connection, for each molecule, so that 10,000 names take hours. Instead, the
+identifiers that will need PubChem are collected a chunk at a time and
+resolved together before the structures are built:
+
+    * names are turned into CIDs, one request per name, since PubChem does
+      not accept several names in a request,
+    * the 3-D structures of the CIDs are requested many at a time, and
+    * the InChIs of InChIKeys are requested many at a time, with their CIDs
+      so that PubChem's 3-D structures can be fetched too if they are
+      preferred (the "pubchem 3d" setting).
+
+The requests run concurrently in an asyncio event loop, at most a given
+number at a time, on a pool of keep-alive connections, and a token bucket
+keeps the rate within PubChem's limit of 5 requests per second. If there is
+a limit on the rate shared by the jobs on this host (see
+:mod:`from_smiles_step.ratelimit`) it is used instead. The results
+are put in the PubChem cache (see :class:`from_smiles_step.cache.PubChemCache`)
+exactly as if each had been requested on its own, so the resolvers then find
+them there.
+
+When the step runs in a loop, one structure per iteration, the inputs of the
+later iterations are resolved in a background thread instead (see
+:class:`BackgroundBatch`), so that they are in the cache by the time the loop
+reaches them.
+"""
+
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import http.client
+import io
+import logging
+import threading
+import time
+from urllib.parse import quote as url_quote, urlencode, urlsplit
+
+from from_smiles_step.cache import close_caches, FailureCache, get_cache, PubChemCache
+from from_smiles_step.conversion import perceive
+from from_smiles_step.metrics import counters
+from from_smiles_step.perception import cid_re
+from from_smiles_step import pubchem
+from from_smiles_step.resolvers import resolver_chain
+from from_smiles_step.timing import timers
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """A token bucket limiting the rate of requests.
+
+    Parameters
+    ----------
+    rate : float
+        The number of tokens added per second.
+    burst : float = None
+        The most tokens that can be saved up, by default one second's worth.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = max(1.0, rate if burst is None else burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait for a token."""
+        while True:
+            self._refill()
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class ConnectionPool(object):
+    """A pool of keep-alive HTTP connections to one server.
+
+    The connections are used from several threads, each taking an idle
+    connection, or opening a new one, for each request.
+
+    Parameters
+    ----------
+    url : str
+        The base URL of the server, e.g. that of PubChem PUG REST.
+    timeout : float = 30.0
+        The timeout of the connections, in seconds.
+    """
+
+    def __init__(self, url, timeout=30.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self.n_connections = 0
+
+    def _connect(self):
+        self.n_connections += 1
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None):
+        """Make a request, reusing an idle connection if there is one.
+
+        Parameters
+        ----------
+        method : str
+            "GET" or "POST".
+        path : str
+            The path of the URL, after the base URL.
+        body : dict(str, str) = None
+            The form for a POST.
+
+        Returns
+        -------
+        (int, str)
+            The HTTP status and text of the response.
+        """
+        headers = {"Connection": "keep-alive"}
+        if body is not None:
+            body = urlencode(body)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        for attempt in range(2):
+            try:
+                connection = self._idle.pop()
+                reused = True
+            except IndexError:
+                connection = self._connect()
+                reused = False
+            try:
+                connection.request(method, self.base + path, body=body, headers=headers)
+                response = connection.getresponse()
+                text = response.read().decode()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                # The server may have closed an idle connection, so try once more
+                if reused and attempt == 0:
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._idle.append(connection)
+            return response.status, text
+
+    def close(self):
+        """Close the idle connections."""
+        while len(self._idle) > 0:
+            self._idle.pop().close()
+
+
+class PubChemBatch(object):
+    """Resolve many names, CIDs and InChIKeys with PubChem at once.
+
+    Parameters
+    ----------
+    settings : dict(str, any)
+        The settings for the PubChem and failure caches and the URL of
+        PubChem, as described in :func:`from_smiles_step.conversion.convert`.
+    concurrency : int = 4
+        The most requests at a time.
+    rate : float = 5.0
+        The most requests per second.
+    batch_size : int = 100
+        The most CIDs or InChIKeys in one request.
+    """
+
+    def __init__(self, settings, concurrency=4, rate=5.0, batch_size=100):
+        self.settings = settings
+        self.concurrency = concurrency
+        self.rate = rate
+        self.batch_size = batch_size
+
+        self.cache = get_cache(
+            PubChemCache, settings["pubchem cache"], ttl=settings["pubchem cache ttl"]
+        )
+        if settings.get("failure cache") is not None:
+            self.failures = get_cache(
+                FailureCache,
+                settings["failure cache"],
+                ttl=settings["failure cache ttl"],
+            )
+        else:
+            self.failures = None
+
+        self.pool = ConnectionPool(pubchem.pug_url(settings))
+        self.shared = pubchem._bucket(settings)
+        self.breaker = pubchem._breaker(settings)
+        self.n_requests = 0
+
+    def close(self):
+        """Close the connections to PubChem."""
+        self.pool.close()
+
+    def resolve(self, names=(), cids=(), inchikeys=()):
+        """Resolve identifiers, putting the responses in the PubChem cache.
+
+        Identifiers already in the cache are skipped. Those that PubChem does
+        not have are recorded in the failure cache, if there is one, and those
+        that fail for other reasons, e.g. PubChem being busy, are left for the
+        resolvers to try again.
+
+        Parameters
+        ----------
+        names : iterable of str
+            Chemical names.
+        cids : iterable of str
+            PubChem CIDs, optionally with the prefix "CID:".
+        inchikeys : iterable of str
+            InChIKeys.
+
+        Returns
+        -------
+        dict(str, int)
+            The number of identifiers "resolved", "cached" already, and
+            "failed".
+        """
+        result = {"resolved": 0, "cached": 0, "failed": 0}
+
+        names = self._uncached("name", names, result)
+        inchikeys = self._uncached(
+            "inchikey" if self.settings.get("pubchem 3d") else "inchikey:InChI",
+            inchikeys,
+            result,
+        )
+        matches = (cid_re.match(cid.strip()) for cid in cids)
+        cids = self._uncached(
+            "cid", (match.group(1) for match in matches if match is not None), result
+        )
+        if len(names) + len(cids) + len(inchikeys) == 0:
+            return result
+
+        with timers("PubChem batch"):
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                asyncio.run(self._resolve(executor, names, cids, inchikeys, result))
+        return result
+
+    def notations(self, flavor="rdkit"):
+        """The notations whose first resolver in the chain uses PubChem.
+
+        Parameters
+        ----------
+        flavor : str = "rdkit"
+            The flavor of SMILES chosen in the step.
+
+        Returns
+        -------
+        {str}
+            Some of "name", "CID" and "InChIKey".
+        """
+        chain = resolver_chain(
+            tuple(self.settings["resolvers"]), flavor, self.settings.get("dictionary")
+        )
+        result = set()
+        for notation in ("name", "CID", "InChIKey"):
+            resolvers = [r for r in chain if notation in r.notations]
+            if len(resolvers) > 0 and not resolvers[0].local:
+                result.add(notation)
+        return result
+
+    def resolve_inputs(self, texts, notation="perceive", flavor="rdkit"):
+        """Resolve the input strings that the resolvers would get from PubChem.
+
+        Parameters
+        ----------
+        texts : iterable of str
+            The input strings.
+        notation : str = "perceive"
+            The line notation of the strings, or "perceive" to perceive each.
+        flavor : str = "rdkit"
+            The flavor of SMILES chosen in the step.
+
+        Returns
+        -------
+        dict(str, int)
+            The number of identifiers "resolved", "cached" already, and
+            "failed".
+        """
+        remote = self.notations(flavor)
+        wanted = {"name": [], "CID": [], "InChIKey": []}
+        if len(remote) > 0:
+            for text in texts:
+                form = perceive(text) if notation == "perceive" else notation
+                if form in remote:
+                    wanted[form].append(text)
+        return self.resolve(
+            names=wanted["name"], cids=wanted["CID"], inchikeys=wanted["InChIKey"]
+        )
+
+    def _uncached(self, namespace, identifiers, result):
+        """The unique identifiers that are not in the cache."""
+        unique = {}
+        for identifier in identifiers:
+            key = pubchem._normalize(namespace, identifier)
+            if key not in unique:
+                unique[key] = identifier
+        result["cached"] += len(unique)
+        uncached = [
+            identifier
+            for key, identifier in unique.items()
+            if self.cache.get(namespace, key) is None
+        ]
+        result["cached"] -= len(uncached)
+        return uncached
+
+    async def _resolve(self, executor, names, cids, inchikeys, result):
+        self._executor = executor
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._bucket = TokenBucket(self.rate)
+
+        # The CIDs of the names, then the structures of all the CIDs
+        tasks = [self._name_cid(name) for name in names]
+        tasks.extend(
+            self._inchis(inchikeys[i : i + self.batch_size])
+            for i in range(0, len(inchikeys), self.batch_size)
+        )
+        outcomes = await asyncio.gather(*tasks)
+
+        wanted = collections.defaultdict(list)  # the CID -> (namespace, identifier)
+        for cid in cids:
+            wanted[cid].append(("cid", cid))
+        for name, cid in zip(names, outcomes[0 : len(names)]):
+            if cid is None:
+                result["failed"] += 1
+            else:
+                wanted[cid].append(("name", name))
+        for resolved, failed, cids in outcomes[len(names) :]:
+            result["resolved"] += resolved
+            result["failed"] += failed
+            if self.settings.get("pubchem 3d"):
+                for inchikey, cid in cids.items():
+                    wanted[cid].append(("inchikey", inchikey))
+
+        cid_list = list(wanted)
+        outcomes = await asyncio.gather(
+            *(
+                self._structures(cid_list[i : i + self.batch_size], wanted)
+                for i in range(0, len(cid_list), self.batch_size)
+            )
+        )
+        for resolved, failed in outcomes:
+            result["resolved"] += resolved
+            result["failed"] += failed
+
+    async def _request(self, method, path, body=None):
+        """Make a request, within the limits on concurrency and rate.
+
+        Requests that fail are not retried, but left for the resolvers to try.
+        """
+        async with self._semaphore:
+            if self.breaker is not None and not self.breaker.allow():
+                counters.add("from_smiles_pubchem_circuit_open_total")
+                return None, "PubChem has been failing"
+            if self.shared is None:
+                await self._bucket.acquire()
+            else:
+                delay = self.shared.reserve()
+                if delay > 0.0:
+                    counters.add("from_smiles_pubchem_queued_total")
+                    await asyncio.sleep(delay)
+            loop = asyncio.get_running_loop()
+            self.n_requests += 1
+            try:
+                status, text = await loop.run_in_executor(
+                    self._executor, self.pool.request, method, path, body
+                )
+            except (http.client.HTTPException, OSError) as e:
+                logger.warning(f"Request to PubChem failed: {e}")
+                if self.breaker is not None:
+                    self.breaker.failure()
+                return None, str(e)
+        counters.add("from_smiles_pubchem_requests_total", status=status)
+        if self.breaker is not None:
+            if status in (403, 429) or status >= 500:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+        return status, text
+
+    def _not_found(self, namespace, identifier, no_3d=False):
+        """Record that PubChem does not have an identifier, or its 3-D structure.
+
+        Without a 3-D structure the PubChem 3D resolver can still embed the
+        SMILES, so it is not recorded as failing.
+        """
+        if self.failures is None:
+            return
+        resolvers = {
+            "name": ["PubChem name"],
+            "cid": ["PubChem cid"],
+            "inchikey:InChI": ["PubChem InChIKey"],
+            "inchikey": [],
+        }[namespace]
+        if (
+            self.settings.get("pubchem 3d")
+            and namespace != "inchikey:InChI"
+            and not no_3d
+        ):
+            resolvers.append("PubChem 3D")
+        for resolver in resolvers:
+            self.failures.add(
+                identifier, resolver, f"PubChem does not have {namespace} {identifier}"
+            )
+
+    async def _name_cid(self, name):
+        """The CID of a name, or None."""
+        status, text = await self._request(
+            "GET", f"/compound/name/{url_quote(name, safe='')}/cids/TXT"
+        )
+        if status == 200:
+            cids = text.split()
+            if len(cids) > 0:
+                return cids[0]
+        if status == 404:
+            self._not_found("name", name)
+        return None
+
+    async def _inchis(self, inchikeys):
+        """Get the InChIs of InChIKeys.
+
+        Returns
+        -------
+        (int, int, dict(str, str))
+            The numbers resolved and failed, and the first CID of each InChIKey.
+        """
+        status, text = await self._request(
+            "POST",
+            "/compound/inchikey/property/InChIKey,InChI/CSV",
+            {"inchikey": ",".join(inchikeys)},
+        )
+        if status == 404:
+            for inchikey in inchikeys:
+                self._not_found("inchikey:InChI", inchikey)
+            return 0, len(inchikeys), {}
+        if status != 200:
+            return 0, len(inchikeys), {}
+
+        # The rows are the CID, InChIKey and InChI of each compound
+        found = collections.defaultdict(list)
+        cids = {}
+        reader = csv.reader(io.StringIO(text))
+        next(reader, None)
+        for row in reader:
+            if len(row) >= 3:
+                found[row[1]].append(row[2])
+                cids.setdefault(row[1], row[0])
+        resolved = 0
+        for inchikey in inchikeys:
+            if inchikey in found:
+                self.cache.put(
+                    "inchikey:InChI",
+                    pubchem._normalize("inchikey:InChI", inchikey),
+                    "".join(inchi + "\n" for inchi in found[inchikey]),
+                )
+                resolved += 1
+        return resolved, len(inchikeys) - resolved, cids
+
+    async def _structures(self, cids, wanted):
+        """Get the 3-D structures of CIDs, returning the numbers resolved and failed.
+
+        If PubChem has no 3-D structure for some of the CIDs, it fails the whole
+        request, so the CIDs are split in two and tried again.
+        """
+        status, text = await self._request(
+            "POST", "/compound/cid/SDF?record_type=3d", {"cid": ",".join(cids)}
+        )
+        n_wanted = sum(len(wanted[cid]) for cid in cids)
+        if status == 404 and len(cids) > 1:
+            half = len(cids) // 2
+            outcomes = await asyncio.gather(
+                self._structures(cids[0:half], wanted),
+                self._structures(cids[half:], wanted),
+            )
+            return tuple(map(sum, zip(*outcomes)))
+        if status == 404:
+            for namespace, identifier in wanted[cids[0]]:
+                self._not_found(namespace, identifier, no_3d=True)
+            return 0, n_wanted
+        if status != 200:
+            return 0, n_wanted
+
+        resolved = 0
+        for record in split_sdf(text):
+            cid = record.split("\n", 1)[0].strip()
+            for namespace, identifier in wanted.get(cid, ()):
+                self.cache.put(
+                    namespace, pubchem._normalize(namespace, identifier), record
+                )
+                resolved += 1
+        return resolved, n_wanted - resolved
+
+
+class BackgroundBatch(object):
+    """Resolve input strings with PubChem in a background thread.
+
+    The strings are resolved in chunks, in the order they are submitted, by a
+    thread that runs while there are any left. The thread has its own
+    :class:`PubChemBatch` and caches, since SQLite connections can't be shared
+    between threads.
+
+    Parameters
+    ----------
+    settings : dict(str, any)
+        The settings for the resolvers and caches.
+    notation : str = "perceive"
+        The line notation of the strings, or "perceive" to perceive each.
+    flavor : str = "rdkit"
+        The flavor of SMILES chosen in the step.
+    chunksize : int = 100
+        The number of strings to resolve at a time.
+    kwargs : any
+        The concurrency, rate and batch_size for the :class:`PubChemBatch`.
+    """
+
+    def __init__(
+        self, settings, notation="perceive", flavor="rdkit", chunksize=100, **kwargs
+    ):
+        self.settings = settings
+        self.notation = notation
+        self.flavor = flavor
+        self.chunksize = chunksize
+        self.kwargs = kwargs
+
+        self.counts = {"resolved": 0, "cached": 0, "failed": 0}
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def busy(self):
+        """Whether there are strings still being resolved."""
+        with self._lock:
+            return self._thread is not None
+
+    def submit(self, texts):
+        """Add strings to be resolved.
+
+        Parameters
+        ----------
+        texts : [str]
+            The input strings.
+        """
+        with self._lock:
+            for i in range(0, len(texts), self.chunksize):
+                self._pending.append(texts[i : i + self.chunksize])
+            if self._thread is None:
+                self._start()
+
+    def _start(self):
+        """Start the thread if there is work, holding the lock."""
+        if len(self._pending) > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="PubChem prefetch", daemon=True
+            )
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for the strings submitted so far to be resolved.
+
+        The thread is only finished once it has closed its caches and
+        connections.
+
+        Parameters
+        ----------
+        timeout : float = None
+            The longest time to wait, in seconds.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                thread = self._thread
+            if thread is None:
+                return
+            thread.join(None if end is None else max(0.0, end - time.monotonic()))
+            if thread.is_alive():
+                return
+
+    def _run(self):
+        batch = PubChemBatch(self.settings, **self.kwargs)
+        try:
+            while True:
+                with self._lock:
+                    if len(self._pending) == 0:
+                        break
+                    texts = self._pending.popleft()
+                try:
+                    result = batch.resolve_inputs(texts, self.notation, self.flavor)
+                except Exception as e:
+                    logger.warning(f"Resolving with PubChem in the background: {e}")
+                    continue
+                with self._lock:
+                    for key, value in result.items():
+                        self.counts[key] += value
+        finally:
+            batch.close()
+            close_caches()
+            # Only now is the thread done, but more may have been submitted
+            with self._lock:
+                self._thread = None
+                self._start()
+
+
+def split_sdf(text):
+    """Split SDF text into its records.
+
+    Parameters
+    ----------
+    text : str
+        The SDF text.
+
+    Returns
+    -------
+    [str]
+        The records, each ending with "$$$$".
+    """
+    result = []
+    for record in text.split("$$$$\n"):
+        if record.strip() != "":
+            result.append(record + "$$$$\n")
+    return result
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+"""A local stand-in for the PubChem PUG REST service, for tests and benchmarks.
+
+The stand-in serves the parts of PUG REST used by this step and by molsystem
+from a small set of compounds, so that the paths through PubChem can be
+tested and benchmarked without the network::
+
+    GET  /rest/pug/compound/<namespace>/<identifiers>/SDF[?record_type=3d]
+    GET  /rest/pug/compound/<namespace>/<identifiers>/cids/TXT
+    GET  /rest/pug/compound/<namespace>/<identifiers>/property/<names>/TXT
+    GET  /rest/pug/compound/<namespace>/<identifiers>/property/<names>/CSV
+    POST /rest/pug/compound/<namespace>/...   with "<namespace>=<identifiers>"
+
+The namespace is one of cid, name, smiles, inchi, or inchikey. As in PubChem,
+several CIDs or InChIKeys may be given, separated by commas. The compounds
+are read from a file with the CID, SMILES, and names separated by tabs on
+each line, with "|" between the names, by default ``data/pubchem.tsv`` in
+this package, and their 3-D structures made with RDKit.
+
+Faults can be injected to exercise retries, rate limiting and concurrency:
+a latency for each response, a fraction of responses that fail with HTTP
+503, a rate limit above which requests get HTTP 429 as from PubChem, and
+specific responses queued with :meth:`StandInPubChem.inject`. The random
+faults use a seeded generator so they are repeatable.
+
+The step is pointed at the stand-in with its --pubchem-url option, or in
+Python by using the stand-in as a context manager, which sets
+``molsystem.pubchem.pug_url`` while it is running::
+
+    with StandInPubChem(latency=0.05) as standin:
+        ...
+
+It can also be run as a program, e.g. on a build machine without network::
+
+    python -m from_smiles_step.pubchem_standin --port 8765 --latency 0.05
+"""
+
+import argparse
+import collections
+import http.server
+import io
+import logging
+from pathlib import Path
+import random
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import molsystem.pubchem
+from rdkit import Chem
+from rdkit.Chem import AllChem, rdMolDescriptors
+
+logger = logging.getLogger(__name__)
+
+# The properties that can be requested, and the functions to get them
+properties = {
+    "CanonicalSMILES": lambda compound: compound.smiles,
+    "IsomericSMILES": lambda compound: compound.smiles,
+    "InChI": lambda compound: compound.inchi,
+    "InChIKey": lambda compound: compound.inchikey,
+    "IUPACName": lambda compound: compound.names[-1],
+    "MolecularFormula": lambda compound: compound.formula,
+}
+
+
+class Compound(object):
+    """A compound in the stand-in, with its 3-D structure made when needed.
+
+    Parameters
+    ----------
+    cid : int
+        The PubChem compound id.
+    smiles : str
+        The SMILES.
+    names : [str]
+        The names of the compound.
+    has_3d : bool = True
+        Whether PubChem has a 3-D structure of the compound. Large or flexible
+        molecules have none.
+    """
+
+    def __init__(self, cid, smiles, names, has_3d=True):
+        self.cid = cid
+        self.smiles = smiles
+        self.names = names
+        self.has_3d = has_3d
+
+        self.mol = Chem.MolFromSmiles(smiles)
+        if self.mol is None:
+            raise ValueError(f"The SMILES '{smiles}' for CID {cid} is not valid.")
+        self.inchi = Chem.MolToInchi(self.mol)
+        self.inchikey = Chem.MolToInchiKey(self.mol)
+        self.formula = rdMolDescriptors.CalcMolFormula(self.mol)
+        self._sdf = None
+
+    @property
+    def sdf(self):
+        """The SDF record of the 3-D structure, with PubChem's tags."""
+        if self._sdf is None:
+            mol = Chem.AddHs(self.mol)
+            AllChem.EmbedMolecule(mol, randomSeed=self.cid)
+            mol.SetProp("_Name", str(self.cid))
+            mol.SetProp("PUBCHEM_COMPOUND_CID", str(self.cid))
+            mol.SetProp("PUBCHEM_IUPAC_INCHI", self.inchi)
+            mol.SetProp("PUBCHEM_IUPAC_INCHIKEY", self.inchikey)
+            mol.SetProp("PUBCHEM_MOLECULAR_FORMULA", self.formula)
+            fd = io.StringIO()
+            writer = Chem.SDWriter(fd)
+            writer.write(mol)
+            writer.close()
+            self._sdf = fd.getvalue()
+        return self._sdf
+
+
+def read_compounds(path=None):
+    """Read the compounds for the stand-in.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path = None
+        The file of compounds, defaulting to the one in this package.
+
+    Returns
+    -------
+    [Compound]
+    """
+    if path is None:
+        path = Path(__file__).parent / "data" / "pubchem.tsv"
+    result = []
+    with open(Path(path).expanduser()) as fd:
+        for line in fd:
+            if line[0] == "#" or line.strip() == "":
+                continue
+            cid, smiles, names = line.rstrip("\n").split("\t")[0:3]
+            names = [name.strip() for name in names.split("|") if name.strip() != ""]
+            result.append(Compound(int(cid), smiles.strip(), names))
+    return result
+
+
+class StandInPubChem(object):
+    """A local HTTP server standing in for PubChem PUG REST.
+
+    Parameters
+    ----------
+    compounds : str or pathlib.Path or [Compound] = None
+        The compounds to serve, or the file to read them from. By default those
+        in the file in this package.
+    host : str = "127.0.0.1"
+        The address to listen on.
+    port : int = 0
+        The port, by default any free port.
+    latency : float = 0.0
+        The time in seconds to wait before each response.
+    jitter : float = 0.0
+        A random extra wait of up to this many seconds.
+    error_rate : float = 0.0
+        The fraction of requests that fail with HTTP 503.
+    rate_limit : float = None
+        The number of requests per second above which requests get HTTP 429,
+        like PubChem's limit of 5 per second, or None for no limit.
+    seed : int = 0
+        The seed for the random jitter and errors.
+    """
+
+    def __init__(
+        self,
+        compounds=None,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        rate_limit=None,
+        seed=0,
+    ):
+        if compounds is None or isinstance(compounds, (str, Path)):
+            compounds = read_compounds(compounds)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+
+        self.index = {namespace: {} for namespace in ("cid", "name", "smiles")}
+        self.index["inchi"] = {}
+        self.index["inchikey"] = {}
+        for compound in compounds:
+            self.index["cid"][str(compound.cid)] = compound
+            for name in compound.names:
+                self.index["name"][name.lower()] = compound
+            self.index["smiles"][compound.smiles] = compound
+            self.index["smiles"][Chem.MolToSmiles(compound.mol)] = compound
+            self.index["inchi"][compound.inchi] = compound
+            self.index["inchikey"][compound.inchikey] = compound
+
+        # The counts of responses by status, and the requests in the last second
+        self.statistics = collections.Counter()
+        self.n_requests = 0
+        self._recent = collections.deque()
+        self._injected = collections.deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._saved_url = None
+
+        self.server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        self._saved_url = molsystem.pubchem.pug_url
+        molsystem.pubchem.pug_url = self.url
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        molsystem.pubchem.pug_url = self._saved_url
+        self.stop()
+
+    @property
+    def url(self):
+        """The base URL of the stand-in, to use in place of PubChem's."""
+        host, port = self.server.server_address[0:2]
+        return f"http://{host}:{port}/rest/pug"
+
+    def start(self):
+        """Start serving requests in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.server.serve_forever, name="PubChem stand-in", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop serving requests."""
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+    def inject(self, status, count=1, body=""):
+        """Respond to the next requests with the given HTTP status.
+
+        Parameters
+        ----------
+        status : int
+            The HTTP status, e.g. 503 or 429.
+        count : int = 1
+            The number of requests to respond to this way.
+        body : str = ""
+            The body of the responses.
+        """
+        with self._lock:
+            for _ in range(count):
+                self._injected.append((status, body))
+
+    def _fault(self):
+        """Any fault to respond with instead of handling the request.
+
+        Returns
+        -------
+        (int, str) or None
+            The status and body, or None to handle the request.
+        """
+        with self._lock:
+            self.n_requests += 1
+            if len(self._injected) > 0:
+                return self._injected.popleft()
+
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                while len(self._recent) > 0 and now - self._recent[0] >= 1.0:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rate_limit:
+                    return 429, _status_text(
+                        429, "PUGREST.ServerBusy", "Too many requests"
+                    )
+                self._recent.append(now)
+
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                return 503, _status_text(503, "PUGREST.ServerBusy", "Server busy")
+        return None
+
+    def _delay(self):
+        """The time to wait before responding."""
+        if self.jitter > 0:
+            with self._lock:
+                return self.latency + self.jitter * self._random.random()
+        return self.latency
+
+    def respond(self, path, query, form=None):
+        """The response to a request.
+
+        Parameters
+        ----------
+        path : str
+            The path of the URL.
+        query : dict(str, [str])
+            The query parameters.
+        form : dict(str, [str]) = None
+            The parameters in the body of a POST.
+
+        Returns
+        -------
+        (int, str, str)
+            The HTTP status, content type, and body.
+        """
+        fault = self._fault()
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+        if fault is not None:
+            status, body = fault
+            self._count(status)
+            return status, "text/plain", body
+
+        status, content_type, body = self._lookup(path, query, form)
+        self._count(status)
+        return status, content_type, body
+
+    def _count(self, status):
+        with self._lock:
+            self.statistics[status] += 1
+
+    def _lookup(self, path, query, form):
+        """Look up the compounds for a request, without faults."""
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if len(parts) < 4 or parts[0:3] != ["rest", "pug", "compound"]:
+            return 400, "text/plain", _status_text(400, "PUGREST.BadRequest", path)
+        parts = parts[3:]
+        namespace = parts[0]
+        if namespace not in self.index:
+            return 400, "text/plain", _status_text(400, "PUGREST.BadRequest", path)
+        if form is not None and namespace in form:
+            identifiers = form[namespace][0]
+            operation = parts[1:]
+        elif len(parts) >= 3:
+            identifiers = parts[1]
+            operation = parts[2:]
+        else:
+            return 400, "text/plain", _status_text(400, "PUGREST.BadRequest", path)
+
+        # As in PubChem, only CIDs and InChIKeys may be given several at a time
+        if namespace in ("cid", "inchikey"):
+            identifiers = [x.strip() for x in identifiers.split(",") if x.strip()]
+        else:
+            identifiers = [identifiers.strip()]
+        if namespace == "name":
+            identifiers = [x.lower() for x in identifiers]
+
+        compounds = [
+            self.index[namespace][x] for x in identifiers if x in self.index[namespace]
+        ]
+        if len(compounds) == 0:
+            return (
+                404,
+                "text/plain",
+                _status_text(404, "PUGREST.NotFound", "No CID found"),
+            )
+
+        if operation == ["SDF"]:
+            # As in PubChem, one compound without a 3-D structure fails them all
+            if query.get("record_type") == ["3d"] and not all(
+                c.has_3d for c in compounds
+            ):
+                return (
+                    404,
+                    "text/plain",
+                    _status_text(404, "PUGREST.NotFound", "No 3D structure found"),
+                )
+            return 200, "chemical/x-mdl-sdfile", "".join(c.sdf for c in compounds)
+        if operation == ["cids", "TXT"]:
+            return 200, "text/plain", "".join(f"{c.cid}\n" for c in compounds)
+        if len(operation) == 3 and operation[0] == "property":
+            names = operation[1].split(",")
+            if any(name not in properties for name in names):
+                return 400, "text/plain", _status_text(400, "PUGREST.BadRequest", path)
+            if operation[2] == "TXT":
+                lines = []
+                for compound in compounds:
+                    lines.extend(properties[name](compound) for name in names)
+                return 200, "text/plain", "".join(line + "\n" for line in lines)
+            if operation[2] == "CSV":
+                lines = [",".join(f'"{name}"' for name in ["CID"] + names)]
+                for compound in compounds:
+                    values = [f'"{properties[name](compound)}"' for name in names]
+                    lines.append(",".join([str(compound.cid)] + values))
+                return 200, "text/csv", "".join(line + "\n" for line in lines)
+        return 400, "text/plain", _status_text(400, "PUGREST.BadRequest", path)
+
+
+def _status_text(status, code, message):
+    """The body of an error, as PubChem gives it."""
+    return f"Status: {status}\nCode: {code}\nMessage: {message}\n"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Handle the requests to the stand-in, keeping connections alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._send(*self.server.standin.respond(url.path, parse_qs(url.query)))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        self._send(*self.server.standin.respond(url.path, parse_qs(url.query), form))
+
+    def _send(self, status, content_type, body):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("PubChem stand-in: " + format % args)
+
+
+def run():
+    """Run the stand-in from the command line."""
+    parser = argparse.ArgumentParser(description="A local stand-in for PubChem.")
+    parser.add_argument("--compounds", default=None, help="The file of compounds.")
+    parser.add_argument("--host", default="127.0.0.1", help="The address to use.")
+    parser.add_argument("--port", type=int, default=8765, help="The port to use.")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="The latency in seconds."
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="The random extra latency."
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="The fraction of 503 errors."
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, default=None, help="The requests per second."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    args = parser.parse_args()
+
+    standin = StandInPubChem(
+        args.compounds,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+    print(f"Serving PubChem at {standin.url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+
+
+if __name__ == "__main__":
+    run()
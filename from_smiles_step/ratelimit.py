@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""A limit on the rate of requests to PubChem shared by all jobs on a host.
+
+PubChem throttles requests by address, so the SEAMM jobs running on one node
+share its limit of about 5 requests per second. Each step limiting its own
+rate is not enough: 32 jobs each making 5 requests a second are throttled,
+and then slowed further by retries and failures. Instead the jobs share one
+token bucket, kept in a small file and updated under a lock (see
+:func:`fcntl.flock`)::
+
+    bucket = SharedTokenBucket("/tmp/seamm_pubchem.bucket", rate=5.0)
+    bucket.acquire()  # waits for a turn if the budget is used up
+    response = requests.get(url)
+
+Taking a token reserves the next free turn, so that the requests queue in
+the order they were made, rather than failing or polling for a token.
+"""
+
+import logging
+import os
+from pathlib import Path
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The state in the file: the number of tokens and the time it was updated
+_state = struct.Struct("<dd")
+
+
+def default_path():
+    """The file for the bucket shared by the jobs on this host.
+
+    Returns
+    -------
+    pathlib.Path
+    """
+    return Path(tempfile.gettempdir()) / "seamm_from_smiles_pubchem.bucket"
+
+
+class SharedTokenBucket(object):
+    """A token bucket shared by the processes on a host through a file.
+
+    If the file cannot be opened, or file locks are not available, the bucket
+    only limits the rate of this process.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The file holding the state of the bucket, which is created if needed.
+    rate : float = 5.0
+        The number of tokens added per second.
+    burst : float = None
+        The most tokens that can be saved up, by default one second's worth.
+    """
+
+    def __init__(self, path, rate=5.0, burst=None):
+        self.path = Path(path).expanduser()
+        self.rate = rate
+        self.capacity = max(1.0, rate if burst is None else burst)
+
+        self._lock = threading.Lock()
+        self._local = (self.capacity, time.time())
+        self._fd = None
+        if fcntl is None:
+            logger.warning(
+                "File locks are not available, so the rate of requests to PubChem "
+                "is only limited for this process."
+            )
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError as e:
+            logger.warning(
+                f"Could not open '{self.path}' for the shared limit on the rate of "
+                f"requests to PubChem, so it is only limited for this process: {e}"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def shared(self):
+        """Whether the bucket is shared with other processes."""
+        return self._fd is not None
+
+    def close(self):
+        """Close the file."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def reserve(self):
+        """Take a token, returning how long to wait before using it.
+
+        Returns
+        -------
+        float
+            The time in seconds until the token is due, 0 if it can be used now.
+        """
+        with self._lock:
+            if self._fd is None:
+                tokens, updated = self._local
+                now = time.time()
+                tokens = self._take(tokens, updated, now)
+                self._local = (tokens, now)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                try:
+                    data = os.pread(self._fd, _state.size, 0)
+                    now = time.time()
+                    if len(data) == _state.size:
+                        tokens, updated = _state.unpack(data)
+                    else:
+                        tokens, updated = self.capacity, now
+                    tokens = self._take(tokens, updated, now)
+                    os.pwrite(self._fd, _state.pack(tokens, now), 0)
+                finally:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        if tokens >= 0.0:
+            return 0.0
+        return -tokens / self.rate
+
+    def _take(self, tokens, updated, now):
+        """Add the tokens since the last update, and take one."""
+        # Guard against the clock having been set back
+        elapsed = max(0.0, now - updated)
+        return min(self.capacity, tokens + elapsed * self.rate) - 1.0
+
+    def acquire(self):
+        """Wait for a token.
+
+        Returns
+        -------
+        float
+            The time waited, in seconds.
+        """
+        delay = self.reserve()
+        if delay > 0.0:
+            time.sleep(delay)
+        return delay
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""Reading the entries of input files one at a time.
+
+The files may be large, so they are read as a stream, and compressed files are
+decompressed on the fly. The format and compression are given by the suffixes
+of the file name, e.g. ``library.smi.gz``:
+
+    ===========  ==========================================================
+    .smi         SMILES files: the structure, then the title after a space
+    .csv         comma-separated values, with an optional header
+    .tsv         tab-separated values, with an optional header
+    other        the structure, then the title after a tab
+    .gz          gzip compression
+    .bz2         bzip2 compression
+    .xz, .lzma   LZMA compression
+    .zst         Zstandard compression, which needs the zstandard package
+    ===========  ==========================================================
+
+In CSV and TSV files a header is recognized by a column named e.g. "smiles" or
+"name", which then holds the structures. The title is taken from a column
+named "title" or "id", if there is one. Without a header, the first column is
+the structure and the second the title.
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import logging
+import lzma
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+compressions = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".lzma": lzma.open,
+}
+
+# The names of columns with the structures or titles in CSV and TSV files
+structure_columns = (
+    "smiles",
+    "structure",
+    "input",
+    "identifier",
+    "inchi",
+    "inchikey",
+    "cid",
+    "name",
+)
+title_columns = ("title", "id", "name")
+
+
+def open_text(path):
+    """Open a possibly compressed file for reading text.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the file.
+
+    Returns
+    -------
+    io.TextIOBase
+        The open file.
+    """
+    path = Path(path).expanduser()
+    suffix = path.suffix.lower()
+    if suffix in compressions:
+        return compressions[suffix](path, "rt", newline="")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(
+                f"Reading the compressed file {path} requires the zstandard package."
+            )
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        return io.TextIOWrapper(stream, newline="")
+    return open(path, "r", newline="")
+
+
+def file_format(path):
+    """The format of a file, ignoring any compression.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the file.
+
+    Returns
+    -------
+    str
+        "smi", "csv", "tsv", or "text"
+    """
+    suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+    if len(suffixes) > 1 and (suffixes[-1] in compressions or suffixes[-1] == ".zst"):
+        suffixes.pop()
+    suffix = suffixes[-1] if len(suffixes) > 0 else ""
+    if suffix in (".smi", ".smiles"):
+        return "smi"
+    if suffix in (".csv", ".tsv"):
+        return suffix[1:]
+    return "text"
+
+
+def read_entries(path):
+    """Read the entries in a file, one at a time.
+
+    Blank lines and lines starting with "#" are skipped, except in CSV and TSV
+    files.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the file.
+
+    Returns
+    -------
+    iterator of (int, str, str)
+        The line number, input string, and title of each entry.
+    """
+    fmt = file_format(path)
+    with open_text(path) as fd:
+        if fmt in ("csv", "tsv"):
+            yield from _read_table(fd, "," if fmt == "csv" else "\t")
+            return
+
+        for lineno, line in enumerate(fd, start=1):
+            line = line.strip()
+            if line == "" or line[0] == "#":
+                continue
+            if fmt == "smi":
+                tmp = line.split(maxsplit=1)
+            else:
+                tmp = line.split("\t", maxsplit=1)
+            text = tmp[0].strip()
+            title = tmp[1].strip() if len(tmp) > 1 else ""
+            yield lineno, text, title
+
+
+def _read_table(fd, delimiter):
+    """Read the entries in a CSV or TSV file.
+
+    Parameters
+    ----------
+    fd : io.TextIOBase
+        The open file.
+    delimiter : str
+        The delimiter between columns.
+
+    Returns
+    -------
+    iterator of (int, str, str)
+        The line number, input string, and title of each entry.
+    """
+    reader = csv.reader(fd, delimiter=delimiter)
+    column = 0
+    title_column = 1
+    first = True
+    for row in reader:
+        if len(row) == 0 or row[0].strip() == "":
+            continue
+        if first:
+            first = False
+            header = [field.strip().lower() for field in row]
+            found = [name for name in structure_columns if name in header]
+            if len(found) > 0:
+                column = header.index(found[0])
+                titles = [
+                    name
+                    for name in title_columns
+                    if name in header and header.index(name) != column
+                ]
+                title_column = header.index(titles[0]) if len(titles) > 0 else None
+                continue
+        text = row[column].strip() if column < len(row) else ""
+        if text == "":
+            continue
+        if title_column is not None and title_column < len(row):
+            title = row[title_column].strip()
+        else:
+            title = ""
+        yield reader.line_num, text, title
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""Plain records of structures, for moving them between processes and storage.
+
+A record is a dictionary of lists and numbers, so it pickles and serializes to
+JSON cheaply, and holds everything that the line notations give for a
+structure::
+
+    {
+        "atno": [int],
+        "x": [float], "y": [float], "z": [float],
+        "formal_charge": [int],       # optional
+        "i": [int], "j": [int],       # bonded atoms, as indices of the atoms
+        "bondorder": [int],
+        "charge": int,
+        "spin_multiplicity": int,
+    }
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def structure_record(configuration):
+    """Create a record of the structure in a configuration.
+
+    Parameters
+    ----------
+    configuration : molsystem._Configuration
+        The configuration with the structure.
+
+    Returns
+    -------
+    dict(str, any)
+        The record of the structure.
+    """
+    atoms = configuration.atoms
+    bonds = configuration.bonds
+
+    index = {aid: n for n, aid in enumerate(atoms.ids)}
+
+    record = {
+        "atno": atoms.get_column_data("atno"),
+        "x": atoms.get_column_data("x"),
+        "y": atoms.get_column_data("y"),
+        "z": atoms.get_column_data("z"),
+        "i": [index[i] for i in bonds.get_column_data("i")],
+        "j": [index[j] for j in bonds.get_column_data("j")],
+        "bondorder": bonds.get_column_data("bondorder"),
+        "charge": configuration.charge,
+        "spin_multiplicity": configuration.spin_multiplicity,
+    }
+    if "formal_charge" in atoms:
+        formal_charges = atoms.get_column_data("formal_charge")
+        if any(q != 0 for q in formal_charges):
+            record["formal_charge"] = formal_charges
+
+    return record
+
+
+def record_to_configuration(record, configuration):
+    """Replace the structure in a configuration with that in a record.
+
+    Parameters
+    ----------
+    record : dict(str, any)
+        The record of the structure.
+    configuration : molsystem._Configuration
+        The configuration to put the structure in.
+    """
+    configuration.clear()
+
+    atoms = configuration.atoms
+    data = {key: record[key] for key in ("x", "y", "z", "atno")}
+    if "formal_charge" in record:
+        if "formal_charge" not in atoms:
+            atoms.add_attribute("formal_charge", coltype="int", default=0)
+        data["formal_charge"] = record["formal_charge"]
+    ids = atoms.append(**data)
+
+    if len(record["i"]) > 0:
+        configuration.bonds.append(
+            i=[ids[i] for i in record["i"]],
+            j=[ids[j] for j in record["j"]],
+            bondorder=record["bondorder"],
+        )
+
+    configuration.charge = record["charge"]
+    configuration.spin_multiplicity = record["spin_multiplicity"]
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""The resolvers that create structures from input strings, and chains of them.
+
+Each resolver handles one or more line notations, e.g. SMILES or chemical
+names, and either creates the structure in a configuration or raises an
+exception. A chain of resolvers is tried in order until one succeeds, so the
+order sets the fallbacks: putting the cheap, local resolvers first avoids
+network requests to PubChem for input that can be handled locally.
+
+A chain is given as a preset name or a comma-separated list of resolver names:
+
+    ================  ==================================================
+    SMILES            the SMILES flavor chosen in the step
+    rdkit             SMILES using RDKit
+    openbabel         SMILES using Open Babel
+    openeye           SMILES using OpenEye
+    InChI             InChI using Open Babel
+    dictionary        common names in the local dictionary
+    PubChem name      chemical names from PubChem
+    PubChem smiles    SMILES from PubChem
+    PubChem cid       PubChem compound ids, e.g. "CID:2244" or "2244"
+    PubChem InChIKey  InChIKeys, using the InChI from PubChem
+    PubChem 3D        PubChem's 3-D structures of names, InChIKeys and CIDs
+    ================  ==================================================
+
+Most resolvers embed the structure in 3-D locally. "PubChem 3D" instead
+uses the conformers that PubChem has computed where there are any, and
+otherwise embeds PubChem's isomeric SMILES locally, so it replaces "PubChem
+name" and "PubChem cid" at the head of the chain.
+"""
+
+import functools
+import logging
+from pathlib import Path
+
+from from_smiles_step import pubchem
+from from_smiles_step.perception import cid_re, inchikey_re
+
+logger = logging.getLogger(__name__)
+
+presets = {
+    "default": (
+        "SMILES, PubChem name, PubChem smiles, openbabel, InChI, PubChem InChIKey, "
+        "PubChem cid"
+    ),
+    "local-first": (
+        "SMILES, openbabel, dictionary, InChI, PubChem name, PubChem smiles, "
+        "PubChem InChIKey, PubChem cid"
+    ),
+    # Offline, PubChem results come only from the cache
+    "offline": (
+        "SMILES, openbabel, dictionary, InChI, PubChem name, PubChem smiles, "
+        "PubChem InChIKey, PubChem cid"
+    ),
+}
+
+
+class Resolver(object):
+    """Base class for resolvers.
+
+    Attributes
+    ----------
+    name : str
+        The name of the resolver, used in the chain and failure cache.
+    notations : (str)
+        The line notations that the resolver handles.
+    local : bool
+        Whether the resolver works locally, without the network.
+    """
+
+    name = ""
+    notations = ()
+    local = True
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} '{self.name}'>"
+
+    def resolve(self, configuration, text, settings=None):
+        """Create the structure in the configuration.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration to put the structure in.
+        text : str
+            The input string.
+        settings : dict(str, any) = None
+            The settings, as described in
+            :func:`from_smiles_step.conversion.convert`.
+
+        Returns
+        -------
+        (str, str)
+            The notation and flavor used to create the structure.
+        """
+        raise NotImplementedError()
+
+
+class SMILESResolver(Resolver):
+    """Create structures from SMILES using a toolkit.
+
+    Parameters
+    ----------
+    flavor : str
+        The toolkit: "rdkit", "openbabel", or "openeye".
+    """
+
+    notations = ("SMILES",)
+
+    def __init__(self, flavor):
+        self.flavor = flavor
+        self.name = f"{flavor} SMILES"
+
+    def resolve(self, configuration, text, settings=None):
+        configuration.from_smiles(text, flavor=self.flavor)
+        return "SMILES", self.flavor
+
+
+class InChIResolver(Resolver):
+    """Create structures from InChI using Open Babel."""
+
+    name = "openbabel InChI"
+    notations = ("InChI",)
+
+    def resolve(self, configuration, text, settings=None):
+        configuration.from_inchi(text)
+        return "InChI", "openbabel"
+
+
+class DictionaryResolver(Resolver):
+    """Create structures for chemical names in a local dictionary.
+
+    The dictionary is a file with the name and SMILES on each line, separated
+    by a tab. Names are not case-sensitive.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path = None
+        The dictionary, defaulting to the one in this package.
+    flavor : str = "rdkit"
+        The flavor of SMILES to use.
+    """
+
+    name = "dictionary"
+    notations = ("name",)
+
+    def __init__(self, path=None, flavor="rdkit"):
+        if path is None:
+            path = Path(__file__).parent / "data" / "names.tsv"
+        self.path = Path(path).expanduser()
+        self.flavor = flavor
+        self._names = None
+
+    @property
+    def names(self):
+        """The dictionary of names and SMILES."""
+        if self._names is None:
+            self._names = {}
+            with open(self.path, "r") as fd:
+                for line in fd:
+                    if line[0] == "#" or line.strip() == "":
+                        continue
+                    name, smiles = line.rstrip("\n").split("\t")[0:2]
+                    self._names[name.strip().lower()] = smiles.strip()
+        return self._names
+
+    def resolve(self, configuration, text, settings=None):
+        key = text.strip().lower()
+        if key not in self.names:
+            raise KeyError(f"'{text}' is not in the dictionary {self.path}")
+        configuration.from_smiles(self.names[key], flavor=self.flavor)
+        return "name", self.flavor
+
+
+class PubChemResolver(Resolver):
+    """Get 3-D structures from PubChem.
+
+    Parameters
+    ----------
+    namespace : str
+        The PubChem namespace: "name", "smiles", or "cid".
+    """
+
+    local = False
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.name = f"PubChem {namespace}"
+        self.notations = {"smiles": ("SMILES",), "cid": ("CID",)}.get(
+            namespace, (namespace,)
+        )
+
+    def resolve(self, configuration, text, settings=None):
+        if self.namespace == "cid":
+            match = cid_re.match(text.strip())
+            if match is None:
+                raise ValueError(f"'{text}' is not a PubChem CID")
+            text = match.group(1)
+        pubchem.from_identifier(
+            configuration,
+            text,
+            namespace=self.namespace,
+            properties="all" if self.namespace in ("name", "cid") else None,
+            settings=settings,
+        )
+        return self.notations[0], "PubChem"
+
+
+class InChIKeyResolver(Resolver):
+    """Create structures from InChIKeys, using the InChI from PubChem."""
+
+    name = "PubChem InChIKey"
+    notations = ("InChIKey",)
+    local = False
+
+    def resolve(self, configuration, text, settings=None):
+        pubchem.from_inchikey(configuration, text, settings=settings)
+        return "InChIKey", "openbabel"
+
+
+class PubChem3DResolver(Resolver):
+    """Get the 3-D structures that PubChem has for names, InChIKeys and CIDs.
+
+    If PubChem has no 3-D structure, e.g. for large or flexible molecules, its
+    isomeric SMILES is embedded locally.
+
+    Parameters
+    ----------
+    flavor : str = "rdkit"
+        The flavor of SMILES to embed with.
+    """
+
+    name = "PubChem 3D"
+    notations = ("name", "InChIKey", "CID")
+    local = False
+
+    def __init__(self, flavor="rdkit"):
+        self.flavor = flavor
+
+    def resolve(self, configuration, text, settings=None):
+        text = text.strip()
+        match = cid_re.match(text)
+        if match is not None:
+            notation, namespace, text = "CID", "cid", match.group(1)
+        elif inchikey_re.match(text):
+            notation, namespace = "InChIKey", "inchikey"
+        else:
+            notation, namespace = "name", "name"
+        try:
+            pubchem.from_identifier(
+                configuration,
+                text,
+                namespace=namespace,
+                properties="all",
+                settings=settings,
+            )
+        except pubchem.NotFoundError:
+            smiles = pubchem.isomeric_smiles(text, namespace, settings=settings)
+            configuration.from_smiles(smiles, flavor=self.flavor)
+            return notation, self.flavor
+        return notation, "PubChem"
+
+
+def expand_chain(chain):
+    """Expand a preset chain to the list of resolver names.
+
+    Parameters
+    ----------
+    chain : str
+        The name of a preset, or a comma-separated list of resolver names.
+
+    Returns
+    -------
+    [str]
+        The resolver names.
+    """
+    chain = presets.get(chain, chain)
+    return [name.strip() for name in chain.split(",") if name.strip() != ""]
+
+
+@functools.lru_cache(maxsize=32)
+def resolver_chain(names, flavor, dictionary=None):
+    """The chain of resolvers.
+
+    Parameters
+    ----------
+    names : (str)
+        The names of the resolvers, in order.
+    flavor : str
+        The SMILES flavor chosen in the step.
+    dictionary : str = None
+        The path to the local dictionary of names, defaulting to the one in
+        this package.
+
+    Returns
+    -------
+    [Resolver]
+        The resolvers, with any duplicates removed.
+    """
+    result = []
+    for name in names:
+        key = name.lower()
+        if key == "smiles":
+            key = flavor
+        if key in ("rdkit", "openbabel", "openeye"):
+            resolver = SMILESResolver(key)
+        elif key == "inchi":
+            resolver = InChIResolver()
+        elif key == "dictionary":
+            resolver = DictionaryResolver(dictionary, flavor=flavor)
+        elif key in ("pubchem name", "pubchem smiles", "pubchem cid"):
+            resolver = PubChemResolver(key.split()[1])
+        elif key == "pubchem inchikey":
+            resolver = InChIKeyResolver()
+        elif key == "pubchem 3d":
+            resolver = PubChem3DResolver(flavor)
+        else:
+            raise ValueError(f"Unknown resolver '{name}' in the chain.")
+        if resolver.name not in [r.name for r in result]:
+            result.append(resolver)
+    return result
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""Retrying requests to network services, and a circuit breaker for outages.
+
+A request that fails for a reason that may pass, e.g. a timeout or PubChem
+being busy, is tried again after a delay that doubles each time, with random
+jitter so that many jobs do not retry in step (see :func:`backoff_delay`).
+
+If a service fails repeatedly, the circuit breaker opens and requests fail at
+once, without waiting for timeouts, so the structures fall back to the local
+resolvers. After a cool-down period a single request is let through to test
+the service, closing the breaker if it succeeds::
+
+    breaker = CircuitBreaker("PubChem", threshold=5, cooldown=60.0)
+    breaker.check()  # raises CircuitOpenError while the breaker is open
+    try:
+        response = ...
+    except Exception:
+        breaker.failure()
+        raise
+    breaker.success()
+
+The state of a :class:`SharedCircuitBreaker` is kept in a small file, like
+the shared limit on the rate (see :mod:`from_smiles_step.ratelimit`), so that
+the processes building structures, e.g. the forked children for a time limit
+or the workers in a pool, and other jobs on the host see the same outages.
+"""
+
+import contextlib
+import logging
+import os
+from pathlib import Path
+import random
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The state in the file: the failures in a row, and when the breaker opened and
+# the test request started, or 0
+_state = struct.Struct("<ddd")
+
+
+class CircuitOpenError(RuntimeError):
+    """A service is not being used for a while because it has been failing."""
+
+
+def backoff_delay(attempt, base=1.0, maximum=60.0):
+    """The delay before retrying, growing exponentially with full jitter.
+
+    Parameters
+    ----------
+    attempt : int
+        The number of the attempt that failed, starting at 0.
+    base : float = 1.0
+        The largest delay after the first attempt, in seconds.
+    maximum : float = 60.0
+        The largest delay after any attempt, in seconds.
+
+    Returns
+    -------
+    float
+        A random delay between 0 and min(maximum, base * 2**attempt).
+    """
+    return random.uniform(0.0, min(maximum, base * 2**attempt))
+
+
+class CircuitBreaker(object):
+    """Stop using a service for a while after it fails repeatedly.
+
+    Parameters
+    ----------
+    name : str
+        The name of the service, for messages.
+    threshold : int = 5
+        The number of failures in a row that open the breaker.
+    cooldown : float = 60.0
+        How long the breaker stays open, in seconds, before a request is let
+        through to test the service.
+    """
+
+    def __init__(self, name, threshold=5, cooldown=60.0):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self.n_failures = 0
+        self.opened = None  # When the breaker opened, or None if closed
+        self._testing = False
+
+    @property
+    def state(self):
+        """The state: "closed", "open", or "half-open" to test the service."""
+        with self._locked():
+            return self._state()
+
+    def _now(self):
+        return time.monotonic()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the lock on the state."""
+        with self._lock:
+            yield
+
+    def _state(self):
+        if self.opened is None:
+            return "closed"
+        if self._now() - self.opened < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """Whether a request may be made now.
+
+        While the breaker is half-open only one request is allowed, until it
+        succeeds or fails.
+
+        Returns
+        -------
+        bool
+        """
+        with self._locked():
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._testing:
+                self._testing = True
+                return True
+            return False
+
+    def check(self):
+        """Raise an error if a request may not be made now.
+
+        Raises
+        ------
+        CircuitOpenError
+        """
+        if not self.allow():
+            raise CircuitOpenError(
+                f"{self.name} is not being used for {self.cooldown:.0f} s after "
+                f"failing {self.threshold} times in a row."
+            )
+
+    def success(self):
+        """Record a successful request, closing the breaker."""
+        with self._locked():
+            if self.opened is not None:
+                logger.info(f"{self.name} is working again.")
+            self.n_failures = 0
+            self.opened = None
+            self._testing = False
+
+    def failure(self):
+        """Record a failed request, opening the breaker if there are too many."""
+        with self._locked():
+            self.n_failures += 1
+            if self._testing or self.n_failures >= self.threshold:
+                if self.opened is None or self._testing:
+                    logger.warning(
+                        f"{self.name} failed {self.n_failures} times in a row, so "
+                        f"it will not be used for {self.cooldown:.0f} s."
+                    )
+                self.opened = self._now()
+            self._testing = False
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """A circuit breaker shared by the processes on a host through a file.
+
+    If the file cannot be opened, or file locks are not available, the breaker
+    only covers this process.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The file holding the state of the breaker, which is created if needed.
+    name : str
+        The name of the service, for messages.
+    threshold : int = 5
+        The number of failures in a row that open the breaker.
+    cooldown : float = 60.0
+        How long the breaker stays open, in seconds, before a request is let
+        through to test the service.
+    """
+
+    def __init__(self, path, name, threshold=5, cooldown=60.0):
+        super().__init__(name, threshold=threshold, cooldown=cooldown)
+        self.path = Path(path).expanduser()
+        self._fd = None
+        if fcntl is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError as e:
+            logger.warning(
+                f"Could not open '{self.path}' for the circuit breaker shared by "
+                f"the jobs using {name}, so it only covers this process: {e}"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def shared(self):
+        """Whether the breaker is shared with other processes."""
+        return self._fd is not None
+
+    def close(self):
+        """Close the file."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _now(self):
+        # The processes share the time the breaker opened, so use the clock
+        return time.time()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the lock on the file, reading the state and writing it back."""
+        with self._lock:
+            if self._fd is None:
+                yield
+                return
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, _state.size, 0)
+                testing = 0.0
+                if len(data) == _state.size:
+                    n_failures, opened, testing = _state.unpack(data)
+                    self.n_failures = int(n_failures)
+                    self.opened = opened if opened > 0.0 else None
+                    # A test request that has not finished in the cool-down
+                    # period, e.g. because its process died, is abandoned.
+                    self._testing = (
+                        testing > 0.0 and self._now() - testing < self.cooldown
+                    )
+                was_testing = self._testing
+                yield
+                if not self._testing:
+                    testing = 0.0
+                elif not was_testing:
+                    testing = self._now()
+                os.pwrite(
+                    self._fd,
+                    _state.pack(self.n_failures, self.opened or 0.0, testing),
+                    0,
+                )
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
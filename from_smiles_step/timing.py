@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""Timers for the stages of creating structures.
+
+Each stage, e.g. perceiving the notation, building the structure with a
+toolkit, requesting it from PubChem, or writing it to the database, is timed
+every time it runs::
+
+    with timers("perception"):
+        notation = perceive(text)
+
+The timers keep the count, total and maximum time for each stage, and a
+histogram of the times with logarithmic bins about 2% wide, from which the
+median and 95th percentile are estimated. This takes constant memory however
+many structures are created, and the timers of worker processes can be merged
+into those of the main process. The timers are guarded by a lock, since a
+background thread may be timing stages as well.
+
+The module-level :data:`timers` are those of this process.
+"""
+
+import contextlib
+import json
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bins per factor of e in the histograms, giving bins about 2% wide
+BINS_PER_E = 50
+
+
+class StageTimers(object):
+    """The count, total, maximum and histogram of the times of each stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def __call__(self, stage):
+        """A context manager timing a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        """
+        return self._timer(stage)
+
+    @contextlib.contextmanager
+    def _timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def __contains__(self, stage):
+        return stage in self._stages
+
+    def __len__(self):
+        return len(self._stages)
+
+    def add(self, stage, seconds):
+        """Add a time for a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        seconds : float
+            The time taken.
+        """
+        b = math.floor(math.log(max(seconds, 1.0e-9)) * BINS_PER_E)
+        with self._lock:
+            if stage not in self._stages:
+                self._stages[stage] = [0, 0.0, 0.0, {}]
+            data = self._stages[stage]
+            data[0] += 1
+            data[1] += seconds
+            if seconds > data[2]:
+                data[2] = seconds
+            data[3][b] = data[3].get(b, 0) + 1
+
+    def clear(self):
+        """Remove all the times."""
+        with self._lock:
+            self._stages = {}
+
+    def state(self):
+        """The times, as plain data for sending between processes.
+
+        Returns
+        -------
+        dict(str, list)
+        """
+        with self._lock:
+            return {
+                stage: [count, total, maximum, dict(bins)]
+                for stage, (count, total, maximum, bins) in self._stages.items()
+            }
+
+    def merge(self, state):
+        """Add the times from other timers.
+
+        Parameters
+        ----------
+        state : dict(str, list)
+            The state of the other timers, from :meth:`state`.
+        """
+        with self._lock:
+            for stage, (count, total, maximum, bins) in state.items():
+                if stage not in self._stages:
+                    self._stages[stage] = [0, 0.0, 0.0, {}]
+                data = self._stages[stage]
+                data[0] += count
+                data[1] += total
+                data[2] = max(data[2], maximum)
+                for b, n in bins.items():
+                    data[3][b] = data[3].get(b, 0) + n
+
+    def statistics(self):
+        """The statistics of the times of each stage.
+
+        Returns
+        -------
+        dict(str, dict(str, float))
+            The "count", "total", "p50", "p95" and "max" for each stage, with
+            times in seconds.
+        """
+        result = {}
+        for stage, (count, total, maximum, bins) in self.state().items():
+            result[stage] = {
+                "count": count,
+                "total": total,
+                "p50": _percentile(bins, count, 0.50, maximum),
+                "p95": _percentile(bins, count, 0.95, maximum),
+                "max": maximum,
+            }
+        return result
+
+    def table(self):
+        """The statistics as a text table, slowest stages first.
+
+        Returns
+        -------
+        str
+        """
+        statistics = self.statistics()
+        stages = sorted(statistics, key=lambda s: statistics[s]["total"], reverse=True)
+        width = max([5] + [len(stage) for stage in stages])
+        lines = [
+            f"{'Stage':<{width}s} {'Count':>8s} {'Total (s)':>10s} {'p50 (ms)':>9s} "
+            f"{'p95 (ms)':>9s} {'max (ms)':>9s}",
+            "-" * (width + 50),
+        ]
+        for stage in stages:
+            data = statistics[stage]
+            lines.append(
+                f"{stage:<{width}s} {data['count']:8d} {data['total']:10.3f} "
+                f"{1000 * data['p50']:9.2f} {1000 * data['p95']:9.2f} "
+                f"{1000 * data['max']:9.2f}"
+            )
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Write the statistics to a JSON file.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            The file.
+        """
+        with open(path, "w") as fd:
+            json.dump(self.statistics(), fd, indent=4, sort_keys=True)
+
+
+def _percentile(bins, count, fraction, maximum):
+    """Estimate a percentile from a histogram of times.
+
+    Parameters
+    ----------
+    bins : dict(int, int)
+        The number of times in each bin.
+    count : int
+        The total number of times.
+    fraction : float
+        The percentile as a fraction, e.g. 0.95
+    maximum : float
+        The largest time, which bounds the estimate.
+
+    Returns
+    -------
+    float
+        The middle of the bin containing the percentile.
+    """
+    if count == 0:
+        return 0.0
+    target = fraction * count
+    total = 0
+    for b in sorted(bins):
+        total += bins[b]
+        if total >= target:
+            return min(math.exp((b + 0.5) / BINS_PER_E), maximum)
+    return maximum
+
+
+# The timers for this process
+timers = StageTimers()
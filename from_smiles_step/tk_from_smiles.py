@@ -38,16 +38,45 @@ class TkFromSMILES(seamm.TkNode):
         for key in P:
             self[key] = P[key].widget(frame)
 
+        self["input type"].combobox.bind("<<ComboboxSelected>>", self.reset_dialog)
+        self["input type"].combobox.bind("<Return>", self.reset_dialog)
+        self["input type"].combobox.bind("<FocusOut>", self.reset_dialog)
+
+        self.reset_dialog()
+
+    def reset_dialog(self, widget=None):
+        """Layout the widgets as needed for the current input type."""
+        frame = self["frame"]
+        for slave in frame.grid_slaves():
+            slave.grid_forget()
+
+        input_type = self["input type"].get()
+
+        if input_type == "file":
+            items = ("input type", "notation", "input file")
+        else:
+            items = ("input type", "notation", "smiles string")
+        items += (
+            "smiles flavor",
+            "resolvers",
+            "3-D coordinates",
+            "time limit",
+            "errors",
+        )
+        if input_type != "single structure":
+            items += (
+                "number of processes",
+                "existing structures",
+                "structure handling",
+                "subsequent structure handling",
+            )
+        else:
+            items += ("structure handling",)
+        items += ("system name", "configuration name")
+
         widgets = []
         row = 0
-        for item in (
-            "notation",
-            "smiles string",
-            "smiles flavor",
-            "structure handling",
-            "system name",
-            "configuration name",
-        ):
+        for item in items:
             self[item].grid(row=row, column=0, columnspan=2, sticky=tk.EW)
             widgets.append(self[item])
             row += 1
@@ -53,6 +53,7 @@ setup(
     # Required packages, pulls from pip if needed; do not use for Conda
     # deployment
     install_requires=requirements,
+    python_requires='>=3.8',
 
     test_suite='tests',
     # tests_require=test_requirements,
@@ -76,13 +77,15 @@ setup(
         'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     entry_points={
         'org.molssi.seamm': [
-            'FromSMILESStep = from_smiles_step:FromSMILESStep',
+            'FromSMILESStep = from_smiles_step.from_smiles_step:FromSMILESStep',
         ],
         'org.molssi.seamm.tk': [
-            'FromSMILESStep = from_smiles_step:FromSMILESStep',
+            'FromSMILESStep = from_smiles_step.from_smiles_step:FromSMILESStep',
         ],
     },
 )
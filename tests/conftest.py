@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fixtures for testing the from_smiles_step package."""
+
+import pytest
+
+
+@pytest.fixture
+def from_smiles(tmp_path):
+    """A FromSMILES step in a minimal flowchart with an empty system database.
+
+    Returns the node and the system database.
+    """
+    import molsystem
+    import seamm
+
+    if seamm.flowchart_variables is None:
+        seamm.flowchart_variables = seamm.Variables()
+
+    from from_smiles_step import FromSMILES
+
+    flowchart = seamm.Flowchart(directory=str(tmp_path))
+    system_db = molsystem.SystemDB(
+        filename=f"file:{tmp_path.name}?mode=memory&cache=shared"
+    )
+    seamm.flowchart_variables.set_variable("_system_db", system_db)
+
+    node = FromSMILES(flowchart=flowchart)
+    flowchart.add_node(node)
+    flowchart.add_edge(flowchart.get_node("1"), node)
+    flowchart.set_ids()
+
+    yield node, system_db
+
+    system_db.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for creating many structures in one step."""
+
+import pytest
+
+from from_smiles_step.conversion import convert_many
+from from_smiles_step.cost import CostModel
+
+
+def test_single(from_smiles):
+    """A single SMILES creates one structure."""
+    node, system_db = from_smiles
+    node.parameters["smiles string"].value = "CCO"
+    node.run()
+
+    assert system_db.n_systems == 1
+    assert system_db.system.configuration.n_atoms == 9
+
+
+def test_lines(from_smiles):
+    """Each line of the input is a structure in its own system."""
+    node, system_db = from_smiles
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "CCO\n\nc1ccccc1\nC"
+    P["structure handling"].value = "Create a new system and configuration"
+    node.run()
+
+    assert system_db.n_systems == 3
+    assert [s.name for s in system_db.systems] == ["CCO", "c1ccccc1", "C"]
+
+
+def test_file(from_smiles, tmp_path):
+    """A SMILES file gives the structure and title for each structure."""
+    path = tmp_path / "input.smi"
+    path.write_text("CCO ethanol\n# A comment\nCCN ethyl amine\n")
+
+    node, system_db = from_smiles
+    P = node.parameters
+    P["input type"].value = "file"
+    P["input file"].value = str(path)
+    P["system name"].value = "{title}"
+    P["subsequent structure handling"].value = "Create a new system and configuration"
+    node.run()
+
+    assert [s.name for s in system_db.systems] == ["ethanol", "ethyl amine"]
+
+
+def test_processes(from_smiles):
+    """Building in worker processes gives the same structures as serially."""
+    smiles = ["CCO", "c1ccccc1", "CC(=O)[O-]", "NC1CCCCC1"]
+
+    node, system_db = from_smiles
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "\n".join(smiles)
+    P["structure handling"].value = "Create a new system and configuration"
+    P["number of processes"].value = 2
+    node.run()
+
+    assert [s.name for s in system_db.systems] == smiles
+    configuration = system_db.systems[2].configuration
+    assert configuration.charge == -1
+    assert configuration.n_atoms == 7
+    assert configuration.bonds.n_bonds == 6
+
+
+def test_transactions(from_smiles):
+    """Structures are committed in chunks, keeping those before a failure."""
+    node, system_db = from_smiles
+    node.options = {"transaction_size": 2}
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["notation"].value = "SMILES"
+    P["resolvers"].value = "rdkit"
+    P["smiles string"].value = "C\nCC\nCCC\nC1CC"
+    P["structure handling"].value = "Create a new system and configuration"
+
+    commits = []
+    commit_transaction = system_db.commit_transaction
+
+    def counting():
+        commits.append(system_db.n_systems)
+        commit_transaction()
+
+    system_db.commit_transaction = counting
+    with pytest.raises(RuntimeError, match="Entry 4"):
+        node.run()
+
+    assert commits == [2, 3]
+    assert [s.name for s in system_db.systems] == ["C", "CC", "CCC"]
+    assert not system_db.deferred_commit
+
+
+@pytest.mark.parametrize("n_workers, max_unique", [(1, 100), (2, 100), (1, 1)])
+def test_deduplicate(n_workers, max_unique):
+    """Each molecule is converted once, and its result given to its duplicates."""
+    texts = ["c1ccccc1", "CCO", "C1=CC=CC=C1", "OCC", "caffeine", "CCN", "c1ccccc1"]
+    results = list(
+        convert_many(
+            texts,
+            "perceive",
+            "rdkit",
+            n_workers=n_workers,
+            settings={"resolvers": ["rdkit"]},
+            deduplicate=True,
+            max_unique=max_unique,
+            min_batch=1,
+        )
+    )
+
+    assert len(results) == len(texts)
+    assert results[4][0] is None
+    caches = [None if r is None else r["cache"] for r, _ in results]
+    if max_unique > 1:
+        assert caches == [None, None, "duplicate", "duplicate", None, None, "duplicate"]
+        assert results[2][0]["record"] == results[0][0]["record"]
+    else:
+        assert "duplicate" not in caches
+    n_atoms = [len(r["record"]["atno"]) for r, _ in results if r is not None]
+    assert n_atoms == [12, 9, 12, 9, 10, 12]
+
+
+@pytest.mark.parametrize("min_batch, workers", [(1, 3), (32, 1)])
+def test_workers_used(min_batch, workers):
+    """No more workers are started than there are chunks of a short stream,
+    and none for a small batch."""
+    stats = {}
+    results = list(
+        convert_many(
+            (text for text in ("C", "CC", "CCC")),
+            "SMILES",
+            "rdkit",
+            n_workers=8,
+            settings={"resolvers": ["rdkit"]},
+            stats=stats,
+            min_batch=min_batch,
+        )
+    )
+    assert [len(r["record"]["atno"]) for r, _ in results] == [5, 8, 11]
+    assert stats == {"workers": workers}
+
+
+def test_cheap_batch():
+    """A batch predicted to be quick is converted in this process."""
+    stats = {}
+    texts = ["C" * (n % 5 + 1) for n in range(40)]
+    results = list(
+        convert_many(
+            texts,
+            "SMILES",
+            "rdkit",
+            n_workers=4,
+            settings={"resolvers": ["rdkit"]},
+            cost=CostModel(),
+            stats=stats,
+        )
+    )
+    assert len(results) == 40
+    assert stats == {"workers": 1}
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the caches of structures."""
+
+import pytest
+
+from from_smiles_step.cache import ConformerCache, FailureCache, PubChemCache
+from from_smiles_step.conversion import convert
+from from_smiles_step.pubchem import OfflineError
+
+record = {
+    "atno": [8, 1, 1],
+    "x": [0.0, 0.96, -0.24],
+    "y": [0.0, 0.0, 0.93],
+    "z": [0.0, 0.0, 0.0],
+    "i": [0, 0],
+    "j": [1, 2],
+    "bondorder": [1, 1],
+    "charge": 0,
+    "spin_multiplicity": 1,
+}
+
+water_sdf = """962
+  PubChem
+
+  3  2  0     0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 O   0  0  0  0  0  0  0  0  0  0  0  0
+    0.2774    0.8929    0.2544 H   0  0  0  0  0  0  0  0  0  0  0  0
+    0.6068   -0.2383   -0.7169 H   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  1  0  0  0  0
+  1  3  1  0  0  0  0
+M  END
+$$$$
+"""
+
+
+def test_conformer_cache(tmp_path):
+    """Structures can be put in and retrieved from the cache."""
+    with ConformerCache(tmp_path / "conformers.db") as cache:
+        key = cache.key("SMILES:O", "rdkit", "reorient", "versions")
+        assert cache.get(key) is None
+        cache.put(key, "SMILES:O", record, "SMILES", "rdkit")
+        assert cache.get(key) == (record, "SMILES", "rdkit")
+        assert cache.statistics == {"hits": 1, "misses": 1}
+
+    # and it persists
+    with ConformerCache(tmp_path / "conformers.db") as cache:
+        assert cache.get(key) == (record, "SMILES", "rdkit")
+
+
+def test_conformer_cache_eviction(tmp_path):
+    """The least recently used structures are evicted."""
+    with ConformerCache(
+        tmp_path / "conformers.db", max_entries=2, touch_interval=0.0
+    ) as cache:
+        keys = [cache.key(f"SMILES:{n}", "rdkit", "", "") for n in range(3)]
+        cache.put(keys[0], "0", record, "SMILES", "rdkit")
+        cache.put(keys[1], "1", record, "SMILES", "rdkit")
+        cache.get(keys[0])
+        cache.put(keys[2], "2", record, "SMILES", "rdkit")
+        assert cache.evict() == 1
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+
+
+def test_conformer_cache_touch(tmp_path):
+    """A hit only writes the time last used if it is old."""
+    with ConformerCache(tmp_path / "conformers.db") as cache:
+        key = cache.key("SMILES:O", "rdkit", "", "")
+        cache.put(key, "SMILES:O", record, "SMILES", "rdkit")
+        n_changes = cache.db.total_changes
+        assert cache.get(key) is not None
+        assert cache.db.total_changes == n_changes
+
+        cache.db.execute("UPDATE conformers SET last_used = 0.0")
+        n_changes = cache.db.total_changes
+        assert cache.get(key) is not None
+        assert cache.db.total_changes == n_changes + 1
+
+
+def test_step_uses_cache(from_smiles, tmp_path):
+    """The second time a molecule is created it comes from the cache."""
+    node, system_db = from_smiles
+    node.options = {"conformer_cache": str(tmp_path / "conformers.db")}
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "CCO\nOCC\nc1ccccc1"
+    P["structure handling"].value = "Create a new system and configuration"
+    node.run()
+
+    with ConformerCache(tmp_path / "conformers.db") as cache:
+        n = cache.db.execute("SELECT COUNT(*) FROM conformers").fetchone()[0]
+    assert n == 2
+
+    configurations = [system.configuration for system in system_db.systems]
+    assert configurations[0].coordinates == configurations[1].coordinates
+
+
+def test_pubchem_cache(tmp_path):
+    """Responses are cached case-insensitively for names, and expire."""
+    with PubChemCache(tmp_path / "pubchem.db") as cache:
+        assert cache.get("name", "water") is None
+        cache.put("name", "water", water_sdf)
+        assert cache.get("name", "water") == water_sdf
+        assert cache.purge() == 0
+
+    with PubChemCache(tmp_path / "pubchem.db", ttl=0.0) as cache:
+        assert cache.get("name", "water") is None
+        assert cache.purge() == 1
+
+
+def test_offline(tmp_path):
+    """Offline, names are resolved only from the cache."""
+    settings = {
+        "pubchem cache": str(tmp_path / "pubchem.db"),
+        "pubchem cache ttl": 30.0,
+        "offline": True,
+    }
+    with PubChemCache(settings["pubchem cache"]) as cache:
+        cache.put("name", "water", water_sdf)
+
+    result = convert("Water", "name", "rdkit", settings=settings)
+    assert result["record"]["atno"] == [8, 1, 1]
+    assert result["notation"] == "name"
+
+    with pytest.raises(RuntimeError):
+        convert("benzene", "name", "rdkit", settings=settings)
+
+    with pytest.raises(RuntimeError) as e:
+        convert("XLYOFNOQVPJJNP-UHFFFAOYSA-N", "InChIKey", "rdkit", settings=settings)
+    assert isinstance(e.value.__cause__, OfflineError)
+
+
+def test_failure_cache(tmp_path):
+    """Resolvers that failed are skipped the next time."""
+    settings = {
+        "failure cache": str(tmp_path / "failures.db"),
+        "failure cache ttl": 7.0,
+        "offline": True,
+    }
+    text = "C1CC(C)(C)(C)C1"
+    with pytest.raises(RuntimeError):
+        convert(text, "SMILES", "rdkit", settings=settings)
+
+    with FailureCache(settings["failure cache"]) as cache:
+        failed = cache.failed(text)
+    # Failing offline is not a failure of the PubChem lookup
+    assert "rdkit SMILES" in failed
+    assert "PubChem smiles" not in failed
+
+    with FailureCache(settings["failure cache"], ttl=0.0) as cache:
+        assert cache.failed(text) == {}
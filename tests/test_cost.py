@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the model of the cost of creating structures."""
+
+import random
+
+import pytest
+
+from from_smiles_step.cache import TimingHistory
+from from_smiles_step.conversion import convert_many
+from from_smiles_step.cost import CostModel, cost_features, TimingLog
+
+
+@pytest.mark.parametrize(
+    "text, values",
+    [
+        ("CCO", [1, 3, 9, 0, 0, 0, 0, 0]),
+        ("c1ccccc1", [1, 6, 36, 1, 0, 0, 0, 1]),
+        ("C[C@@H](N)C(=O)O", [1, 6, 36, 0, 2, 1, 1, 0]),
+        ("F/C=C/F", [1, 4, 16, 0, 0, 1, 0, 0]),
+        ("CCCCCC", [1, 6, 36, 0, 0, 0, 3, 0]),
+        ("c1ccc2ccccc2c1C1CC1", [1, 13, 169, 3, 0, 0, 1, 2]),
+        ("caffeine", [1, 0, 0, 0, 0, 0, 0, 0]),
+    ],
+)
+def test_features(text, values):
+    """The features are counted from the SMILES."""
+    assert cost_features(text) == values
+
+
+def test_fit():
+    """Fitting to exact times recovers the coefficients."""
+    coefficients = [0.01, 0.002, 0.0003, 0.004, 0.0005, 0.006, 0.003, 0.002]
+    model = CostModel(coefficients)
+    rng = random.Random(5)
+    samples = []
+    for _ in range(200):
+        atoms = rng.randint(1, 60)
+        values = [1, atoms, atoms * atoms] + [rng.randint(0, 5) for _ in range(5)]
+        samples.append((values, model.predict(values)))
+
+    fitted = CostModel.fit(samples, regularization=0.0)
+    assert fitted.coefficients == pytest.approx(coefficients, rel=1e-6)
+
+    assert CostModel.fit(samples[0:10]).coefficients == CostModel().coefficients
+
+    # Samples with the features of an older version are ignored
+    old = [([1, 2, 4, 0, 0, 0], 0.1)] * 100
+    assert CostModel.fit(old).coefficients == CostModel().coefficients
+
+
+@pytest.mark.parametrize("regularization", [0.0, 1.0e-6])
+def test_fit_singular(regularization):
+    """A history of one molecule gives a finite fit that predicts its time."""
+    samples = [(cost_features("CCO"), 0.02)] * 100
+    model = CostModel.fit(samples, regularization=regularization)
+    assert all(abs(c) < 1.0 for c in model.coefficients)
+    assert model("CCO") == pytest.approx(0.02, rel=1e-3)
+
+
+def test_history(tmp_path):
+    """The history keeps the most recent times, which the log adds."""
+    history = TimingHistory(tmp_path / "timings.db", max_entries=5)
+    log = TimingLog(
+        CostModel(), path=tmp_path / "timings.tsv", history=history, batch=3
+    )
+    for i in range(8):
+        log.add(i + 1, "C" * (i + 1), 0.01 * (i + 1))
+    log.add(9, "caffeine", 0.001, local=False)
+    log.close()
+
+    samples = history.samples()
+    assert len(samples) == 5
+    assert [seconds for _, seconds in samples] == pytest.approx(
+        [0.04, 0.05, 0.06, 0.07, 0.08]
+    )
+    assert len((tmp_path / "timings.tsv").read_text().splitlines()) == 10
+    assert log.correlation > 0.9
+
+
+def test_longest_first():
+    """Scheduling the expensive structures first keeps the results in order."""
+    texts = ["C", "CCCCCCCCCCCC", "CCO", "c1ccccc1CCCC", "N", "CCN", "O"]
+    results = list(
+        convert_many(
+            texts,
+            "SMILES",
+            "rdkit",
+            n_workers=2,
+            settings={"resolvers": ["rdkit"]},
+            chunksize=2,
+            cost=CostModel(),
+            min_batch=1,
+            min_cost=0.0,
+        )
+    )
+
+    n_atoms = [len(result["record"]["atno"]) for result, _ in results]
+    assert n_atoms == [5, 38, 9, 24, 4, 10, 3]
+    assert all(result["predicted"] > 0 for result, _ in results)
+    assert all(result["time"] > 0 for result, _ in results)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for skipping structures already in the database."""
+
+import pytest
+
+from from_smiles_step.checkpoint import Checkpoint
+
+
+def batch(node, text):
+    """Set up the node to create a structure for each line of the text."""
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = text
+    P["existing structures"].value = "skip"
+    P["structure handling"].value = "Create a new system and configuration"
+    P["subsequent structure handling"].value = "Create a new system and configuration"
+
+
+def test_skip_existing(from_smiles):
+    """Molecules already in the database are not created again."""
+    node, system_db = from_smiles
+
+    # A structure not created by this step is recognized from its structure
+    configuration = system_db.create_system().create_configuration()
+    configuration.from_smiles("CCC")
+
+    batch(node, "CCO\nc1ccccc1")
+    node.run()
+    assert system_db.n_systems == 3
+
+    batch(node, "OCC\nC1=CC=CC=C1\nCCN\nCCC")
+    node.run()
+    assert system_db.n_systems == 4
+    assert system_db.systems[-1].name == "CCN"
+
+
+def test_unspecified_stereo(from_smiles):
+    """Inputs without stereochemistry match any of their stereoisomers."""
+    node, system_db = from_smiles
+
+    for smiles in ("CC(O)CC", "C/C=C/C"):
+        configuration = system_db.create_system().create_configuration()
+        configuration.from_smiles(smiles)
+
+    # The keys are stored even when not skipping existing structures
+    batch(node, "CCO")
+    node.parameters["existing structures"].value = "create again"
+    node.run()
+
+    batch(node, "CCC(C)O\nCC=CC\nC/C=C\\C\nOCC")
+    node.run()
+    assert [s.name for s in system_db.systems][3:] == ["C/C=C\\C"]
+
+
+def test_checkpoint(tmp_path):
+    """The checkpoint is only used for the same, unchanged input and database."""
+    path = tmp_path / "input.smi"
+    path.write_text("CCO\nCCN\n")
+
+    checkpoint = Checkpoint(tmp_path / "checkpoints", path, "seamm.db")
+    assert checkpoint.line == 0
+    checkpoint.save(1)
+    assert checkpoint.line == 1
+    assert Checkpoint(tmp_path / "checkpoints", path, "other.db").line == 0
+
+    path.write_text("CCO\nCCN\nCCC\n")
+    assert checkpoint.line == 0
+
+    checkpoint.save(3)
+    checkpoint.remove()
+    assert checkpoint.line == 0
+
+
+def test_resume(from_smiles, tmp_path):
+    """A rerun of a failed batch continues after the last committed entry."""
+    path = tmp_path / "input.smi"
+    path.write_text("C\nCC\nC1CC\nCCC\n")
+
+    node, system_db = from_smiles
+    node.options = {
+        "transaction_size": 1,
+        "checkpoint_directory": str(tmp_path / "checkpoints"),
+    }
+    P = node.parameters
+    P["input type"].value = "file"
+    P["input file"].value = str(path)
+    P["notation"].value = "SMILES"
+    P["resolvers"].value = "rdkit"
+    P["existing structures"].value = "skip"
+    P["subsequent structure handling"].value = "Create a new system and configuration"
+
+    checkpoint = Checkpoint(tmp_path / "checkpoints", path, system_db.filename)
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="Entry 3"):
+            node.run()
+        assert checkpoint.line == 2
+        assert system_db.n_systems == 2
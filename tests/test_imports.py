@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests that importing the package stays cheap, for headless jobs."""
+
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Modules that a bare import of the package must not load
+heavy = ("tkinter", "seamm_widgets", "seamm", "molsystem", "rdkit", "openbabel")
+
+
+def imported(code):
+    """The modules imported by running the code in a new interpreter."""
+    code += "\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_package():
+    """Importing the package imports none of the step's dependencies."""
+    modules = imported("import from_smiles_step")
+    assert [m for m in heavy if m in modules] == []
+
+
+def test_compute_node():
+    """The compute node does not import the graphical node."""
+    modules = imported("import from_smiles_step\nfrom_smiles_step.FromSMILES")
+    assert "from_smiles_step.tk_from_smiles" not in modules
+    assert "from_smiles_step.pubchem_standin" not in modules
+
+
+def test_budget():
+    """Importing the package is quick."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import from_smiles_step"], check=True)
+    with_package = time.perf_counter() - start
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    bare = time.perf_counter() - start
+    assert with_package - bare < 0.5
+
+
+def test_attributes():
+    """The classes are still available from the package."""
+    import from_smiles_step
+
+    assert from_smiles_step.FromSMILES.__name__ == "FromSMILES"
+    assert "TkFromSMILES" in dir(from_smiles_step)
+    with pytest.raises(AttributeError):
+        from_smiles_step.Unknown
+
+
+def test_plugin():
+    """Loading the plugin and describing the step imports none of its dependencies."""
+    modules = imported(
+        "from from_smiles_step.from_smiles_step import FromSMILESStep\n"
+        "FromSMILESStep().description()"
+    )
+    assert [m for m in heavy if m in modules] == []
+    assert "from_smiles_step.from_smiles" not in modules
+
+
+def test_create_node():
+    """The plugin creates the node on demand."""
+    import seamm
+    from from_smiles_step.from_smiles_step import FromSMILESStep
+
+    flowchart = seamm.Flowchart()
+    node = FromSMILESStep().create_node(flowchart=flowchart)
+    assert node.__class__.__name__ == "FromSMILES"
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the counters of the paths taken creating structures."""
+
+import json
+from pathlib import Path
+
+from from_smiles_step.cache import MetricsStore
+from from_smiles_step.metrics import Counters
+
+
+def test_store(tmp_path):
+    """The counts of runs are added to the cumulative totals."""
+    store = MetricsStore(tmp_path / "metrics.db")
+    run = Counters()
+    run.add(
+        "from_smiles_resolver_attempts_total",
+        resolver="rdkit SMILES",
+        outcome="success",
+    )
+    run.add("from_smiles_failures_total", 2)
+    store.add(run)
+    store.add(run)
+
+    totals = store.totals()
+    assert (
+        totals.get(
+            "from_smiles_resolver_attempts_total",
+            outcome="success",
+            resolver="rdkit SMILES",
+        )
+        == 2
+    )
+    assert totals.get("from_smiles_failures_total") == 4
+
+    text = totals.prometheus()
+    assert "# TYPE from_smiles_failures_total counter" in text
+    assert (
+        'from_smiles_resolver_attempts_total{outcome="success",resolver="rdkit SMILES"}'
+        " 2" in text
+    )
+
+
+def test_step(from_smiles, tmp_path):
+    """A batch counts the notations, resolvers and fallbacks in its workers."""
+    node, system_db = from_smiles
+    node.options["metrics_database"] = str(tmp_path / "metrics.db")
+    node.options["prometheus_textfile"] = str(tmp_path / "from_smiles.prom")
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "CCO\nc1ccccc1\nCCO\nInChI=1S/CH4/h1H4"
+    P["resolvers"].value = "rdkit, InChI"
+    P["number of processes"].value = 2
+    node.run()
+
+    data = json.loads((Path(node.directory) / "metrics.json").read_text())
+    run = {
+        (name, tuple(sorted(count["labels"].items()))): count["value"]
+        for name, counts in data["run"].items()
+        for count in counts
+    }
+    structures = "from_smiles_structures_total"
+    assert (
+        run[
+            structures,
+            (("flavor", "rdkit"), ("notation", "SMILES"), ("perceived", "yes")),
+        ]
+        == 3
+    )
+    attempts = "from_smiles_resolver_attempts_total"
+    assert run[attempts, (("outcome", "success"), ("resolver", "rdkit SMILES"))] == 2
+    assert run[attempts, (("outcome", "success"), ("resolver", "openbabel InChI"))] == 1
+    assert run["from_smiles_conformer_cache_total", (("outcome", "duplicate"),)] == 1
+    assert data["cumulative"] == data["run"]
+
+    assert "from_smiles_structures_total" in (tmp_path / "from_smiles.prom").read_text()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for perceiving the line notation of strings."""
+
+import pytest
+
+from from_smiles_step.conversion import convert, perceive
+from from_smiles_step.perception import classify, classify_many, lex_smiles, notations
+
+
+@pytest.mark.parametrize(
+    "text, notation",
+    [
+        ("BSYNRYMUTXBXSQ-UHFFFAOYSA-N", "InChIKey"),
+        ("InChI=1S/CH4/c1H4", "InChI"),
+        ("CID:2244", "CID"),
+        ("2244", "CID"),
+        ("50-78-2", "CAS"),
+        ("CC(=O)Oc1ccccc1C(=O)O", "SMILES"),
+        ("[NH4+].[Cl-]", "SMILES"),
+        ("C[C@@H](N)C(=O)O", "SMILES"),
+        ("caffeine", "name"),
+        ("acetic acid", "name"),
+        ("2,4-dinitrophenol", "name"),
+    ],
+)
+def test_classify(text, notation):
+    """The notation of clear cases is perceived with high confidence."""
+    result, confidence = classify(text)
+    assert result == notation
+    assert confidence >= 0.9
+
+
+def test_ambiguous():
+    """Words that are also valid SMILES can be either."""
+    assert classify("CoN")[0] == "SMILES"
+    assert perceive("CoN") == "SMILES or name"
+    assert perceive("caffeine") == "name"
+    assert perceive("50-78-2") == "name"
+    assert perceive("50-78-3") == "name"
+
+
+@pytest.mark.parametrize("text", ["Co", "No", "Cl", "Br"])
+def test_short_words(text):
+    """Short words of element symbols are perceived as SMILES or names."""
+    notation, confidence = classify(text)
+    assert confidence < 0.9
+    assert perceive(text) == "SMILES or name"
+
+
+def test_short_word_as_name(tmp_path):
+    """A short word is tried as a name before as SMILES."""
+    path = tmp_path / "names.tsv"
+    path.write_text("Cl\t[Cl-]\n")
+    settings = {"resolvers": ["rdkit", "dictionary"], "dictionary": str(path)}
+    result = convert("Cl", "perceive", "rdkit", settings=settings)
+    assert result["notation"] == "name"
+    assert len(result["record"]["atno"]) == 1
+    assert perceive("CO") == "SMILES"
+
+
+@pytest.mark.parametrize(
+    "text", ["C1CC", "CC(C", "CC)C", "C()C", "C[Xx+", "(C)C", "CC=", "C..C"]
+)
+def test_invalid_smiles(text):
+    """The lexer finds the errors in the grammar of SMILES."""
+    n_atoms, error = lex_smiles(text)
+    assert error is not None
+
+
+def test_classify_many():
+    """The batch classification agrees with classifying one by one."""
+    texts = [
+        "BSYNRYMUTXBXSQ-UHFFFAOYSA-N",
+        "InChI=1S/CH4/c1H4",
+        "CID:2244",
+        "50-78-2",
+        "CC(=O)Oc1ccccc1C(=O)O",
+        "C%12CC%12",
+        "[13CH4]",
+        "caffeine",
+        "acetic acid",
+        "C1CC",
+        "CC(C",
+    ]
+    codes, errors = classify_many(texts)
+    assert [notations[code] for code in codes] == [classify(t)[0] for t in texts]
+    assert list(errors) == [0] * 9 + [1, 1]
+
+    with pytest.raises(ValueError):
+        classify_many(["CCO\nCCN"])
+
+
+def test_no_backtracking():
+    """Long strings that are nearly SMILES are classified quickly."""
+    import time
+
+    texts = ["C" * 30 + "!", "C(=O)" * 1000 + "!", "CCl" * 1000 + "!"]
+    start = time.perf_counter()
+    classify_many(texts)
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests of resolving many identifiers with PubChem at once."""
+
+import asyncio
+import time
+
+import pytest
+
+from from_smiles_step.cache import PubChemCache
+from from_smiles_step.pubchem_batch import PubChemBatch, split_sdf, TokenBucket
+from from_smiles_step.pubchem_standin import StandInPubChem
+
+
+@pytest.fixture(scope="module")
+def standin():
+    """The stand-in for PubChem, shared by the tests in this module."""
+    with StandInPubChem() as result:
+        yield result
+
+
+@pytest.fixture
+def batch(standin, tmp_path):
+    """A batch resolver using the stand-in and an empty PubChem cache."""
+    standin.rate_limit = None
+    settings = {
+        "pubchem cache": str(tmp_path / "pubchem.db"),
+        "pubchem cache ttl": 30.0,
+        "pubchem url": standin.url,
+    }
+    result = PubChemBatch(settings, concurrency=2, rate=100.0)
+    yield result
+    result.close()
+
+
+def test_resolve(batch):
+    """Names, CIDs and InChIKeys are resolved into the PubChem cache."""
+    result = batch.resolve(
+        names=["Water", "ethanol", "water", "unobtainium"],
+        cids=["CID:2244", "180", "702"],
+        inchikeys=["LFQSCWFLJHTTHZ-UHFFFAOYSA-N"],
+    )
+    assert result == {"resolved": 6, "cached": 0, "failed": 1}
+
+    # 3 names, then 1 request for the InChIKey and 1 for the 4 CIDs
+    assert batch.n_requests == 5
+    assert batch.pool.n_connections <= 2
+
+    cache = PubChemCache(batch.settings["pubchem cache"])
+    assert split_sdf(cache.get("name", "water"))[0].startswith("962\n")
+    assert cache.get("cid", "2244").startswith("2244\n")
+    assert cache.get("inchikey:InChI", "LFQSCWFLJHTTHZ-UHFFFAOYSA-N") == (
+        "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3\n"
+    )
+
+    result = batch.resolve(names=["ethanol"], cids=["702"])
+    assert result == {"resolved": 0, "cached": 2, "failed": 0}
+    assert batch.n_requests == 5
+
+
+def test_token_bucket():
+    """The token bucket keeps to its rate after the first burst."""
+
+    async def take(n):
+        bucket = TokenBucket(20.0, burst=1)
+        for _ in range(n):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    asyncio.run(take(6))
+    assert time.monotonic() - start == pytest.approx(0.25, abs=0.1)
+
+
+def test_step(from_smiles, standin, tmp_path):
+    """The step resolves the names in a batch before building the structures."""
+    standin.rate_limit = None
+    node, system_db = from_smiles
+    node.options["pubchem_url"] = standin.url
+    node.options["pubchem_cache"] = str(tmp_path / "pubchem.db")
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "water\nmethanol\nacetone"
+    P["notation"].value = "name"
+    P["resolvers"].value = "PubChem name"
+    P["structure handling"].value = "Create a new system and configuration"
+    n_requests = standin.n_requests
+    node.run()
+
+    assert system_db.n_systems == 3
+    # 3 names and one request for the structures
+    assert standin.n_requests - n_requests == 4
+
+
+def test_loop(from_smiles, standin, tmp_path):
+    """In a loop over a table, the later rows are resolved in the background."""
+    import seamm
+
+    standin.rate_limit = None
+    node, system_db = from_smiles
+    node.options["pubchem_url"] = standin.url
+    node.options["pubchem_cache"] = str(tmp_path / "pubchem.db")
+
+    table = seamm.Table.create(
+        system_db, "molecules", columns=[("name", "string", None)]
+    )
+    table.append_rows([{"name": name} for name in ("water", "ethanol", "acetone")])
+    seamm.flowchart_variables.set_variable("molecules", table)
+
+    P = node.parameters
+    P["smiles string"].value = "$_row['name']"
+    P["notation"].value = "name"
+    P["resolvers"].value = "PubChem name"
+    P["structure handling"].value = "Create a new system and configuration"
+
+    table.current_row = table.locate(position=0)
+    seamm.flowchart_variables.set_variable("_row", table.get_row())
+    node.run()
+    node._background.wait()
+    assert node._background.counts == {"resolved": 2, "cached": 0, "failed": 0}
+
+    # The later iterations find their structures in the cache
+    n_requests = standin.n_requests
+    for position in (1, 2):
+        table.current_row = table.locate(position=position)
+        seamm.flowchart_variables.set_variable("_row", table.get_row())
+        node.run()
+    assert standin.n_requests == n_requests
+    assert [s.configuration.n_atoms for s in system_db.systems] == [3, 9, 10]
+
+
+def test_loop_time_limit(from_smiles, standin, tmp_path):
+    """With a time limit, the background thread finishes before forking."""
+    import seamm
+
+    standin.rate_limit = None
+    node, system_db = from_smiles
+    node.options["pubchem_url"] = standin.url
+    node.options["pubchem_cache"] = str(tmp_path / "pubchem.db")
+
+    table = seamm.Table.create(
+        system_db, "molecules", columns=[("name", "string", None)]
+    )
+    table.append_rows([{"name": name} for name in ("water", "ethanol", "acetone")])
+    seamm.flowchart_variables.set_variable("molecules", table)
+
+    P = node.parameters
+    P["smiles string"].value = "$_row['name']"
+    P["notation"].value = "name"
+    P["resolvers"].value = "PubChem name"
+    P["time limit"].value = 30.0
+    P["structure handling"].value = "Create a new system and configuration"
+
+    table.current_row = table.locate(position=0)
+    seamm.flowchart_variables.set_variable("_row", table.get_row())
+    standin.latency = 0.5
+    try:
+        node.run()
+    finally:
+        standin.latency = 0.0
+    assert not node._background.busy
+    assert node._background.counts == {"resolved": 2, "cached": 0, "failed": 0}
+    assert system_db.systems[0].configuration.n_atoms == 3
+
+
+def test_background_cleanup(standin, tmp_path, monkeypatch):
+    """The background thread is busy until it has closed its caches."""
+    from from_smiles_step import pubchem_batch
+
+    closed = []
+    close_caches = pubchem_batch.close_caches
+
+    def slow_close():
+        busy = background.busy
+        time.sleep(0.3)
+        close_caches()
+        closed.append(busy)
+
+    monkeypatch.setattr(pubchem_batch, "close_caches", slow_close)
+    standin.rate_limit = None
+    settings = {
+        "resolvers": ["PubChem name"],
+        "pubchem cache": str(tmp_path / "pubchem.db"),
+        "pubchem cache ttl": 30.0,
+        "pubchem url": standin.url,
+    }
+    background = pubchem_batch.BackgroundBatch(settings, notation="name")
+    background.submit(["water"])
+    background.wait()
+    assert closed == [True]
+    assert not background.busy
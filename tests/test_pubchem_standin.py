@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests of the PubChem paths, using the local stand-in for PubChem."""
+
+import molsystem
+import pytest
+import requests
+
+from from_smiles_step.conversion import convert
+from from_smiles_step.pubchem_standin import StandInPubChem
+
+
+@pytest.fixture(scope="module")
+def standin():
+    """The stand-in for PubChem, shared by the tests in this module."""
+    with StandInPubChem() as result:
+        yield result
+
+
+@pytest.fixture
+def settings(standin):
+    """The settings for the conversion, using the stand-in."""
+    standin.rate_limit = None
+    return {"resolvers": ["PubChem name", "PubChem InChIKey", "PubChem cid"]}
+
+
+@pytest.mark.parametrize(
+    "text, notation, n_atoms",
+    [
+        ("Aspirin", "name", 21),
+        ("BSYNRYMUTXBXSQ-UHFFFAOYSA-N", "InChIKey", 21),
+        ("CID:2519", "CID", 24),
+    ],
+)
+def test_notations(settings, text, notation, n_atoms):
+    """Names, InChIKeys and CIDs are resolved by the stand-in."""
+    result = convert(text, notation, "rdkit", settings=settings)
+    assert len(result["record"]["atno"]) == n_atoms
+
+
+def test_step(from_smiles, standin):
+    """The step is pointed at the stand-in by its option."""
+    node, system_db = from_smiles
+    node.options["pubchem_url"] = standin.url
+    P = node.parameters
+    P["smiles string"].value = "caffeine"
+    P["notation"].value = "name"
+    P["resolvers"].value = "PubChem name"
+    node.run()
+
+    assert system_db.system.configuration.n_atoms == 24
+
+
+def test_batch(standin):
+    """Several CIDs can be requested at once."""
+    response = requests.get(f"{standin.url}/compound/cid/702,2244,1/cids/TXT")
+    assert response.text.split() == ["702", "2244"]
+
+    response = requests.post(
+        f"{standin.url}/compound/inchikey/property/InChI/TXT",
+        data={"inchikey": "LFQSCWFLJHTTHZ-UHFFFAOYSA-N"},
+    )
+    assert response.text == "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3\n"
+
+
+def test_faults(settings, standin):
+    """Injected errors and the rate limit give the responses of a busy PubChem."""
+    standin.inject(503)
+    with pytest.raises(RuntimeError, match="HTTP 503"):
+        convert("water", "name", "rdkit", settings=settings)
+    result = convert("water", "name", "rdkit", settings=settings)
+    assert len(result["record"]["atno"]) == 3
+
+    with pytest.raises(RuntimeError, match="No 3-D structure"):
+        convert("unobtainium", "name", "rdkit", settings=settings)
+
+    standin.rate_limit = 2
+    codes = [
+        requests.get(f"{standin.url}/compound/cid/962/cids/TXT").status_code
+        for _ in range(4)
+    ]
+    assert codes == [200, 200, 429, 429]
+    assert molsystem.pubchem.pug_url == standin.url
+
+
+def test_pubchem_3d(settings, tmp_path):
+    """PubChem's 3-D structures are used first, and go in the conformer cache."""
+    settings = {
+        **settings,
+        "resolvers": ["PubChem 3D", "PubChem InChIKey"],
+        "pubchem 3d": True,
+        "conformer cache": str(tmp_path / "conformers.db"),
+        "conformer cache size": 100,
+    }
+    result = convert("BSYNRYMUTXBXSQ-UHFFFAOYSA-N", "perceive", "rdkit", settings)
+    assert (result["notation"], result["flavor"]) == ("InChIKey", "PubChem")
+    assert result["cache"] == "miss"
+
+    result = convert("Aspirin", "name", "rdkit", settings=settings)
+    assert result["flavor"] == "PubChem"
+    result = convert("aspirin", "name", "rdkit", settings=settings)
+    assert result["cache"] == "hit"
+
+
+def test_step_cid(from_smiles, standin):
+    """CIDs are a notation of the step, using PubChem's 3-D structure."""
+    node, system_db = from_smiles
+    node.options["pubchem_url"] = standin.url
+    P = node.parameters
+    P["smiles string"].value = "CID:2519"
+    P["notation"].value = "CID"
+    P["3-D coordinates"].value = "from PubChem if available"
+    node.run()
+
+    assert system_db.system.configuration.n_atoms == 24
+
+
+def test_pubchem_3d_smiles(tmp_path):
+    """Preferring PubChem's 3-D structures keeps the flavor in SMILES keys."""
+    settings = {
+        "resolvers": ["PubChem 3D", "SMILES"],
+        "pubchem 3d": True,
+        "conformer cache": str(tmp_path / "conformers.db"),
+        "conformer cache size": 100,
+    }
+    first = convert("CCO", "SMILES", "rdkit", settings=settings)
+    second = convert("CCO", "SMILES", "openbabel", settings=settings)
+    assert (first["flavor"], first["cache"]) == ("rdkit", "miss")
+    assert (second["flavor"], second["cache"]) == ("openbabel", "miss")
+
+
+def test_no_3d(from_smiles, standin):
+    """Without a 3-D structure in PubChem, its SMILES is embedded locally."""
+    node, system_db = from_smiles
+    node.options["pubchem_url"] = standin.url
+    P = node.parameters
+    P["smiles string"].value = "caffeine"
+    P["notation"].value = "name"
+    P["3-D coordinates"].value = "from PubChem if available"
+
+    compound = standin.index["name"]["caffeine"]
+    compound.has_3d = False
+    n_requests = standin.n_requests
+    try:
+        node.run()
+    finally:
+        compound.has_3d = True
+
+    # The 3-D structure, then the SMILES, with no repeated request
+    assert standin.n_requests - n_requests == 2
+    assert system_db.system.configuration.n_atoms == 24
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests of the limit on the rate of requests shared by processes."""
+
+import multiprocessing
+import time
+
+import pytest
+
+from from_smiles_step.ratelimit import SharedTokenBucket
+
+
+def _acquire(path, n):
+    """Take tokens from the shared bucket, in a worker process."""
+    with SharedTokenBucket(path, rate=20.0, burst=1) as bucket:
+        for _ in range(n):
+            bucket.acquire()
+
+
+def test_reserve(tmp_path):
+    """Buckets using the same file share the tokens and queue the requests."""
+    path = tmp_path / "pubchem.bucket"
+    with SharedTokenBucket(path, rate=10.0, burst=2) as first:
+        with SharedTokenBucket(path, rate=10.0, burst=2) as second:
+            assert first.shared and second.shared
+            delays = [first.reserve(), second.reserve(), first.reserve()]
+            delays.append(second.reserve())
+
+    assert delays[0:2] == [0.0, 0.0]
+    assert delays[2] == pytest.approx(0.1, abs=0.02)
+    assert delays[3] == pytest.approx(0.2, abs=0.02)
+
+
+def test_processes(tmp_path):
+    """Processes sharing the bucket together keep to its rate."""
+    path = str(tmp_path / "pubchem.bucket")
+    start = time.monotonic()
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_acquire, args=(path, 4)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    # The first token is free, and the other 11 come at 20 per second
+    assert time.monotonic() - start >= 11 / 20.0
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for reading input files as a stream."""
+
+import bz2
+import gzip
+
+from from_smiles_step.conversion import convert_many
+from from_smiles_step.reading import read_entries
+
+
+def test_compressed_smi(tmp_path):
+    """Compressed SMILES files are read on the fly."""
+    path = tmp_path / "input.smi.gz"
+    with gzip.open(path, "wt") as fd:
+        fd.write("CCO ethanol\n# A comment\n\nCCN ethyl amine\n")
+
+    assert list(read_entries(path)) == [
+        (1, "CCO", "ethanol"),
+        (4, "CCN", "ethyl amine"),
+    ]
+
+
+def test_csv_header(tmp_path):
+    """The header of a CSV file gives the columns of the structures and titles."""
+    path = tmp_path / "input.csv.bz2"
+    with bz2.open(path, "wt") as fd:
+        fd.write("id,weight,SMILES\nethanol,46.07,CCO\n\nethyl amine,45.08,CCN\n")
+
+    assert list(read_entries(path)) == [
+        (2, "CCO", "ethanol"),
+        (4, "CCN", "ethyl amine"),
+    ]
+
+
+def test_tsv(tmp_path):
+    """Without a header, the first column is the structure and the second the title."""
+    path = tmp_path / "input.tsv"
+    path.write_text("CCO\tethanol\tother\nCCN\n")
+
+    assert list(read_entries(path)) == [(1, "CCO", "ethanol"), (2, "CCN", "")]
+
+
+def test_streaming():
+    """Converting in workers reads the input as needed."""
+    read = []
+
+    def texts():
+        for text in ["C", "CC", "CCC", "CCCC", "CCCCC", "CCCCCC"]:
+            read.append(text)
+            yield text
+
+    results = convert_many(
+        texts(), "SMILES", "rdkit", n_workers=2, chunksize=1, in_flight=1
+    )
+    result, error = next(results)
+    assert error is None
+    assert len(result["record"]["atno"]) == 5
+    assert len(read) < 6
+
+    assert len(list(results)) == 5
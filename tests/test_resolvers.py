@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the chains of resolvers."""
+
+import pytest
+
+from from_smiles_step.conversion import convert
+from from_smiles_step.resolvers import expand_chain, resolver_chain
+
+
+def test_presets():
+    """The presets expand to the resolvers, with the SMILES flavor first."""
+    chain = resolver_chain(tuple(expand_chain("local-first")), "openbabel")
+    assert [r.name for r in chain] == [
+        "openbabel SMILES",
+        "dictionary",
+        "openbabel InChI",
+        "PubChem name",
+        "PubChem smiles",
+        "PubChem InChIKey",
+        "PubChem cid",
+    ]
+    assert [r.local for r in chain[0:3]] == [True, True, True]
+
+
+def test_unknown_resolver():
+    """An unknown resolver is an error."""
+    with pytest.raises(ValueError):
+        resolver_chain(("rdkit", "nonsense"), "rdkit")
+
+
+def test_dictionary():
+    """Common names are found in the local dictionary, without PubChem."""
+    settings = {"resolvers": expand_chain("offline"), "offline": True}
+    result = convert("Acetone", "perceive", "rdkit", settings=settings)
+    assert result["notation"] == "name"
+    assert result["flavor"] == "rdkit"
+    assert len(result["record"]["atno"]) == 10
+
+
+def test_chain_order():
+    """Only the resolvers in the chain are used."""
+    settings = {"resolvers": ["rdkit"]}
+    with pytest.raises(RuntimeError, match="rdkit SMILES"):
+        convert("C1CC", "SMILES", "rdkit", settings=settings)
+
+    settings = {"resolvers": ["openbabel", "rdkit"]}
+    result = convert("CCO", "SMILES", "rdkit", settings=settings)
+    assert result["flavor"] == "openbabel"
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests of retrying requests to PubChem and the circuit breaker."""
+
+import time
+
+import pytest
+
+from from_smiles_step import pubchem
+from from_smiles_step.conversion import convert
+from from_smiles_step.metrics import counters
+from from_smiles_step.pubchem_standin import StandInPubChem
+from from_smiles_step.retry import backoff_delay, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture(scope="module")
+def standin():
+    """The stand-in for PubChem, shared by the tests in this module."""
+    with StandInPubChem() as result:
+        yield result
+
+
+@pytest.fixture
+def settings(standin):
+    """The settings for the conversion, retrying quickly."""
+    standin.rate_limit = None
+    pubchem._breakers.clear()
+    counters.clear()
+    yield {
+        "resolvers": ["PubChem name", "dictionary"],
+        "pubchem url": standin.url,
+        "pubchem retries": 2,
+        "pubchem backoff": 0.01,
+        "pubchem failure threshold": 2,
+        "pubchem cooldown": 0.2,
+    }
+    pubchem._breakers.clear()
+
+
+def test_backoff():
+    """The delays are random, doubling up to the maximum."""
+    delays = [backoff_delay(attempt, base=1.0, maximum=4.0) for attempt in range(5)]
+    assert all(0.0 <= delay <= limit for delay, limit in zip(delays, (1, 2, 4, 4, 4)))
+
+
+def test_breaker():
+    """The breaker opens after repeated failures, and is tested after a while."""
+    breaker = CircuitBreaker("test", threshold=2, cooldown=0.1)
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError, match="failing 2 times"):
+        breaker.check()
+
+    time.sleep(0.15)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+
+
+def test_retry(settings, standin):
+    """Requests that find PubChem busy are retried."""
+    standin.inject(503, count=2)
+    result = convert("water", "name", "rdkit", settings=settings)
+    assert len(result["record"]["atno"]) == 3
+    assert counters.get("from_smiles_pubchem_retries_total") == 2
+
+
+def test_circuit_open(settings, standin):
+    """When PubChem keeps failing, it is skipped for the local resolvers."""
+    standin.inject(503, count=6)
+    only_pubchem = {**settings, "resolvers": ["PubChem name"]}
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="HTTP 503"):
+            convert("methanol", "name", "rdkit", settings=only_pubchem)
+
+    # The breaker is open, so the dictionary is used without asking PubChem
+    n_requests = standin.n_requests
+    result = convert("ethanol", "name", "rdkit", settings=settings)
+    assert standin.n_requests == n_requests
+    assert len(result["record"]["atno"]) == 9
+    assert counters.get("from_smiles_pubchem_circuit_open_total") == 1
+
+    # After the cool-down PubChem is tried again
+    time.sleep(0.25)
+    result = convert("ammonia", "name", "rdkit", settings=settings)
+    assert standin.n_requests == n_requests + 1
+    assert pubchem._breaker(settings).state == "closed"
+
+
+def test_circuit_shared(settings, standin, tmp_path):
+    """The breaker opens across the forked processes for a time limit."""
+    standin.inject(503, count=20)
+    shared = {
+        **settings,
+        "resolvers": ["PubChem name"],
+        "time limit": 30.0,
+        "pubchem cooldown": 60.0,
+        "pubchem rate file": str(tmp_path / "pubchem.bucket"),
+    }
+    n_requests = standin.n_requests
+    for name in ("methanol", "ethanol", "propane", "acetone", "benzene"):
+        with pytest.raises(RuntimeError):
+            convert(name, "name", "rdkit", settings=shared)
+    # Each of the first two names is tried 3 times, then PubChem is skipped
+    assert standin.n_requests - n_requests == 6
+    assert pubchem._breaker(shared).state == "open"
+    standin._injected.clear()
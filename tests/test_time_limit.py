@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the time limit on creating structures, and skipping failures."""
+
+from pathlib import Path
+import time
+
+import pytest
+
+from from_smiles_step import conversion
+from from_smiles_step.conversion import StructureTimeoutError, convert
+from from_smiles_step.metrics import counters
+from from_smiles_step.resolvers import Resolver, SMILESResolver
+from from_smiles_step.timing import timers
+
+
+class SlowResolver(Resolver):
+    """A resolver that never finishes."""
+
+    name = "slow"
+    notations = ("SMILES",)
+
+    def resolve(self, configuration, text, settings=None):
+        time.sleep(60)
+
+
+class BadResolver(Resolver):
+    """A resolver that fails."""
+
+    name = "bad"
+    notations = ("SMILES",)
+
+    def resolve(self, configuration, text, settings=None):
+        raise ValueError(f"Can't handle {text}")
+
+
+class CountingResolver(SMILESResolver):
+    """A resolver that counts and times its work, failing if asked to."""
+
+    def resolve(self, configuration, text, settings=None):
+        counters.add("test_attempts_total")
+        with timers("test stage"):
+            if text == "fail":
+                raise ValueError("Asked to fail")
+            return super().resolve(configuration, text, settings=settings)
+
+
+def test_time_limit():
+    """A resolver is stopped at the time limit, or gives its result or error."""
+    configuration = conversion.scratch_configuration()
+    with pytest.raises(StructureTimeoutError):
+        conversion.resolve_with_time_limit(SlowResolver(), configuration, "C", {}, 0.2)
+    with pytest.raises(ValueError, match="Can't handle C"):
+        conversion.resolve_with_time_limit(BadResolver(), configuration, "C", {}, 10)
+
+    result = conversion.resolve_with_time_limit(
+        SMILESResolver("rdkit"), configuration, "CCO", {}, 10
+    )
+    assert result == ("SMILES", "rdkit")
+    assert configuration.n_atoms == 9
+
+
+def test_next_resolver(monkeypatch):
+    """After a timeout, the next resolver in the chain is tried."""
+    monkeypatch.setattr(
+        conversion,
+        "resolver_chain",
+        lambda *args: [SlowResolver(), SMILESResolver("rdkit")],
+    )
+    start = time.time()
+    result = convert("CCO", "SMILES", "rdkit", settings={"time limit": 1.0})
+    assert time.time() - start < 10
+    assert result["flavor"] == "rdkit"
+    assert len(result["record"]["atno"]) == 9
+
+
+def test_skip_errors(from_smiles):
+    """With errors skipped, the failures are listed and the rest created."""
+    node, system_db = from_smiles
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "C\nC1CC\nCC"
+    P["notation"].value = "SMILES"
+    P["resolvers"].value = "rdkit"
+    P["errors"].value = "skip the structure"
+    P["structure handling"].value = "Create a new system and configuration"
+    P["subsequent structure handling"].value = "Create a new system and configuration"
+    node.run()
+
+    assert [s.name for s in system_db.systems] == ["C", "CC"]
+    lines = (Path(node.directory) / "failures.tsv").read_text().splitlines()
+    assert len(lines) == 2
+    assert lines[1].startswith("2\tC1CC\t")
+
+
+def test_timeout_not_cached(monkeypatch, tmp_path):
+    """A timeout is not kept in the failure cache, so a longer limit can work."""
+    from from_smiles_step.cache import FailureCache
+
+    monkeypatch.setattr(
+        conversion,
+        "resolver_chain",
+        lambda *args: [SlowResolver(), SMILESResolver("rdkit")],
+    )
+    settings = {
+        "time limit": 1.0,
+        "failure cache": str(tmp_path / "failures.db"),
+        "failure cache ttl": 7.0,
+    }
+    convert("CCO", "SMILES", "rdkit", settings=settings)
+    with FailureCache(settings["failure cache"]) as failures:
+        assert failures.failed("CCO") == {}
+
+
+def test_child_metrics():
+    """The times and counts in the child are merged into those of the parent."""
+    timers.clear()
+    counters.clear()
+    configuration = conversion.scratch_configuration()
+    resolver = CountingResolver("rdkit")
+    conversion.resolve_with_time_limit(resolver, configuration, "CCO", {}, 10)
+    with pytest.raises(ValueError, match="Asked to fail"):
+        conversion.resolve_with_time_limit(resolver, configuration, "fail", {}, 10)
+    assert counters.get("test_attempts_total") == 2
+    assert timers.statistics()["test stage"]["count"] == 2
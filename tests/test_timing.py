@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the timers of the stages of creating structures."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from from_smiles_step.timing import StageTimers
+
+
+def test_statistics():
+    """The statistics are within the width of the bins of the exact values."""
+    timers = StageTimers()
+    for i in range(1, 101):
+        timers.add("embedding", i / 1000)
+    timers.add("commit", 0.5)
+
+    statistics = timers.statistics()
+    data = statistics["embedding"]
+    assert data["count"] == 100
+    assert data["total"] == pytest.approx(5.05)
+    assert data["max"] == pytest.approx(0.1)
+    assert data["p50"] == pytest.approx(0.050, rel=0.02)
+    assert data["p95"] == pytest.approx(0.095, rel=0.02)
+    assert statistics["commit"]["p95"] == pytest.approx(0.5)
+
+    with timers("perception"):
+        pass
+    assert timers.statistics()["perception"]["count"] == 1
+    assert timers.table().splitlines()[2].startswith("embedding")
+
+
+def test_merge():
+    """Merging timers gives the same statistics as adding the times to one."""
+    one = StageTimers()
+    other = StageTimers()
+    both = StageTimers()
+    for i in range(1, 50):
+        (one if i % 3 == 0 else other).add("stage", i / 100)
+        both.add("stage", i / 100)
+    one.merge(other.state())
+    assert one.statistics() == both.statistics()
+
+
+def test_step(from_smiles):
+    """A batch in worker processes reports the stages in the workers and step."""
+    node, system_db = from_smiles
+    P = node.parameters
+    P["input type"].value = "one structure per line"
+    P["smiles string"].value = "CCO\nc1ccccc1\nCCN"
+    P["number of processes"].value = 2
+    node.run()
+
+    path = Path(node.directory) / "stage_times.json"
+    statistics = json.loads(path.read_text())
+    assert statistics["rdkit SMILES"]["count"] == 3
+    for stage in ("perception", "database write", "set names", "commit"):
+        assert stage in statistics